@@ -1,11 +1,24 @@
-from fastapi import APIRouter, HTTPException
-from backend.models.schemas import AnalysisRequest, ProductAnalysisResponse
-from backend.services.vision_engine import get_vision_service
+import logging
+from fastapi import APIRouter, HTTPException, Depends, Request
+from services.common.schemas import AnalysisRequest, ProductAnalysisResponse
+from services.vision.services.rate_limiter import ProviderOverloadedError
+from services.vision.services.vision_engine import IVisionService, get_vision_service
+from services.common.observability import stage
+from services.common.uploads import UPLOAD_REQUEST_BODY, receive_upload
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+def get_service(request: Request) -> IVisionService:
+    service = getattr(request.app.state, "vision_service", None)
+    if service is None:
+        # Running without the lifespan (e.g. TestClient outside a `with` block)
+        service = request.app.state.vision_service = get_vision_service(settings.LLM_PROVIDER, fallback=False)
+    return service
+
 @router.post("/analyze-product", response_model=ProductAnalysisResponse)
-async def analyze_product(request: AnalysisRequest):
+async def analyze_product(request: AnalysisRequest, service: IVisionService = Depends(get_service)):
     """
     Analyzes product images to extract visual measurements.
     """
@@ -15,10 +28,9 @@ async def analyze_product(request: AnalysisRequest):
     if not request.image_urls:
         raise HTTPException(status_code=400, detail="At least one image URL must be provided.")
     
-    print(f"Analyzing {len(request.image_urls)} URLs: {request.image_urls}")
+    logger.info("Analyzing image URLs", extra={"images": len(request.image_urls)})
 
     try:
-        service = get_vision_service()
         # Convert Pydantic HttpUrl to string for the service
         url_strings = [str(url) for url in request.image_urls]
         result = await service.analyze_images(url_strings)
@@ -27,47 +39,54 @@ async def analyze_product(request: AnalysisRequest):
         if request.product_id:
             result.product_id = request.product_id
             
-        print("Analysis successful")
         return result
+    except ProviderOverloadedError:
+        raise
     except Exception as e:
-        print(f"Analysis error: {e}")
+        logger.exception("Analysis error")
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
-from fastapi import UploadFile, File, Form
-from typing import List
-import base64
+from backend.core.config import settings
+from services.vision.models.image_payload import ImagePayload
 
-@router.post("/analyze/upload", response_model=ProductAnalysisResponse)
-async def analyze_product_upload(
-    files: List[UploadFile] = File(...),
-    product_id: str = Form(None)
-):
+@router.post("/analyze/upload", response_model=ProductAnalysisResponse, openapi_extra=UPLOAD_REQUEST_BODY)
+async def analyze_product_upload(request: Request, service: IVisionService = Depends(get_service)):
     """
     Analyzes uploaded product images.
     """
-    if not files:
-        raise HTTPException(status_code=400, detail="At least one image file must be uploaded.")
+    with stage("upload_read"):
+        files, product_id = await receive_upload(
+            request,
+            max_files=settings.UPLOAD_MAX_FILES,
+            max_file_bytes=settings.UPLOAD_MAX_FILE_BYTES,
+            max_request_bytes=settings.UPLOAD_MAX_REQUEST_BYTES,
+        )
 
-    image_urls = []
-    
     try:
+        if not files:
+            raise HTTPException(status_code=400, detail="At least one image file must be uploaded.")
+
+        images = []
         for file in files:
-            contents = await file.read()
+            contents = await file.read() # already spooled within the limits
             # Basic mime type inference or use file.content_type
-            mime_type = file.content_type or "image/jpeg" 
-            encoded_image = base64.b64encode(contents).decode("utf-8")
-            data_url = f"data:{mime_type};base64,{encoded_image}"
-            image_urls.append(data_url)
+            mime_type = file.content_type or "image/jpeg"
+            # Raw bytes; the provider encodes them once, when it builds its request
+            images.append(ImagePayload(data=contents, mime_type=mime_type))
         
-        print(f"Analyzing {len(image_urls)} uploaded images")
-        service = get_vision_service()
-        result = await service.analyze_images(image_urls)
+        logger.info("Analyzing uploaded images", extra={"images": len(images)})
+        result = await service.analyze_images(images)
         
         if product_id:
             result.product_id = product_id
             
         return result
 
+    except (HTTPException, ProviderOverloadedError):
+        raise
     except Exception as e:
-        print(f"Upload analysis error: {e}")
+        logger.exception("Upload analysis error")
         raise HTTPException(status_code=500, detail=f"Upload analysis failed: {str(e)}")
+    finally:
+        for file in files:
+            await file.close()
@@ -4,12 +4,17 @@ class Settings(BaseSettings):
     PROJECT_NAME: str = "AI-Powered Visual Product Measurement System"
     API_V1_STR: str = "/api/v1"
     CORS_ORIGINS: list[str] = ["*"] # Allow all for prototype simplicity
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json" # options: "json", "text"
 
-    # LLM Configuration
-    GROQ_API_KEY: str = ""
-    OPENAI_API_KEY: str = ""
+    # LLM Configuration (keys and provider tuning are read by the shared engine, services/vision/config.py)
     LLM_PROVIDER: str = "mock" # options: "mock", "groq", "openai"
 
+    # Upload Limits (checked while the body streams in, before it is fully read)
+    UPLOAD_MAX_FILES: int = 14
+    UPLOAD_MAX_FILE_BYTES: int = 10 * 1024 * 1024
+    UPLOAD_MAX_REQUEST_BYTES: int = 50 * 1024 * 1024
+
     class Config:
         env_file = ".env"
         case_sensitive = True
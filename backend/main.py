@@ -1,12 +1,29 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+import math
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from backend.core.config import settings
+from services.common.observability import ObservabilityMiddleware, configure_logging, metrics_response
 from backend.api import routes
+from services.vision.services.rate_limiter import ProviderOverloadedError
+from services.vision.services.vision_engine import get_vision_service
+
+configure_logging("backend", settings.LOG_LEVEL, settings.LOG_FORMAT)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One provider instance (and its HTTP client) for the lifetime of the app.
+    # No mock fallback: a missing key or a failing provider is an error here, not mock data.
+    app.state.vision_service = get_vision_service(settings.LLM_PROVIDER, fallback=False)
+    yield
+    await app.state.vision_service.aclose()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     description="Analyzes product images to output visual-only measurements.",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 # Set all CORS enabled origins
@@ -18,8 +35,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(ObservabilityMiddleware)
+
+@app.exception_handler(ProviderOverloadedError)
+async def provider_overloaded_handler(request: Request, exc: ProviderOverloadedError):
+    # The provider's quota is used up; a retry later will do, so this is not a 500
+    headers = {}
+    if exc.retry_after is not None:
+        headers["Retry-After"] = str(max(1, math.ceil(exc.retry_after)))
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers=headers)
+
 app.include_router(routes.router, prefix=settings.API_V1_STR)
 
+@app.get("/metrics")
+def metrics(request: Request):
+    return metrics_response(request.headers.get("accept"))
+
 @app.get("/")
 def root():
     return {"message": "Welcome to the Visual Product Measurement System API"}
@@ -1,3 +1,4 @@
+import pytest
 from fastapi.testclient import TestClient
 from backend.main import app
 
@@ -41,3 +42,66 @@ def test_analyze_product_invalid_url():
     }
     response = client.post("/api/v1/analyze-product", json=payload)
     assert response.status_code == 422 # Pydantic validation error
+
+def test_groq_without_a_key_fails_instead_of_mocking(monkeypatch):
+    from backend.core.config import settings
+    from services.vision.services import vision_engine
+
+    monkeypatch.setattr(settings, "LLM_PROVIDER", "groq")
+    monkeypatch.setattr(vision_engine.settings, "GROQ_API_KEY", "")
+    with pytest.raises(ValueError, match="GROQ_API_KEY"):
+        with TestClient(app):
+            pass
+
+def test_groq_errors_are_not_answered_with_mock_data(monkeypatch):
+    from services.vision.services.vision_engine import GroqVisionService
+
+    # Nothing listens on the discard port, so every provider call fails
+    service = GroqVisionService(api_key="test-key", base_url="http://127.0.0.1:9", fallback=False)
+    monkeypatch.setattr(app.state, "vision_service", service, raising=False)
+    response = client.post("/api/v1/analyze-product", json={"image_urls": ["http://example.com/image1.jpg"]})
+    assert response.status_code == 500
+    assert response.json()["detail"].startswith("Analysis failed")
+
+def test_analyze_upload_passes_raw_bytes_to_the_engine(monkeypatch):
+    from services.vision.models.image_payload import ImagePayload
+    from services.vision.services.vision_engine import MockVisionService
+
+    received = []
+
+    class RecordingService(MockVisionService):
+        async def analyze_images(self, image_urls):
+            received.extend(image_urls)
+            return await super().analyze_images(image_urls)
+
+    monkeypatch.setattr(app.state, "vision_service", RecordingService(latency_ms=0, latency_jitter_ms=0), raising=False)
+    files = [("files", ("a.png", b"\x89PNG-a", "image/png"))]
+    response = client.post("/api/v1/analyze/upload", files=files, data={"product_id": "sku-1"})
+    assert response.status_code == 200
+    assert response.json()["product_id"] == "sku-1"
+    assert received == [ImagePayload(data=b"\x89PNG-a", mime_type="image/png")]
+
+def test_analyze_upload_rejects_an_oversized_file_while_streaming(monkeypatch):
+    from backend.core.config import settings
+
+    monkeypatch.setattr(settings, "UPLOAD_MAX_FILE_BYTES", 1024)
+    files = [("files", ("big.jpg", b"x" * 2048, "image/jpeg"))]
+    response = client.post("/api/v1/analyze/upload", files=files)
+    assert response.status_code == 413
+    assert "big.jpg" in response.json()["detail"]
+
+def test_provider_overload_is_a_503_with_retry_after(monkeypatch):
+    from services.vision.services.rate_limiter import ProviderOverloadedError
+    from services.vision.services.vision_engine import MockVisionService
+
+    class OverloadedService(MockVisionService):
+        async def analyze_images(self, image_urls):
+            raise ProviderOverloadedError("Provider rate limit reached", retry_after=2.5)
+
+    monkeypatch.setattr(app.state, "vision_service", OverloadedService(), raising=False)
+    response = client.post("/api/v1/analyze-product", json={"image_urls": ["http://example.com/image1.jpg"]})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "3"
+
+    files = [("files", ("a.jpg", b"\xff\xd8a", "image/jpeg"))]
+    assert client.post("/api/v1/analyze/upload", files=files).status_code == 503
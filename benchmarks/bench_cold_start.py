@@ -0,0 +1,134 @@
+"""
+Cold start of each service: how long importing its app module takes in a fresh
+interpreter, and how long a freshly spawned uvicorn process takes to answer its
+first request (process start, imports, lifespan startup and the request itself).
+Also lists which optional heavy SDKs the import pulled in.
+
+Usage:
+    python -m benchmarks.bench_cold_start --runs 5 --out cold_start.json
+    LLM_PROVIDER=groq python -m benchmarks.bench_cold_start --services vision
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.load_test import REPO_ROOT
+
+# app module, port, first request (method, path, JSON body)
+SERVICES = {
+    "vision": ("services.vision.main:app", 18301, ("POST", "/process", {"image_urls": ["http://example.com/cold.jpg"]})),
+    "gateway": ("services.gateway.main:app", 18302, ("GET", "/", None)),
+    "backend": ("backend.main:app", 18303, ("POST", "/api/v1/analyze-product", {"image_urls": ["http://example.com/cold.jpg"]})),
+}
+HEAVY_MODULES = ["groq", "numpy", "PIL", "prometheus_client", "pyarrow"]
+
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def run_python(code: str, env: Dict[str, str]) -> str:
+    return subprocess.check_output([sys.executable, "-c", code], cwd=REPO_ROOT, env=env, text=True)
+
+def import_time(module: str, env: Dict[str, str]) -> Dict:
+    return json.loads(run_python(IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES), env).strip().splitlines()[-1])
+
+def time_to_first_response(app: str, port: int, request, env: Dict[str, str], timeout: float = 60.0) -> float:
+    method, path, body = request
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--port", str(port), "--log-level", "warning"],
+        cwd=REPO_ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(timeout=5.0) as client:
+            while time.perf_counter() - started < timeout:
+                if process.poll() is not None:
+                    raise RuntimeError(f"{app} exited with code {process.returncode}")
+                try:
+                    resp = client.request(method, f"http://127.0.0.1:{port}{path}", json=body)
+                    if resp.status_code == 200:
+                        return time.perf_counter() - started
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.005)
+        raise RuntimeError(f"{app} did not answer within {timeout}s")
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def summarize(samples: List[float]) -> Dict:
+    return {
+        "median_ms": round(statistics.median(samples) * 1000, 1),
+        "min_ms": round(min(samples) * 1000, 1),
+        "max_ms": round(max(samples) * 1000, 1),
+    }
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", nargs="+", choices=list(SERVICES), default=list(SERVICES))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--out", help="Write the results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    # Quiet, stateless services, so every run starts from the same (empty) state
+    env = {
+        **os.environ,
+        "LOG_LEVEL": "WARNING",
+        "RESULT_CACHE_BACKEND": os.environ.get("RESULT_CACHE_BACKEND", "memory"),
+        "RESULTS_STORE_DIR": "",
+        "DEDUP_INDEX_PATH": "",
+        "IMAGE_CACHE_DIR": "",
+        "JOB_QUEUE_PATH": ":memory:",
+    }
+    started = time.perf_counter()
+    for _ in range(args.runs):
+        run_python("pass", env)
+    interpreter = (time.perf_counter() - started) / args.runs
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "llm_provider": env.get("LLM_PROVIDER", "mock"),
+        "interpreter_start_ms": round(interpreter * 1000, 1),
+        "services": {},
+    }
+    for name in args.services:
+        app, port, request = SERVICES[name]
+        imports = [import_time(app.split(":")[0], env) for _ in range(args.runs)]
+        first = [time_to_first_response(app, port, request, env) for _ in range(args.runs)]
+        report["services"][name] = {
+            "import": summarize([sample["seconds"] for sample in imports]),
+            "heavy_modules_loaded": imports[0]["loaded"],
+            "time_to_first_response": summarize(first),
+        }
+        print(
+            f'{name:>8}  import {report["services"][name]["import"]["median_ms"]:>7} ms  '
+            f'first response {report["services"][name]["time_to_first_response"]["median_ms"]:>7} ms  '
+            f'loaded: {", ".join(imports[0]["loaded"]) or "-"}'
+        )
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
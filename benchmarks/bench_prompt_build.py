@@ -0,0 +1,127 @@
+"""
+CPU spent building and sending a provider request, up to the HTTP transport: the
+previous path (message dicts rebuilt per call, uploads turned into data: URL strings,
+the SDK's chat.completions.create serializing everything) versus prompt templates
+(static prefix serialized once, image parts spliced in, body posted as bytes).
+
+The Groq client talks to an in-process httpx.MockTransport, so no network time is
+included; the answer is parsed the same way in both paths.
+
+Usage:
+    python -m benchmarks.bench_prompt_build --requests 500 --out prompt_build.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+from groq import AsyncGroq
+
+from services.vision.models.image_payload import ImagePayload, ImageSource, image_url
+from services.vision.services.prompt_manager import PromptManager, USER_PROMPT
+from services.vision.services.prompt_templates import batch_request, get_template
+
+MODEL = "llama-3.2-11b-vision-preview"
+COMPLETION = json.dumps({
+    "id": "bench", "object": "chat.completion", "created": 0, "model": MODEL,
+    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "{}"}}],
+    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+}).encode()
+
+def answer(request: httpx.Request) -> httpx.Response:
+    request.read()
+    return httpx.Response(200, content=COMPLETION, headers={"Content-Type": "application/json"})
+
+def sdk_messages(system_prompt: str, products: Dict[str, List[ImageSource]]) -> list:
+    # The message construction templates replaced
+    if len(products) == 1:
+        content = [{"type": "text", "text": USER_PROMPT}]
+        content += [{"type": "image_url", "image_url": {"url": image_url(image)}} for image in next(iter(products.values()))]
+    else:
+        content = [{"type": "text", "text": f"Analyze each of these products ({', '.join(products)}) and extract the visual measurements."}]
+        for key, images in products.items():
+            content.append({"type": "text", "text": f"Product {key}:"})
+            content += [{"type": "image_url", "image_url": {"url": image_url(image)}} for image in images]
+    return [{"role": "system", "content": system_prompt}, {"role": "user", "content": content}]
+
+async def via_sdk(client: AsyncGroq, products: Dict[str, List[ImageSource]]) -> str:
+    system_prompt = PromptManager.construct_system_prompt() if len(products) == 1 else PromptManager.construct_batch_system_prompt()
+    response = await client.chat.completions.create(
+        model=MODEL,
+        messages=sdk_messages(system_prompt, products),
+        temperature=0.1,
+        max_tokens=1024 * len(products),
+        response_format={"type": "json_object"},
+    )
+    return response.choices[0].message.content
+
+async def via_template(client: AsyncGroq, products: Dict[str, List[ImageSource]]) -> str:
+    if len(products) == 1:
+        request = get_template("single", MODEL).request(next(iter(products.values())))
+    else:
+        request = batch_request(MODEL, products)
+    resp = await client.post(
+        "/openai/v1/chat/completions",
+        cast_to=httpx.Response,
+        content=request.body(1024 * len(products)),
+        options={"headers": {"Content-Type": "application/json"}},
+    )
+    return resp.json()["choices"][0]["message"]["content"]
+
+async def measure(build, client: AsyncGroq, products: Dict[str, List[ImageSource]], requests: int) -> Dict:
+    for _ in range(min(requests, 20)): # warm-up
+        await build(client, products)
+    cpu, wall = time.process_time(), time.perf_counter()
+    for _ in range(requests):
+        await build(client, products)
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+    return {"cpu_us_per_request": round(cpu / requests * 1e6, 1), "wall_us_per_request": round(wall / requests * 1e6, 1)}
+
+def scenarios(upload_bytes: int) -> Dict[str, Dict[str, List[ImageSource]]]:
+    urls = [f"https://cdn.example.com/products/{i}.jpg" for i in range(3)]
+    uploads = [ImagePayload(os.urandom(upload_bytes)) for _ in range(3)]
+    return {
+        "single_urls": {"p0": urls},
+        "single_uploads": {"p0": uploads},
+        "batch_4x3_urls": {f"p{i}": [f"{url}?v={i}" for url in urls] for i in range(4)},
+    }
+
+async def main(args: argparse.Namespace) -> int:
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(answer))
+    client = AsyncGroq(api_key="bench", base_url="http://provider.test", http_client=http_client, max_retries=0)
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "scenarios": {},
+    }
+    for name, products in scenarios(args.upload_bytes).items():
+        sdk = await measure(via_sdk, client, products, args.requests)
+        template = await measure(via_template, client, products, args.requests)
+        saved = 1 - template["cpu_us_per_request"] / sdk["cpu_us_per_request"]
+        report["scenarios"][name] = {"sdk": sdk, "template": template, "cpu_saved": round(saved, 3)}
+        print(
+            f'{name:<16} sdk {sdk["cpu_us_per_request"]:>9} us  template {template["cpu_us_per_request"]:>9} us  '
+            f"cpu saved {saved:.0%}"
+        )
+    await client.close()
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500, help="Requests per path and scenario")
+    parser.add_argument("--upload-bytes", type=int, default=200_000, help="Size of each uploaded image")
+    parser.add_argument("--out", help="Write the results as JSON to this path")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -0,0 +1,95 @@
+"""
+Throughput and success rate of parsing LLM answers: the old strict
+ProductAnalysisResponse.model_validate_json versus ResponseParser (fast path, repair,
+schema-guided coercion). Field retries are not exercised; answers the parser cannot
+fix alone are counted as failed, with their invalid fields reported per kind.
+
+The default corpus (benchmarks/data/llm_outputs.jsonl) mixes clean answers with the
+faults seen from vision models: fences, prose, trailing commas, Python literals,
+out-of-range scores, stringly-typed values, flattened sections, truncation and
+refusals. Point --corpus at a JSONL of recorded answers ({"content": ...} per line,
+optional "kind") to measure a real mix.
+
+Usage:
+    python -m benchmarks.bench_response_parser --repeat 50 --out parser.json
+"""
+import argparse
+import json
+import statistics
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from services.common.schemas import ProductAnalysisResponse
+from services.vision.services.response_parser import ResponseParser
+
+DEFAULT_CORPUS = Path(__file__).parent / "data" / "llm_outputs.jsonl"
+
+def load_corpus(path: str) -> list:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def strict_parse(content: str) -> bool:
+    try:
+        ProductAnalysisResponse.model_validate_json(content)
+        return True
+    except ValueError:
+        return False
+
+def run(corpus: list, repeat: int, parse) -> dict:
+    timings = []
+    ok = 0
+    for _ in range(repeat):
+        for record in corpus:
+            started = time.perf_counter()
+            if parse(record["content"]):
+                ok += 1
+            timings.append(time.perf_counter() - started)
+    timings.sort()
+    total = sum(timings)
+    return {
+        "parses": len(timings),
+        "success_rate": round(ok / len(timings), 4),
+        "parses_per_second": round(len(timings) / total),
+        "mean_us": round(statistics.fmean(timings) * 1e6, 1),
+        "p50_us": round(timings[len(timings) // 2] * 1e6, 1),
+        "p99_us": round(timings[int(len(timings) * 0.99)] * 1e6, 1),
+    }
+
+def by_kind(corpus: list) -> dict:
+    parser = ResponseParser()
+    kinds = defaultdict(Counter)
+    for record in corpus:
+        result = parser.parse(record["content"])
+        kind = record.get("kind", "recorded")
+        kinds[kind]["strict_ok" if strict_parse(record["content"]) else "strict_failed"] += 1
+        kinds[kind]["parser_ok" if result.ok else "parser_failed"] += 1
+        for field in result.invalid_fields:
+            kinds[kind][f"invalid:{field}"] += 1
+    return {kind: dict(counts) for kind, counts in kinds.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=str(DEFAULT_CORPUS))
+    parser.add_argument("--repeat", type=int, default=50, help="Passes over the corpus per variant")
+    parser.add_argument("--out", help="Write the results as JSON to this path")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    response_parser = ResponseParser()
+    run(corpus, 2, strict_parse) # warm-up
+    results = {
+        "corpus": args.corpus,
+        "answers": len(corpus),
+        "strict": run(corpus, args.repeat, strict_parse),
+        "response_parser": run(corpus, args.repeat, lambda content: response_parser.parse(content).ok),
+        "by_kind": by_kind(corpus),
+    }
+
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Throughput of the gateway -> vision path as vision workers are added. For each worker
+count, starts `services.vision.run_workers` (mock provider burning MOCK_CPU_MS of CPU
+per analysis, on top of MOCK_LATENCY_MS of waiting) and a gateway pointed at all the
+workers, drives it closed-loop, and reports throughput, latency and how evenly the
+gateway's upstream pool spread requests over the workers.
+
+CPU-bound work only scales with real cores: on an N-core machine throughput should
+grow near-linearly up to N workers and flatten after.
+
+Usage:
+    python -m benchmarks.bench_scaling --workers 1 2 4 --mock-cpu-ms 20 --concurrency 32 --out scaling.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.load_test import REPO_ROOT, Driver, ServiceProcess, run_scenario
+
+class WorkerGroup:
+    def __init__(self, workers: int, port: int, env: Dict[str, str]):
+        self.ports = [port + i for i in range(workers)]
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "services.vision.run_workers", "--workers", str(workers), "--port", str(port)],
+            cwd=REPO_ROOT,
+            env={**os.environ, **env},
+            stdout=subprocess.DEVNULL,
+        )
+
+    async def wait_ready(self, timeout: float = 60.0):
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient() as client:
+            for port in self.ports:
+                while True:
+                    if self.process.poll() is not None:
+                        raise RuntimeError(f"run_workers exited with code {self.process.returncode}")
+                    try:
+                        if (await client.get(f"http://127.0.0.1:{port}/health")).status_code == 200:
+                            break
+                    except httpx.TransportError:
+                        pass
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"vision worker on port {port} did not become ready")
+                    await asyncio.sleep(0.1)
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+async def measure(workers: int, args: argparse.Namespace, state_dir: str) -> Dict:
+    env = {
+        "LLM_PROVIDER": "mock",
+        "MOCK_CPU_MS": str(args.mock_cpu_ms),
+        "MOCK_LATENCY_MS": str(args.mock_latency_ms),
+        "MOCK_LATENCY_JITTER_MS": "0",
+        "WORKER_DRAIN_SECONDS": "0",
+        "LOG_LEVEL": "WARNING",
+        # Fresh shared state per run, so no run starts with the previous one's cache hits
+        "RESULT_CACHE_PATH": os.path.join(state_dir, f"cache-{workers}.sqlite3"),
+        "JOB_QUEUE_PATH": os.path.join(state_dir, f"jobs-{workers}.sqlite3"),
+        "DEDUP_INDEX_PATH": os.path.join(state_dir, f"dedup-{workers}.sqlite3"),
+        "RESULTS_STORE_DIR": os.path.join(state_dir, f"results-{workers}"),
+        "IMAGE_CACHE_DIR": "",
+    }
+    group = WorkerGroup(workers, args.vision_port, env)
+    gateway = None
+    try:
+        await group.wait_ready()
+        gateway = ServiceProcess(
+            "gateway", "services.gateway.main:app", args.gateway_port,
+            {
+                "VISION_SERVICE_URLS": ",".join(f"http://127.0.0.1:{port}" for port in group.ports),
+                "LOG_LEVEL": "WARNING",
+            },
+        )
+        await gateway.wait_ready("/")
+
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{args.gateway_port}", limits=limits, timeout=120.0
+        ) as client:
+            driver = Driver(client, "json", b"", cache_hit_ratio=0.0)
+            await run_scenario(driver, "concurrency", args.concurrency, args.warmup, args.concurrency)
+            before = {u["url"]: u["requests"] for u in (await client.get("/stats")).json()["upstreams"]}
+            result = await run_scenario(driver, "concurrency", args.concurrency, args.duration, args.concurrency)
+            after = (await client.get("/stats")).json()["upstreams"]
+    finally:
+        if gateway is not None:
+            gateway.stop()
+        group.stop()
+
+    per_worker = [u["requests"] - before.get(u["url"], 0) for u in after]
+    return {
+        "workers": workers,
+        **{key: result[key] for key in ("completed", "errors", "throughput_rps", "latency_ms")},
+        "requests_per_worker": per_worker,
+        "balance": round(min(per_worker) / max(per_worker), 3) if max(per_worker) else None,
+    }
+
+async def main(args: argparse.Namespace) -> int:
+    runs: List[Dict] = []
+    with tempfile.TemporaryDirectory() as state_dir:
+        for workers in args.workers:
+            run = await measure(workers, args, state_dir)
+            run["speedup"] = round(run["throughput_rps"] / runs[0]["throughput_rps"], 2) if runs else 1.0
+            runs.append(run)
+            print(
+                f'workers={workers:<3} {run["throughput_rps"]:>8} rps  speedup={run["speedup"]}  '
+                f'p50={run["latency_ms"]["p50"]}ms p95={run["latency_ms"]["p95"]}ms  '
+                f'per worker={run["requests_per_worker"]} errors={sum(run["errors"].values())}'
+            )
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": vars(args),
+        "runs": runs,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--mock-cpu-ms", type=float, default=20.0, help="CPU burned per analysis by the mock")
+    parser.add_argument("--mock-latency-ms", type=float, default=0.0, help="Simulated provider wait per analysis")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per worker count")
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--gateway-port", type=int, default=18100)
+    parser.add_argument("--vision-port", type=int, default=18101)
+    parser.add_argument("--out", help="Write the results as JSON to this path")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
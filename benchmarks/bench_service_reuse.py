@@ -0,0 +1,83 @@
+"""
+Per-request overhead of building the vision pipeline on every call (the old
+get_vision_service()-per-handler behaviour) versus reusing the instance built in the
+app lifespan. Runs in-process against the Vision Service app with the mock provider.
+
+Usage:
+    LLM_PROVIDER=mock python -m benchmarks.bench_service_reuse --requests 2000 --out reuse.json
+
+Set GROQ_API_KEY (any value, no calls are made) to include the real cost of
+constructing a GroqVisionService and its AsyncGroq client in "construction_us".
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+from services.vision.main import app, get_pipeline
+from services.vision.services.pipeline import build_pipeline
+from services.vision.services.vision_engine import GroqVisionService, MockVisionService
+
+async def drive(requests: int) -> list:
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://vision") as client:
+        for i in range(requests):
+            # Distinct URLs so the result cache never short-circuits the call
+            payload = {"image_urls": [f"http://example.com/{i}.jpg"], "product_id": str(i)}
+            started = time.perf_counter()
+            resp = await client.post("/process", json=payload)
+            latencies.append(time.perf_counter() - started)
+            resp.raise_for_status()
+    return latencies
+
+def summarize(latencies: list) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "mean_us": round(statistics.fmean(ordered) * 1e6, 1),
+        "p50_us": round(ordered[len(ordered) // 2] * 1e6, 1),
+        "p95_us": round(ordered[int(len(ordered) * 0.95)] * 1e6, 1),
+    }
+
+def construction_cost(factory, iterations: int = 200) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        factory()
+    return round((time.perf_counter() - started) / iterations * 1e6, 1)
+
+async def main(args: argparse.Namespace):
+    results = {}
+
+    # Before: a fresh pipeline (provider + stages) for every request
+    app.dependency_overrides[get_pipeline] = build_pipeline
+    await drive(50) # warm-up
+    results["per_request"] = summarize(await drive(args.requests))
+
+    # After: one pipeline for the app's lifetime
+    app.dependency_overrides.clear()
+    app.state.pipeline = build_pipeline()
+    await drive(50)
+    results["reused"] = summarize(await drive(args.requests))
+    await app.state.pipeline.aclose()
+
+    results["overhead_saved_us"] = round(results["per_request"]["mean_us"] - results["reused"]["mean_us"], 1)
+    results["construction_us"] = {
+        "MockVisionService": construction_cost(MockVisionService),
+        "GroqVisionService": construction_cost(GroqVisionService),
+        "pipeline": construction_cost(build_pipeline),
+    }
+
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--out", help="Write results as JSON to this file")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,116 @@
+"""
+k-NN latency over the results store at catalog scale: the exact numpy scan versus the
+grid index, unfiltered and with discrete-attribute filters. The store is filled with
+synthetic products whose scores are clustered (as real catalogs are: many similar
+frames, few outliers), and each query uses a stored product as its target.
+
+Usage:
+    python -m benchmarks.bench_similarity --products 1000000 --queries 200 --out similarity.json
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from services.common.schemas import (
+    ContinuousDimensions,
+    DiscreteAttributes,
+    ProductAnalysisResponse,
+    ResultQuery,
+    VisualMetadata,
+)
+from services.vision.services.results_store import DIMENSIONS, ResultsStore
+from services.vision.services.similarity import SimilarityIndex
+
+SHAPES = ["Round", "Oval", "Square", "Rectangle", "Cat-Eye", "Aviator", "Geometric"]
+COLORS = ["Black", "Gold", "Silver", "Tortoise", "Clear", "Red", "Blue", "Brown"]
+
+def fill(store: ResultsStore, count: int, seed: int, chunk: int = 50000):
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(-4, 4, size=(64, len(DIMENSIONS)))
+    for start in range(0, count, chunk):
+        size = min(chunk, count - start)
+        dims = np.clip(centers[rng.integers(0, len(centers), size)] + rng.normal(0, 0.6, (size, len(DIMENSIONS))), -5, 5)
+        shapes = rng.integers(0, len(SHAPES), size)
+        colors = rng.integers(0, len(COLORS), (size, 2))
+        flags = rng.random((size, 4)) < (0.1, 0.2, 0.05, 0.05)
+        store.append(
+            ProductAnalysisResponse.model_construct(
+                product_id=f"sku-{start + i}",
+                continuous_dimensions=ContinuousDimensions.model_construct(**dict(zip(DIMENSIONS, dims[i].round(2).tolist()))),
+                discrete_attributes=DiscreteAttributes.model_construct(
+                    has_wirecore=bool(flags[i, 0]),
+                    is_transparent=bool(flags[i, 1]),
+                    dominant_colors=sorted({COLORS[c] for c in colors[i]}),
+                    frame_shape=SHAPES[shapes[i]],
+                    texture_pattern=None,
+                    looks_like_kids_product=bool(flags[i, 2]),
+                ),
+                metadata=VisualMetadata.model_construct(
+                    image_quality_notes=None, is_occluded_or_ambiguous=bool(flags[i, 3]), confidence_score=0.9
+                ),
+            )
+            for i in range(size)
+        )
+
+def measure(index: SimilarityIndex, targets: list, k: int, query: ResultQuery) -> dict:
+    timings = []
+    for product_id in targets:
+        target = index.target_of(product_id)
+        started = time.perf_counter()
+        index.search(target, k, query, exclude_product_id=product_id)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {
+        "queries": len(timings),
+        "p50_ms": round(timings[len(timings) // 2] * 1000, 2),
+        "p99_ms": round(timings[int(len(timings) * 0.99)] * 1000, 2),
+        "mean_ms": round(sum(timings) / len(timings) * 1000, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--cell-width", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Write the results as JSON to this path")
+    args = parser.parse_args()
+
+    store = ResultsStore(initial_capacity=args.products)
+    started = time.perf_counter()
+    fill(store, args.products, args.seed)
+    fill_seconds = time.perf_counter() - started
+
+    rng = np.random.default_rng(args.seed + 1)
+    targets = [f"sku-{i}" for i in rng.integers(0, args.products, args.queries)]
+    exact = SimilarityIndex(store, exact_threshold=args.products + 1)
+    grid = SimilarityIndex(store, cell_width=args.cell_width, exact_threshold=50000)
+
+    started = time.perf_counter()
+    grid.search(grid.target_of(targets[0]), args.k, ResultQuery()) # builds the grid
+    build_seconds = time.perf_counter() - started
+
+    queries = {
+        "unfiltered": ResultQuery(),
+        "frame_shape": ResultQuery(frame_shape=["Round"]),
+        "shape_and_color": ResultQuery(frame_shape=["Round", "Oval"], color=["Black"], is_transparent=False),
+    }
+    report = {
+        "products": args.products,
+        "k": args.k,
+        "fill_seconds": round(fill_seconds, 1),
+        "grid_build_seconds": round(build_seconds, 2),
+        "exact": {name: measure(exact, targets, args.k, query) for name, query in queries.items()},
+        "grid": {name: measure(grid, targets, args.k, query) for name, query in queries.items()},
+        "grid_stats": grid.snapshot(),
+    }
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Speed of the synthetic data behind load and capacity tests: the mock provider per
+call, bulk generation of analyses (as columns and as ProductAnalysisResponse
+objects), and how fast the results store ingests and flushes what is generated.
+
+Usage:
+    python -m benchmarks.bench_synthetic --products 1000000 --out synthetic.json
+"""
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import tempfile
+import time
+
+from services.vision.services.results_store import ResultsStore
+from services.vision.services.synthetic import key_digest, synthetic_columns, synthetic_results
+from services.vision.services.vision_engine import MockVisionService
+
+def per_minute(count: int, seconds: float) -> int:
+    return round(count / seconds * 60)
+
+async def mock_calls(calls: int) -> float:
+    mock = MockVisionService(latency_ms=0, latency_jitter_ms=0, cpu_ms=0)
+    started = time.perf_counter()
+    for i in range(calls):
+        await mock.analyze_images([f"https://cdn.example.com/{i}.jpg"])
+    return time.perf_counter() - started
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--chunk", type=int, default=100_000, help="Products generated and appended per call")
+    parser.add_argument("--mock-calls", type=int, default=50_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Write the results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    product_ids = [f"sku-{i}" for i in range(args.products)]
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+    }
+
+    seconds = asyncio.run(mock_calls(args.mock_calls))
+    report["mock_calls_per_minute"] = per_minute(args.mock_calls, seconds)
+
+    started = time.perf_counter()
+    for start in range(0, args.products, args.chunk):
+        synthetic_columns([key_digest(product_id, args.seed) for product_id in product_ids[start:start + args.chunk]])
+    report["columns_per_minute"] = per_minute(args.products, time.perf_counter() - started)
+
+    generate = append = 0.0
+    with tempfile.TemporaryDirectory() as directory:
+        store = ResultsStore(directory, initial_capacity=args.products)
+        for start in range(0, args.products, args.chunk):
+            began = time.perf_counter()
+            results = synthetic_results(product_ids[start:start + args.chunk], seed=args.seed)
+            generated = time.perf_counter()
+            store.append(results)
+            append += time.perf_counter() - generated
+            generate += generated - began
+        began = time.perf_counter()
+        store.flush()
+        flush = time.perf_counter() - began
+    report["responses_per_minute"] = per_minute(args.products, generate)
+    report["store_append_per_minute"] = per_minute(args.products, append)
+    report["store_flush_seconds"] = round(flush, 3)
+
+    for key, value in report.items():
+        if key not in ("timestamp", "python", "platform", "config"):
+            print(f"{key:<26} {value:>12,}" if isinstance(value, int) else f"{key:<26} {value:>12}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,332 @@
+"""
+Load test for the gateway -> vision service path.
+
+Starts both services locally (mock provider by default, optionally with simulated
+provider latency, errors and 429s), drives the JSON and upload endpoints at fixed request rates
+(open loop) and fixed concurrency levels (closed loop), and writes p50/p95/p99
+latency, throughput and per-process RSS to a JSON file.
+
+Usage:
+    python -m benchmarks.load_test --out load.json
+    python -m benchmarks.load_test --mock-latency-ms 800 --rps 10 50 --concurrency 8 32 --duration 20
+    python -m benchmarks.load_test --mock-latency-ms 800 --mock-latency-distribution lognormal --mock-rate-limit-rate 0.05
+    python -m benchmarks.load_test --out new.json --baseline load.json   # exit 1 on regression
+
+Pass --no-spawn to benchmark services that are already running.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+def rss_bytes(pid: int) -> Optional[int]:
+    """
+    Resident set size of a process, via psutil when installed, else /proc (Linux).
+    """
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except ImportError:
+        pass
+    except Exception:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+class ServiceProcess:
+    def __init__(self, name: str, app: str, port: int, env: Dict[str, str]):
+        self.name = name
+        self.port = port
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", app, "--port", str(port), "--log-level", "warning"],
+            cwd=REPO_ROOT,
+            env={**os.environ, **env},
+        )
+
+    async def wait_ready(self, path: str, timeout: float = 30.0):
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient() as client:
+            while time.monotonic() < deadline:
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"{self.name} exited with code {self.process.returncode}")
+                try:
+                    if (await client.get(f"http://127.0.0.1:{self.port}{path}")).status_code == 200:
+                        return
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.1)
+        raise RuntimeError(f"{self.name} did not become ready on port {self.port}")
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+class RssSampler:
+    """
+    Samples RSS of the service processes in the background; keeps peak and last value.
+    """
+    def __init__(self, pids: Dict[str, int], interval: float = 0.25):
+        self.pids = pids
+        self.interval = interval
+        self.peak: Dict[str, int] = {}
+        self.last: Dict[str, int] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            for name, pid in self.pids.items():
+                rss = rss_bytes(pid)
+                if rss is not None:
+                    self.last[name] = rss
+                    self.peak[name] = max(self.peak.get(name, 0), rss)
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self):
+        self.task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self.task.cancel()
+
+    def report(self) -> Dict:
+        return {
+            name: {"peak_mb": round(self.peak[name] / 2**20, 1), "last_mb": round(self.last[name] / 2**20, 1)}
+            for name in self.peak
+        }
+
+def make_upload_image(size_bytes: int) -> bytes:
+    try:
+        from PIL import Image
+        out = io.BytesIO()
+        # Noise does not compress, so the JPEG size tracks the pixel count
+        side = max(16, int((size_bytes / 1.5) ** 0.5))
+        Image.effect_noise((side, side), 64).convert("RGB").save(out, format="JPEG", quality=90)
+        return out.getvalue()
+    except ImportError:
+        return b"\xff\xd8\xff\xe0" + os.urandom(size_bytes)
+
+class Driver:
+    def __init__(self, client: httpx.AsyncClient, endpoint: str, upload: bytes, cache_hit_ratio: float):
+        self.client = client
+        self.endpoint = endpoint
+        self.upload = upload
+        self.cache_hit_ratio = cache_hit_ratio
+        self.sequence = 0
+
+    async def one(self) -> float:
+        """
+        Sends one request; returns its latency, raising on a non-2xx status.
+        """
+        self.sequence += 1
+        n = self.sequence
+        # A fraction of requests reuse a hot product so the result cache is exercised realistically
+        key = 0 if self.cache_hit_ratio and (n % 100) < self.cache_hit_ratio * 100 else n
+        started = time.perf_counter()
+        if self.endpoint == "json":
+            resp = await self.client.post(
+                "/api/v1/analyze-product",
+                json={"image_urls": [f"http://example.com/load/{key}.jpg"], "product_id": str(n)},
+            )
+        else:
+            resp = await self.client.post(
+                "/api/v1/analyze/upload",
+                files=[("files", (f"{key}.jpg", self.upload if key == 0 else self.upload + str(n).encode(), "image/jpeg"))],
+                data={"product_id": str(n)},
+            )
+        resp.raise_for_status()
+        return time.perf_counter() - started
+
+async def run_scenario(driver: Driver, mode: str, level: float, duration: float, max_in_flight: int) -> Dict:
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+
+    async def attempt():
+        try:
+            latencies.append(await driver.one())
+        except Exception as e:
+            name = f"HTTP {e.response.status_code}" if isinstance(e, httpx.HTTPStatusError) else type(e).__name__
+            errors[name] = errors.get(name, 0) + 1
+
+    started = time.perf_counter()
+    end = started + duration
+    if mode == "rps":
+        # Open loop: requests are issued on schedule whether or not earlier ones finished
+        interval = 1.0 / level
+        in_flight = asyncio.Semaphore(max_in_flight)
+        tasks = []
+        next_send = started
+        while next_send < end:
+            await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+            if in_flight.locked():
+                errors["client_saturated"] = errors.get("client_saturated", 0) + 1
+            else:
+                async def bounded():
+                    async with in_flight:
+                        await attempt()
+                tasks.append(asyncio.create_task(bounded()))
+            next_send += interval
+        await asyncio.gather(*tasks)
+    else:
+        # Closed loop: `level` workers each send back-to-back requests
+        async def worker():
+            while time.perf_counter() < end:
+                await attempt()
+        await asyncio.gather(*(worker() for _ in range(int(level))))
+    elapsed = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    return {
+        "endpoint": driver.endpoint,
+        "mode": mode,
+        "level": level,
+        "duration_s": round(elapsed, 2),
+        "completed": len(ordered),
+        "errors": errors,
+        "throughput_rps": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(ordered, 0.50) * 1000, 2),
+            "p95": round(percentile(ordered, 0.95) * 1000, 2),
+            "p99": round(percentile(ordered, 0.99) * 1000, 2),
+            "max": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+        },
+    }
+
+def compare(results: Dict, baseline_path: str, tolerance: float) -> List[str]:
+    """
+    Flags scenarios whose p95 latency grew, or throughput dropped, by more than `tolerance`.
+    """
+    with open(baseline_path) as f:
+        baseline = {(s["endpoint"], s["mode"], s["level"]): s for s in json.load(f)["scenarios"]}
+    regressions = []
+    for scenario in results["scenarios"]:
+        before = baseline.get((scenario["endpoint"], scenario["mode"], scenario["level"]))
+        if before is None:
+            continue
+        label = f'{scenario["endpoint"]} {scenario["mode"]}={scenario["level"]}'
+        if scenario["latency_ms"]["p95"] > before["latency_ms"]["p95"] * (1 + tolerance):
+            regressions.append(f'{label}: p95 {before["latency_ms"]["p95"]}ms -> {scenario["latency_ms"]["p95"]}ms')
+        if scenario["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            regressions.append(f'{label}: throughput {before["throughput_rps"]} -> {scenario["throughput_rps"]} rps')
+    return regressions
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except Exception:
+        return None
+
+async def main(args: argparse.Namespace) -> int:
+    processes: List[ServiceProcess] = []
+    vision_env = {
+        "LLM_PROVIDER": args.provider,
+        "MOCK_LATENCY_MS": str(args.mock_latency_ms),
+        "MOCK_LATENCY_JITTER_MS": str(args.mock_jitter_ms),
+        "MOCK_LATENCY_DISTRIBUTION": args.mock_latency_distribution,
+        "MOCK_ERROR_RATE": str(args.mock_error_rate),
+        "MOCK_RATE_LIMIT_RATE": str(args.mock_rate_limit_rate),
+    }
+    try:
+        if not args.no_spawn:
+            vision = ServiceProcess("vision", "services.vision.main:app", args.vision_port, vision_env)
+            gateway = ServiceProcess(
+                "gateway", "services.gateway.main:app", args.gateway_port,
+                {"VISION_SERVICE_BASE_URL": f"http://127.0.0.1:{args.vision_port}"},
+            )
+            processes = [vision, gateway]
+            await vision.wait_ready("/health")
+            await gateway.wait_ready("/")
+
+        upload = make_upload_image(args.upload_bytes)
+        limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+        scenarios = []
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{args.gateway_port}", limits=limits, timeout=120.0
+        ) as client:
+            with RssSampler({p.name: p.process.pid for p in processes}) as sampler:
+                for endpoint in args.endpoints:
+                    driver = Driver(client, endpoint, upload, args.cache_hit_ratio)
+                    await run_scenario(driver, "concurrency", 4, args.warmup, args.max_in_flight)
+                    levels = [("rps", rps) for rps in args.rps] + [("concurrency", c) for c in args.concurrency]
+                    for mode, level in levels:
+                        result = await run_scenario(driver, mode, level, args.duration, args.max_in_flight)
+                        result["rss"] = sampler.report()
+                        scenarios.append(result)
+                        print(
+                            f'{endpoint:>6} {mode:>11}={level:<5} {result["throughput_rps"]:>8} rps  '
+                            f'p50={result["latency_ms"]["p50"]}ms p95={result["latency_ms"]["p95"]}ms '
+                            f'p99={result["latency_ms"]["p99"]}ms errors={sum(result["errors"].values())}'
+                        )
+    finally:
+        for process in processes:
+            process.stop()
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {**vars(args), **vision_env},
+        "scenarios": scenarios,
+    }
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.out}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default="load_test_results.json")
+    parser.add_argument("--endpoints", nargs="+", choices=["json", "upload"], default=["json", "upload"])
+    parser.add_argument("--rps", nargs="*", type=float, default=[25.0, 100.0], help="Open-loop request rates")
+    parser.add_argument("--concurrency", nargs="*", type=int, default=[1, 16], help="Closed-loop worker counts")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Seconds of warm-up per endpoint")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="Client-side cap on open requests")
+    parser.add_argument("--upload-bytes", type=int, default=200_000, help="Approximate size of the upload image")
+    parser.add_argument("--cache-hit-ratio", type=float, default=0.0, help="Fraction of requests for a repeated product")
+    parser.add_argument("--provider", default="mock", help="LLM_PROVIDER for the vision service")
+    parser.add_argument("--mock-latency-ms", type=float, default=0.0, help="Simulated provider latency")
+    parser.add_argument("--mock-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--mock-latency-distribution", default="uniform", choices=["uniform", "lognormal", "exponential"])
+    parser.add_argument("--mock-error-rate", type=float, default=0.0, help="Fraction of provider calls that fail")
+    parser.add_argument("--mock-rate-limit-rate", type=float, default=0.0, help="Fraction of provider calls answered 429")
+    parser.add_argument("--gateway-port", type=int, default=18000)
+    parser.add_argument("--vision-port", type=int, default=18001)
+    parser.add_argument("--no-spawn", action="store_true", help="Use already running services")
+    parser.add_argument("--baseline", help="Previous results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative regression")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
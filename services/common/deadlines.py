@@ -0,0 +1,165 @@
+import asyncio
+import json
+import logging
+import math
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from prometheus_client import Counter
+
+# Time budget of a request in seconds, relative so that clock skew between hosts does not matter.
+# Clients may set it; the gateway always passes on what is left of it to the Vision Service.
+DEADLINE_HEADER = "x-request-timeout"
+# Marks a 504 produced by an exhausted budget, which callers must not retry
+DEADLINE_EXCEEDED_HEADER = "x-deadline-exceeded"
+
+# Status logged for requests whose client went away (nginx's "client closed request")
+CLIENT_CLOSED_STATUS = 499
+
+REQUESTS_ABANDONED = Counter(
+    "requests_abandoned_total",
+    "Requests whose handler was cancelled before finishing: the time budget ran out (expired) "
+    "or the client disconnected (disconnected).",
+    ["service", "reason"],
+)
+
+logger = logging.getLogger(__name__)
+
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+def parse_budget(value: Optional[str]) -> Optional[float]:
+    """
+    Seconds from a DEADLINE_HEADER value; None when absent or not a number.
+    """
+    try:
+        budget = float(value)
+    except (TypeError, ValueError):
+        return None
+    return budget if math.isfinite(budget) else None
+
+def remaining() -> Optional[float]:
+    """
+    Seconds left of the current request's budget (negative once expired), or None
+    when the request has no deadline.
+    """
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+class DeadlineStats:
+    def __init__(self):
+        self.counts = {"requests": 0, "with_deadline": 0, "expired": 0, "disconnected": 0}
+
+    def snapshot(self) -> Dict:
+        return dict(self.counts)
+
+class DeadlineMiddleware:
+    """
+    Plain ASGI middleware that runs each request's handler as a task and cancels it
+    when the request's budget (DEADLINE_HEADER) runs out or the client disconnects,
+    so provider calls and upstream requests nobody will read are abandoned instead of
+    run to completion. Expired requests are answered 504; abandoned ones are counted.
+
+    Disconnects are watched for once the handler has read the request body (or at
+    once for requests without one); until then the handler owns `receive`.
+    """
+    def __init__(self, app, service: str, stats: Optional[DeadlineStats] = None, skip_paths=("/metrics", "/health")):
+        self.app = app
+        self.service = service
+        self.stats = stats if stats is not None else DeadlineStats()
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        budget = parse_budget(headers.get(DEADLINE_HEADER.encode("latin-1"), b"").decode("latin-1"))
+        self.stats.counts["requests"] += 1
+        if budget is not None:
+            self.stats.counts["with_deadline"] += 1
+            if budget <= 0:
+                self._abandoned(scope, "expired")
+                await _send_expired(send)
+                return
+
+        has_body = headers.get(b"content-length", b"0") != b"0" or b"transfer-encoding" in headers
+        body_read = asyncio.Event()
+        disconnected = asyncio.Event()
+        empty_body = [] if has_body else [{"type": "http.request", "body": b"", "more_body": False}]
+        if not has_body:
+            body_read.set()
+        response_started = False
+
+        async def app_receive():
+            if body_read.is_set():
+                if empty_body:
+                    return empty_body.pop()
+                # The watcher owns the connection now and reports its disconnect
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+            elif not message.get("more_body", False):
+                body_read.set()
+            return message
+
+        async def app_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        async def watch_disconnect():
+            await body_read.wait()
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        token = _deadline.set(time.monotonic() + budget if budget is not None else None)
+        try:
+            # Created while the deadline is set, so the handler's context carries it
+            handler = asyncio.ensure_future(self.app(scope, app_receive, app_send))
+        finally:
+            _deadline.reset(token)
+        watcher = asyncio.ensure_future(watch_disconnect())
+        gone = asyncio.ensure_future(disconnected.wait())
+        try:
+            await asyncio.wait({handler, gone}, timeout=budget, return_when=asyncio.FIRST_COMPLETED)
+            if handler.done():
+                handler.result()
+                return
+            reason = "disconnected" if disconnected.is_set() else "expired"
+            handler.cancel()
+            await asyncio.gather(handler, return_exceptions=True)
+            self._abandoned(scope, reason)
+            if not response_started:
+                if reason == "expired":
+                    await _send_expired(send)
+                else:
+                    # Nobody receives this; it only makes the access log and metrics say 499
+                    await send({"type": "http.response.start", "status": CLIENT_CLOSED_STATUS, "headers": []})
+                    await send({"type": "http.response.body", "body": b""})
+        finally:
+            for task in (handler, watcher, gone):
+                task.cancel()
+
+    def _abandoned(self, scope, reason: str):
+        self.stats.counts[reason] += 1
+        REQUESTS_ABANDONED.labels(self.service, reason).inc()
+        logger.info("Request abandoned", extra={"path": scope["path"], "reason": reason})
+
+async def _send_expired(send):
+    body = json.dumps({"detail": "Request deadline exceeded."}).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": 504,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("latin-1")),
+            (DEADLINE_EXCEEDED_HEADER.encode("latin-1"), b"true"),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
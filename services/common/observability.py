@@ -0,0 +1,217 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, Iterator, Optional
+
+from prometheus_client import REGISTRY, Counter, Histogram
+from prometheus_client.exposition import choose_encoder
+from starlette.responses import Response
+
+# Stages range from sub-millisecond (prompt build) to tens of seconds (provider calls)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+STAGE_SECONDS = Histogram(
+    "stage_duration_seconds", "Time spent in one processing stage of a request.", ["stage"], buckets=STAGE_BUCKETS
+)
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "End-to-end HTTP request latency.", ["method", "route", "status"],
+    buckets=STAGE_BUCKETS,
+)
+PROVIDER_FALLBACKS = Counter(
+    "provider_fallbacks_total", "Provider calls answered with mock data instead of a real analysis.",
+    ["provider", "reason"],
+)
+PROVIDER_CANCELLATIONS = Counter(
+    "provider_calls_cancelled_total", "Provider calls abandoned mid-flight because nobody was waiting for them any more.",
+    ["provider"],
+)
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class TraceContext:
+    """
+    W3C Trace Context (`traceparent: 00-<trace_id>-<span_id>-<flags>`) for one hop.
+    """
+    trace_id: str
+    span_id: str
+    sampled: bool = True
+
+    @classmethod
+    def new(cls) -> "TraceContext":
+        return cls(os.urandom(16).hex(), os.urandom(8).hex())
+
+    @classmethod
+    def from_header(cls, value: Optional[str]) -> Optional["TraceContext"]:
+        parts = (value or "").strip().split("-")
+        if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or parts[1] == "0" * 32:
+            return None
+        try:
+            flags = int(parts[3], 16)
+            int(parts[1], 16), int(parts[2], 16)
+        except ValueError:
+            return None
+        return cls(parts[1], parts[2], bool(flags & 1))
+
+    def child(self) -> "TraceContext":
+        return TraceContext(self.trace_id, os.urandom(8).hex(), self.sampled)
+
+    def header(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+_current_trace: ContextVar[Optional[TraceContext]] = ContextVar("current_trace", default=None)
+_request_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_stages", default=None)
+
+def current_trace() -> Optional[TraceContext]:
+    return _current_trace.get()
+
+def observe_stage(name: str, seconds: float):
+    trace = _current_trace.get()
+    STAGE_SECONDS.labels(name).observe(seconds, exemplar={"trace_id": trace.trace_id} if trace else None)
+    stages = _request_stages.get()
+    if stages is not None:
+        stages[name] = stages.get(name, 0.0) + seconds
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Times the enclosed block (including awaits) into the stage histogram and the
+    current request's Server-Timing breakdown.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - started)
+
+class ObservabilityMiddleware:
+    """
+    Plain ASGI middleware (so streaming responses pass through untouched). Continues
+    the caller's trace or starts one, echoes `traceparent`, reports the stages that
+    finished before the response started as `Server-Timing`, records the request
+    histogram and logs one structured line per request with its stage breakdown.
+    """
+    def __init__(self, app, skip_paths=("/metrics", "/health")):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        parent = TraceContext.from_header(headers.get(b"traceparent", b"").decode("latin-1"))
+        trace = parent.child() if parent else TraceContext.new()
+        stages: Dict[str, float] = {}
+        trace_token = _current_trace.set(trace)
+        stages_token = _request_stages.set(stages)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_headers(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                extra = [(b"traceparent", trace.header().encode("latin-1"))]
+                if stages:
+                    timing = ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in stages.items())
+                    extra.append((b"server-timing", timing.encode("latin-1")))
+                message = {**message, "headers": list(message.get("headers", [])) + extra}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            elapsed = time.perf_counter() - started
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            REQUEST_SECONDS.labels(scope["method"], route_path, str(status)).observe(
+                elapsed, exemplar={"trace_id": trace.trace_id}
+            )
+            if scope["path"] not in self.skip_paths:
+                logger.info(
+                    "request completed",
+                    extra={
+                        "method": scope["method"],
+                        "route": route_path,
+                        "status": status,
+                        "duration_ms": round(elapsed * 1000, 2),
+                        "stages_ms": {name: round(seconds * 1000, 2) for name, seconds in stages.items()},
+                    },
+                )
+            _request_stages.reset(stages_token)
+            _current_trace.reset(trace_token)
+
+def metrics_response(accept: Optional[str]) -> Response:
+    """
+    Prometheus exposition of the default registry; OpenMetrics (with trace exemplars)
+    when the scraper asks for it.
+    """
+    encoder, content_type = choose_encoder(accept or "")
+    return Response(encoder(REGISTRY), media_type=content_type)
+
+# Attributes every LogRecord has; anything else was passed through `extra=`
+_RECORD_ATTRIBUTES = set(logging.LogRecord("", 0, "", 0, "", None, None).__dict__) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({k: v for k, v in record.__dict__.items() if k not in _RECORD_ATTRIBUTES})
+        return json.dumps(entry, default=str)
+
+class _TraceFilter(logging.Filter):
+    # Runs in the logging thread of the caller, where the request's context is visible
+    def filter(self, record: logging.LogRecord) -> bool:
+        trace = _current_trace.get()
+        if trace is not None:
+            record.trace_id = trace.trace_id
+            record.span_id = trace.span_id
+        return True
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def configure_logging(service: str, level: str = "INFO", fmt: str = "json"):
+    """
+    Routes all logging through a QueueHandler: the event loop only enqueues records,
+    and a background thread formats and writes them. Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stderr)
+    if fmt == "json":
+        output.setFormatter(JsonFormatter(service))
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+
+    handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    handler.addFilter(_TraceFilter())
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    # One INFO line per upstream call duplicates the request log
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -0,0 +1,156 @@
+from pydantic import BaseModel, Field, HttpUrl, PrivateAttr
+from typing import List, Optional
+from enum import Enum
+
+class GenderExpression(float):
+    """Score from -5.0 (Masculine) to +5.0 (Feminine)"""
+    pass
+
+class VisualWeight(float):
+    """Score from -5.0 (Sleek/Light) to +5.0 (Bold/Heavy)"""
+    pass
+
+class Embellishment(float):
+    """Score from -5.0 (Simple) to +5.0 (Ornate)"""
+    pass
+
+class Unconventionality(float):
+    """Score from -5.0 (Classic) to +5.0 (Avant-Garde)"""
+    pass
+
+class Formality(float):
+    """Score from -5.0 (Casual) to +5.0 (Formal)"""
+    pass
+
+class ContinuousDimensions(BaseModel):
+    gender_expression: float = Field(..., ge=-5.0, le=5.0, description="Masculine (-5.0) to Feminine (5.0)")
+    visual_weight: float = Field(..., ge=-5.0, le=5.0, description="Sleek/Light (-5.0) to Bold/Heavy (5.0)")
+    embellishment: float = Field(..., ge=-5.0, le=5.0, description="Simple (-5.0) to Ornate (5.0)")
+    unconventionality: float = Field(..., ge=-5.0, le=5.0, description="Classic (-5.0) to Avant-Garde (5.0)")
+    formality: float = Field(..., ge=-5.0, le=5.0, description="Casual (-5.0) to Formal (5.0)")
+
+class DiscreteAttributes(BaseModel):
+    has_wirecore: bool = Field(..., description="Visible wirecore in temples")
+    is_transparent: bool = Field(..., description="Frame material allows light through")
+    dominant_colors: List[str] = Field(..., description="List of visually dominant colors")
+    frame_shape: str = Field(..., description="e.g., Round, Square, Cat-eye, Aviator")
+    texture_pattern: Optional[str] = Field(None, description="Visible surface texture or pattern (e.g., Tortoise, Matte)")
+    looks_like_kids_product: bool = Field(..., description="Visually obvious sizing or styling for children")
+
+class VisualMetadata(BaseModel):
+    image_quality_notes: str = Field(..., description="Observations about image clarity, lighting, resolution")
+    is_occluded_or_ambiguous: bool = Field(..., description="If essential parts are hidden or unclear")
+    confidence_score: float = Field(..., ge=0.0, le=1.0, description="Overall confidence in the visual analysis (0.0 to 1.0)")
+
+class ProductAnalysisResponse(BaseModel):
+    product_id: Optional[str] = None
+    continuous_dimensions: ContinuousDimensions
+    discrete_attributes: DiscreteAttributes
+    metadata: VisualMetadata
+
+    # Set when a provider substituted mock data after a failure (never serialized)
+    _is_fallback: bool = PrivateAttr(default=False)
+    # Prompt template the provider answered ("single" or "batch", never serialized)
+    _prompt_template: str = PrivateAttr(default="single")
+
+    @property
+    def is_fallback(self) -> bool:
+        return self._is_fallback
+
+    @property
+    def prompt_template(self) -> str:
+        return self._prompt_template
+
+class AnalysisRequest(BaseModel):
+    image_urls: List[HttpUrl]
+    product_id: Optional[str] = None
+
+class BatchAnalysisRequest(BaseModel):
+    items: List[AnalysisRequest] = Field(..., description="Products to analyze, one entry per product")
+
+class BatchItemResult(BaseModel):
+    product_id: Optional[str] = None
+    result: Optional[ProductAnalysisResponse] = None
+    error: Optional[str] = None
+
+class BatchAnalysisResponse(BaseModel):
+    results: List[BatchItemResult]
+    succeeded: int
+    failed: int
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+class JobRequest(AnalysisRequest):
+    callback_url: Optional[HttpUrl] = Field(None, description="Receives the final job status as a POST")
+
+class JobSubmitted(BaseModel):
+    job_id: str
+    status: JobStatus
+    status_url: str
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    status: JobStatus
+    product_id: Optional[str] = None
+    result: Optional[ProductAnalysisResponse] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    callback_status: Optional[str] = None # "delivered" or "failed" once the callback was attempted
+
+class ResultQuery(BaseModel):
+    """
+    Filters over stored results. Ranges are inclusive; list filters match any of the
+    given values, except `color`, where a product must have every listed color.
+    """
+    gender_expression_min: Optional[float] = None
+    gender_expression_max: Optional[float] = None
+    visual_weight_min: Optional[float] = None
+    visual_weight_max: Optional[float] = None
+    embellishment_min: Optional[float] = None
+    embellishment_max: Optional[float] = None
+    unconventionality_min: Optional[float] = None
+    unconventionality_max: Optional[float] = None
+    formality_min: Optional[float] = None
+    formality_max: Optional[float] = None
+    confidence_min: Optional[float] = None
+    has_wirecore: Optional[bool] = None
+    is_transparent: Optional[bool] = None
+    looks_like_kids_product: Optional[bool] = None
+    is_occluded_or_ambiguous: Optional[bool] = None
+    frame_shape: Optional[List[str]] = None
+    texture_pattern: Optional[List[str]] = None
+    color: Optional[List[str]] = None
+    limit: int = Field(100, ge=1, le=10000)
+    offset: int = Field(0, ge=0)
+
+class ResultPage(BaseModel):
+    total: int # Matching products, before limit/offset
+    results: List[ProductAnalysisResponse]
+
+class SimilarQuery(ResultQuery):
+    """
+    Nearest stored products to a reference product (`product_id`) or to explicit
+    dimension values, among those matching the usual result filters.
+    """
+    product_id: Optional[str] = None
+    gender_expression: Optional[float] = Field(None, ge=-5.0, le=5.0)
+    visual_weight: Optional[float] = Field(None, ge=-5.0, le=5.0)
+    embellishment: Optional[float] = Field(None, ge=-5.0, le=5.0)
+    unconventionality: Optional[float] = Field(None, ge=-5.0, le=5.0)
+    formality: Optional[float] = Field(None, ge=-5.0, le=5.0)
+    limit: int = Field(10, ge=1, le=1000) # Neighbours returned
+
+class SimilarProduct(BaseModel):
+    product_id: str
+    distance: float # Euclidean, over the five continuous dimensions
+    result: ProductAnalysisResponse
+
+class SimilarityResponse(BaseModel):
+    results: List[SimilarProduct]
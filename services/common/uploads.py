@@ -0,0 +1,140 @@
+from typing import AsyncIterator, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from starlette.datastructures import Headers, UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+# The upload body is parsed by hand (to stream it with size limits), so routes describe it
+# for the docs with openapi_extra=UPLOAD_REQUEST_BODY
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["files"],
+                    "properties": {
+                        "files": {"type": "array", "items": {"type": "string", "format": "binary"}},
+                        "product_id": {"type": "string"},
+                    },
+                }
+            }
+        },
+    }
+}
+
+class UploadTooLarge(Exception):
+    pass
+
+def _check_parser_internals():
+    # LimitedMultiPartParser hooks into Starlette's parser callbacks and reads the part
+    # being parsed from the private `_current_part`. Fail on import, not on the first
+    # upload, if a Starlette upgrade changes either.
+    hooks = ("on_part_begin", "on_part_data", "on_headers_finished")
+    probe = MultiPartParser(Headers(), stream=None)
+    if not all(callable(getattr(MultiPartParser, hook, None)) for hook in hooks) or not hasattr(
+        getattr(probe, "_current_part", None), "file"
+    ):
+        raise ImportError("Unsupported Starlette version: MultiPartParser internals used for uploads have changed.")
+
+_check_parser_internals()
+
+class LimitedMultiPartParser(MultiPartParser):
+    """
+    Starlette's streaming multipart parser (file parts are spooled to disk past 1MB)
+    with a per-file byte limit checked on every chunk, so an oversized file is
+    rejected as soon as it crosses the limit instead of after it is fully received.
+    """
+    def __init__(self, headers: Headers, stream: AsyncIterator[bytes], max_file_bytes: int, max_files: int):
+        super().__init__(headers, stream, max_files=max_files, max_fields=10)
+        self.max_file_bytes = max_file_bytes
+        self._current_file_bytes = 0
+        self.spooled: List[UploadFile] = []
+
+    def on_part_begin(self):
+        super().on_part_begin()
+        self._current_file_bytes = 0
+
+    def on_headers_finished(self):
+        super().on_headers_finished()
+        if self._current_part.file is not None:
+            self.spooled.append(self._current_part.file)
+
+    async def close_spooled(self):
+        for file in self.spooled:
+            await file.close()
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._current_part.file is not None:
+            self._current_file_bytes += end - start
+            if self._current_file_bytes > self.max_file_bytes:
+                raise UploadTooLarge(
+                    f"File '{self._current_part.file.filename}' exceeds the {self.max_file_bytes} byte limit."
+                )
+        super().on_part_data(data, start, end)
+
+async def _limited_stream(request: Request, max_request_bytes: int) -> AsyncIterator[bytes]:
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > max_request_bytes:
+            raise UploadTooLarge(f"Upload exceeds the {max_request_bytes} byte request limit.")
+        yield chunk
+
+async def parse_upload(
+    request: Request,
+    max_files: int,
+    max_file_bytes: int,
+    max_request_bytes: int,
+) -> Tuple[List[UploadFile], Optional[str]]:
+    """
+    Streams a multipart upload into spooled files, enforcing the limits early.
+    Returns the uploaded files and the optional `product_id` form field.
+    Raises UploadTooLarge or MultiPartException; the caller must close the files.
+    """
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_request_bytes:
+        # Reject before reading a single byte of the body
+        raise UploadTooLarge(f"Upload exceeds the {max_request_bytes} byte request limit.")
+
+    content_type = request.headers.get("content-type", "")
+    if not content_type.startswith("multipart/form-data"):
+        raise MultiPartException("Expected a multipart/form-data body.")
+
+    parser = LimitedMultiPartParser(
+        request.headers, _limited_stream(request, max_request_bytes), max_file_bytes, max_files
+    )
+    try:
+        form = await parser.parse()
+    except BaseException:
+        # Parts spooled before the limit was hit (or the body broke off) are not returned
+        await parser.close_spooled()
+        raise
+
+    files = []
+    for key, value in form.multi_items():
+        if isinstance(value, UploadFile):
+            if key == "files":
+                files.append(value)
+            else:
+                await value.close()
+    product_id = form.get("product_id")
+    return files, product_id if isinstance(product_id, str) and product_id else None
+
+async def receive_upload(
+    request: Request,
+    max_files: int,
+    max_file_bytes: int,
+    max_request_bytes: int,
+) -> Tuple[List[UploadFile], Optional[str]]:
+    """
+    parse_upload for route handlers: a limit that is hit becomes a 413, a malformed
+    body a 400. The caller must close the files.
+    """
+    try:
+        return await parse_upload(request, max_files, max_file_bytes, max_request_bytes)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except MultiPartException as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -4,12 +4,45 @@ class Settings(BaseSettings):
     PROJECT_NAME: str = "AI-Powered Visual Product Measurement System"
     API_V1_STR: str = "/api/v1"
     CORS_ORIGINS: list[str] = ["*"] # Allow all for prototype simplicity
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json" # options: "json", "text"
 
     # LLM Configuration
     GROQ_API_KEY: str = ""
     OPENAI_API_KEY: str = ""
     LLM_PROVIDER: str = "mock" # options: "mock", "groq", "openai"
 
+    # Upload Limits (checked while the body streams in, before it is fully read)
+    UPLOAD_MAX_FILES: int = 14
+    UPLOAD_MAX_FILE_BYTES: int = 10 * 1024 * 1024
+    UPLOAD_MAX_REQUEST_BYTES: int = 50 * 1024 * 1024
+
+    # Vision Service Client (one pooled client shared by all requests)
+    VISION_SERVICE_BASE_URL: str = "http://localhost:8001"
+    VISION_SERVICE_URLS: str = "" # Comma-separated worker base URLs (see run_workers); empty uses VISION_SERVICE_BASE_URL
+    VISION_HTTP2: bool = True # Needs the 'h2' package; falls back to HTTP/1.1 without it
+    VISION_MAX_CONNECTIONS: int = 100
+    VISION_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    VISION_KEEPALIVE_EXPIRY: float = 30.0 # Seconds an idle connection stays in the pool
+    VISION_CONNECT_TIMEOUT: float = 5.0
+
+    # Per-route upstream timeouts (seconds)
+    VISION_ANALYZE_TIMEOUT: float = 60.0
+    VISION_UPLOAD_TIMEOUT: float = 60.0
+    VISION_BATCH_TIMEOUT: float = 600.0
+    VISION_JOBS_TIMEOUT: float = 10.0 # Job submit/poll only touch the queue, never the LLM
+    VISION_RESULTS_TIMEOUT: float = 10.0 # Stored-results queries, never the LLM
+
+    # Upstream Pool (used when VISION_SERVICE_URLS lists several workers)
+    VISION_HEALTH_INTERVAL: float = 2.0 # Seconds between active /health checks of every worker
+    VISION_HEALTH_TIMEOUT: float = 1.0
+    VISION_UNHEALTHY_AFTER: int = 2 # Consecutive failures before a worker stops getting requests
+
+    # Retries for requests that never reached the Vision Service, or that a worker refused with 503
+    VISION_RETRY_ATTEMPTS: int = 2
+    VISION_RETRY_BACKOFF_BASE: float = 0.2 # Seconds, doubled per attempt before jitter
+    VISION_RETRY_BACKOFF_MAX: float = 2.0
+
     class Config:
         env_file = ".env"
         case_sensitive = True
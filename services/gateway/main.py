@@ -1,12 +1,55 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 import httpx
-from typing import List, Optional
-from services.gateway.schemas import AnalysisRequest, ProductAnalysisResponse
+from urllib.parse import quote
+from typing import Annotated, Optional
+from services.common.schemas import (
+    AnalysisRequest,
+    ProductAnalysisResponse,
+    BatchAnalysisRequest,
+    BatchAnalysisResponse,
+    JobRequest,
+    JobStatusResponse,
+    JobSubmitted,
+    ResultPage,
+    ResultQuery,
+    SimilarityResponse,
+    SimilarQuery,
+)
 from services.gateway.config import settings
-import base64
+from services.common.deadlines import DEADLINE_EXCEEDED_HEADER, DeadlineMiddleware, DeadlineStats
+from services.common.observability import ObservabilityMiddleware, configure_logging, metrics_response, stage
+from services.gateway.vision_client import DeadlineExceeded, vision_client
+from services.common.uploads import UPLOAD_REQUEST_BODY, receive_upload
+
+def upstream_error(e: httpx.HTTPStatusError) -> HTTPException:
+    """
+    Relays a Vision Service error status, keeping Retry-After on 429 backpressure.
+    """
+    headers = None
+    if "retry-after" in e.response.headers:
+        headers = {"Retry-After": e.response.headers["retry-after"]}
+    return HTTPException(status_code=e.response.status_code, detail=f"Vision Service Error: {e.response.text}", headers=headers)
+
+configure_logging("gateway", settings.LOG_LEVEL, settings.LOG_FORMAT)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await vision_client.start()
+    yield
+    await vision_client.aclose()
+
+app = FastAPI(title="Gateway Service", version="1.0.0", lifespan=lifespan)
+# Abandons requests whose client went away or whose X-Request-Timeout budget ran out
+deadline_stats = DeadlineStats()
+app.add_middleware(DeadlineMiddleware, service="gateway", stats=deadline_stats)
+app.add_middleware(ObservabilityMiddleware)
 
-app = FastAPI(title="Gateway Service", version="1.0.0")
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    return JSONResponse(status_code=504, content={"detail": str(exc)}, headers={DEADLINE_EXCEEDED_HEADER: "true"})
 
 # CORS setup
 app.add_middleware(
@@ -17,49 +60,198 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-VISION_SERVICE_URL = "http://localhost:8001/process"
+# Vision Service paths; vision_client picks the worker (VISION_SERVICE_URLS) for each request
+VISION_ANALYZE_PATH = "/process"
+VISION_UPLOAD_PATH = "/process-upload"
+VISION_BATCH_PATH = "/process-batch"
+VISION_JOBS_PATH = "/jobs"
+VISION_STREAM_PATH = "/process-stream"
+VISION_RESULTS_PATH = "/results"
 
 @app.post("/api/v1/analyze-product", response_model=ProductAnalysisResponse)
 async def analyze_product(request: AnalysisRequest):
-    async with httpx.AsyncClient() as client:
-        try:
-            # Forwarding to Vision Service.
-            # Convert Pydantic model to dict/json
-            resp = await client.post(VISION_SERVICE_URL, json=request.model_dump(mode='json'), timeout=60.0)
-            resp.raise_for_status()
-            return resp.json()
-        except httpx.HTTPError as e:
-            raise HTTPException(status_code=500, detail=f"Vision Service Error: {str(e)}")
-
-@app.post("/api/v1/analyze/upload", response_model=ProductAnalysisResponse)
-async def analyze_product_upload(
-    files: List[UploadFile] = File(...),
-    product_id: Optional[str] = Form(None)
-):
-    image_urls = []
     try:
-        # Pre-process files into Base64 URLs here in Gateway (or could stream to Vision)
-        # Doing it here keeps Vision simple (receiving list of strings)
-        for file in files:
-            contents = await file.read()
-            mime_type = file.content_type or "image/jpeg"
-            encoded_image = base64.b64encode(contents).decode("utf-8")
-            data_url = f"data:{mime_type};base64,{encoded_image}"
-            image_urls.append(data_url)
-        
-        # Construct payload for Vision Service
-        payload = {
-            "image_urls": image_urls,
-            "product_id": product_id
-        }
-
-        async with httpx.AsyncClient() as client:
-             resp = await client.post(VISION_SERVICE_URL, json=payload, timeout=60.0)
-             resp.raise_for_status()
-             return resp.json()
+        # Forwarding to Vision Service.
+        # Convert Pydantic model to dict/json
+        resp = await vision_client.post(
+            "analyze", VISION_ANALYZE_PATH, settings.VISION_ANALYZE_TIMEOUT, json=request.model_dump(mode='json')
+        )
+        return resp.json()
+    except httpx.HTTPStatusError as e:
+        raise upstream_error(e)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"Vision Service Error: {str(e)}")
+
+@app.post("/api/v1/analyze/upload", response_model=ProductAnalysisResponse, openapi_extra=UPLOAD_REQUEST_BODY)
+async def analyze_product_upload(request: Request):
+    with stage("upload_read"):
+        files, product_id = await receive_upload(
+            request,
+            max_files=settings.UPLOAD_MAX_FILES,
+            max_file_bytes=settings.UPLOAD_MAX_FILE_BYTES,
+            max_request_bytes=settings.UPLOAD_MAX_REQUEST_BYTES,
+        )
+
+    if not files:
+        raise HTTPException(status_code=400, detail="At least one image file must be uploaded.")
 
+    try:
+        # Forward the raw bytes as multipart, streamed from the spooled files.
+        # Base64 encoding is left to the Vision Service's provider, if it needs it.
+        multipart_files = [
+            ("files", (file.filename or "image", file.file, file.content_type or "image/jpeg"))
+            for file in files
+        ]
+        data = {"product_id": product_id} if product_id else None
+
+        resp = await vision_client.post(
+            "upload", VISION_UPLOAD_PATH, settings.VISION_UPLOAD_TIMEOUT, files=multipart_files, data=data
+        )
+        return resp.json()
+    except httpx.HTTPStatusError as e:
+        raise upstream_error(e)
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Gateway Upload Error: {str(e)}")
+    finally:
+        for file in files:
+            await file.close()
+
+@app.post("/api/v1/analyze-batch", response_model=BatchAnalysisResponse)
+async def analyze_batch(request: BatchAnalysisRequest):
+    if not request.items:
+        raise HTTPException(status_code=400, detail="At least one item must be provided.")
+
+    try:
+        # A batch runs many LLM calls, so it gets its own (much longer) timeout
+        resp = await vision_client.post(
+            "batch", VISION_BATCH_PATH, settings.VISION_BATCH_TIMEOUT, json=request.model_dump(mode='json')
+        )
+        return resp.json()
+    except httpx.HTTPStatusError as e:
+        raise upstream_error(e)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"Vision Service Error: {str(e)}")
+
+@app.post("/api/v1/analyze-stream")
+async def analyze_stream(request: BatchAnalysisRequest, http_request: Request, format: Optional[str] = None):
+    """
+    Streams per-product results (NDJSON, or SSE with ?format=sse / Accept: text/event-stream)
+    as the Vision Service finishes them. Chunks are relayed as they arrive, never buffered.
+    """
+    if not request.items:
+        raise HTTPException(status_code=400, detail="At least one item must be provided.")
+
+    params = {"format": format} if format else None
+    headers = {"Accept": http_request.headers["accept"]} if "accept" in http_request.headers else None
+    try:
+        resp = await vision_client.stream(
+            "stream",
+            VISION_STREAM_PATH,
+            settings.VISION_BATCH_TIMEOUT,
+            json=request.model_dump(mode='json'),
+            params=params,
+            headers=headers,
+        )
+    except httpx.HTTPStatusError as e:
+        raise upstream_error(e)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"Vision Service Error: {str(e)}")
+
+    async def relay():
+        try:
+            async for chunk in resp.aiter_raw():
+                yield chunk
+        finally:
+            # Also runs when the client disconnects, so the Vision Service stops its work too
+            await resp.aclose()
+
+    relayed = {name: resp.headers[name] for name in ("cache-control", "x-accel-buffering") if name in resp.headers}
+    return StreamingResponse(relay(), media_type=resp.headers.get("content-type"), headers=relayed)
+
+@app.post("/api/v1/jobs", response_model=JobSubmitted, status_code=202)
+async def submit_job(request: JobRequest):
+    """
+    Queues an analysis in the Vision Service and returns its job id immediately,
+    so no connection is held open for the LLM call.
+    """
+    try:
+        resp = await vision_client.post(
+            "jobs", VISION_JOBS_PATH, settings.VISION_JOBS_TIMEOUT, json=request.model_dump(mode='json')
+        )
+        submitted = resp.json()
+        submitted["status_url"] = f"/api/v1/jobs/{submitted['job_id']}"
+        return submitted
+    except httpx.HTTPStatusError as e:
+        raise upstream_error(e)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"Vision Service Error: {str(e)}")
+
+@app.get("/api/v1/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job(job_id: str):
+    try:
+        resp = await vision_client.get("jobs", f"{VISION_JOBS_PATH}/{job_id}", settings.VISION_JOBS_TIMEOUT)
+        return resp.json()
+    except httpx.HTTPStatusError as e:
+        raise upstream_error(e)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"Vision Service Error: {str(e)}")
+
+@app.get("/api/v1/results", response_model=ResultPage)
+async def query_results(query: Annotated[ResultQuery, Query()]):
+    """
+    Reads stored measurements (e.g. ?formality_min=3&is_transparent=true) without
+    triggering any new analysis.
+    """
+    try:
+        resp = await vision_client.get(
+            "results", VISION_RESULTS_PATH, settings.VISION_RESULTS_TIMEOUT, params=query.model_dump(exclude_none=True)
+        )
+        return resp.json()
+    except httpx.HTTPStatusError as e:
+        raise upstream_error(e)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"Vision Service Error: {str(e)}")
+
+@app.get("/api/v1/results/similar", response_model=SimilarityResponse)
+async def similar_results(query: Annotated[SimilarQuery, Query()]):
+    """
+    Stored products closest to a reference product (?product_id=...) or to explicit
+    dimension values, optionally narrowed by the /api/v1/results filters.
+    """
+    try:
+        resp = await vision_client.get(
+            "results", f"{VISION_RESULTS_PATH}/similar", settings.VISION_RESULTS_TIMEOUT, params=query.model_dump(exclude_none=True)
+        )
+        return resp.json()
+    except httpx.HTTPStatusError as e:
+        raise upstream_error(e)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"Vision Service Error: {str(e)}")
+
+@app.get("/api/v1/results/{product_id}", response_model=ProductAnalysisResponse)
+async def get_result(product_id: str):
+    try:
+        resp = await vision_client.get("results", f"{VISION_RESULTS_PATH}/{quote(product_id, safe='')}", settings.VISION_RESULTS_TIMEOUT)
+        return resp.json()
+    except httpx.HTTPStatusError as e:
+        raise upstream_error(e)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"Vision Service Error: {str(e)}")
+
+@app.get("/stats")
+def stats():
+    """
+    Upstream timing per route (connection setup vs time spent in the Vision Service
+    call), the load and health of each Vision Service worker, and requests abandoned
+    on an exhausted budget or a client disconnect.
+    """
+    return {"vision_client": vision_client.stats(), "upstreams": vision_client.upstreams(), "deadlines": deadline_stats.snapshot()}
+
+@app.get("/metrics")
+def metrics(request: Request):
+    return metrics_response(request.headers.get("accept"))
 
 @app.get("/")
 def root():
@@ -0,0 +1,69 @@
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from services.common import uploads
+from services.gateway.config import settings
+from services.gateway.main import app
+from services.gateway.upstream_pool import UpstreamPool
+from services.gateway.vision_client import vision_client
+from services.vision.main import app as vision_app, get_pipeline
+from services.vision.services.coalescing import SingleFlight
+from services.vision.services.pipeline import AnalysisPipeline
+from services.vision.services.vision_engine import MockVisionService
+
+@pytest.fixture
+def client(monkeypatch):
+    """
+    The gateway with its Vision Service calls served in-process by the vision app.
+    """
+    service = MockVisionService(latency_ms=0, latency_jitter_ms=0)
+    pipeline = AnalysisPipeline(service, service, SingleFlight())
+    vision_app.dependency_overrides[get_pipeline] = lambda: pipeline
+    monkeypatch.setattr(vision_client, "pool", UpstreamPool(["http://vision"]))
+    monkeypatch.setattr(vision_client, "client", httpx.AsyncClient(transport=httpx.ASGITransport(app=vision_app)))
+    try:
+        yield TestClient(app)
+    finally:
+        vision_app.dependency_overrides.clear()
+
+def test_analyze_batch_relays_results_in_input_order(client):
+    items = [
+        {"image_urls": ["http://example.com/a.jpg"], "product_id": "0"},
+        {"image_urls": ["http://example.com/b.jpg"]},
+        {"image_urls": ["http://example.com/c.jpg"], "product_id": "sku-c"},
+    ]
+    response = client.post("/api/v1/analyze-batch", json={"items": items})
+    assert response.status_code == 200
+    data = response.json()
+    assert [item["product_id"] for item in data["results"]] == ["0", None, "sku-c"]
+    assert data["succeeded"] == 3 and data["failed"] == 0
+
+    assert client.post("/api/v1/analyze-batch", json={"items": []}).status_code == 400
+
+def test_analyze_upload_streams_files_to_the_vision_service(client):
+    files = [("files", ("a.jpg", b"\xff\xd8a", "image/jpeg")), ("files", ("b.jpg", b"\xff\xd8b", "image/jpeg"))]
+    response = client.post("/api/v1/analyze/upload", files=files, data={"product_id": "sku-1"})
+    assert response.status_code == 200
+    assert response.json()["product_id"] == "sku-1"
+
+    assert client.post("/api/v1/analyze/upload", data={"product_id": "sku-1"}).status_code == 400
+
+def test_oversized_upload_closes_the_files_already_spooled(client, monkeypatch):
+    parsers = []
+
+    class RecordingParser(uploads.LimitedMultiPartParser):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            parsers.append(self)
+
+    monkeypatch.setattr(uploads, "LimitedMultiPartParser", RecordingParser)
+    monkeypatch.setattr(settings, "UPLOAD_MAX_FILE_BYTES", 16)
+    files = [("files", ("small.jpg", b"x" * 8, "image/jpeg")), ("files", ("big.jpg", b"x" * 64, "image/jpeg"))]
+    response = client.post("/api/v1/analyze/upload", files=files)
+    assert response.status_code == 413
+    assert "big.jpg" in response.json()["detail"]
+
+    [parser] = parsers
+    assert [file.filename for file in parser.spooled] == ["small.jpg", "big.jpg"]
+    assert all(file.file.closed for file in parser.spooled)
@@ -0,0 +1,70 @@
+import asyncio
+
+import httpx
+
+from services.gateway.config import settings
+from services.gateway.upstream_pool import UpstreamPool
+from services.gateway.vision_client import VisionClient
+
+URLS = ["http://w1", "http://w2", "http://w3"]
+
+def test_pick_prefers_the_least_outstanding_and_rotates_ties():
+    pool = UpstreamPool(URLS)
+    assert [pool.pick().base_url for _ in range(3)] == URLS
+
+    busy, idle = pool.upstreams[0], pool.upstreams[1]
+    pool.acquire(busy), pool.acquire(busy), pool.acquire(pool.upstreams[2])
+    assert pool.pick() is idle
+    assert pool.pick(exclude=[idle]) is pool.upstreams[2]
+
+def test_unhealthy_and_draining_upstreams_are_skipped():
+    def health(request: httpx.Request) -> httpx.Response:
+        if request.url.host == "w1":
+            raise httpx.ConnectError("refused", request=request)
+        return httpx.Response(503 if request.url.host == "w2" else 200)
+
+    async def scenario():
+        pool = UpstreamPool(URLS, unhealthy_after=2)
+        async with httpx.AsyncClient(transport=httpx.MockTransport(health)) as client:
+            for upstream in pool.upstreams:
+                await pool.check(client, upstream, timeout=1.0)
+            first = [upstream.healthy for upstream in pool.upstreams]
+            for upstream in pool.upstreams:
+                await pool.check(client, upstream, timeout=1.0)
+        return pool, first
+
+    pool, first = asyncio.run(scenario())
+    assert first == [True, False, True] # draining at once, connection errors after two in a row
+    assert [upstream.healthy for upstream in pool.upstreams] == [False, False, True]
+    assert {pool.pick().base_url for _ in range(5)} == {"http://w3"}
+
+    pool.mark_success(pool.upstreams[0])
+    assert pool.upstreams[0].healthy
+
+def test_requests_fail_over_to_another_worker(monkeypatch):
+    monkeypatch.setattr(settings, "VISION_RETRY_ATTEMPTS", 2)
+    served = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.host == "w1":
+            raise httpx.ConnectError("refused", request=request)
+        served.append(request.url.host)
+        return httpx.Response(200, json={"ok": True})
+
+    async def scenario():
+        vision = VisionClient()
+        vision.pool = UpstreamPool(URLS[:2], unhealthy_after=1)
+        vision.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            responses = [await vision.get("results", "/results", timeout=1.0) for _ in range(3)]
+        finally:
+            await vision.aclose()
+        return vision, responses
+
+    vision, responses = asyncio.run(scenario())
+    assert all(resp.json() == {"ok": True} for resp in responses)
+    assert served == ["w2"] * 3
+    w1, w2 = vision.pool.upstreams
+    assert not w1.healthy and w1.errors == 1 # out of rotation after the first failure
+    assert w2.requests == 3 and w1.outstanding == w2.outstanding == 0
+    assert vision.stats()["results"]["retries"] == 1
@@ -0,0 +1,83 @@
+import asyncio
+
+import httpx
+import pytest
+
+from services.gateway import vision_client as vision_client_module
+from services.gateway.config import settings
+from services.gateway.upstream_pool import UpstreamPool
+from services.gateway.vision_client import VisionClient
+
+def run(handler, calls: int = 1, urls=("http://w1",)):
+    """
+    Sends `calls` requests through a VisionClient whose workers answer with `handler`.
+    """
+    async def scenario():
+        vision = VisionClient()
+        vision.pool = UpstreamPool(list(urls))
+        vision.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        outcomes = []
+        try:
+            for _ in range(calls):
+                try:
+                    outcomes.append((await vision.post("analyze", "/process", timeout=5.0, json={})).status_code)
+                except httpx.HTTPStatusError as e:
+                    outcomes.append(e.response.status_code)
+        finally:
+            await vision.aclose()
+        return vision, outcomes
+
+    return asyncio.run(scenario())
+
+@pytest.mark.parametrize("status", [500, 502, 504])
+def test_responses_after_a_possible_provider_call_are_not_retried(status, monkeypatch):
+    monkeypatch.setattr(settings, "VISION_RETRY_ATTEMPTS", 3)
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.url.host)
+        return httpx.Response(status)
+
+    vision, outcomes = run(handler, urls=("http://w1", "http://w2"))
+    assert outcomes == [status] and seen == ["w1"]
+    assert vision.stats()["analyze"]["retries"] == 0
+
+def test_draining_worker_is_retried_with_jittered_backoff(monkeypatch):
+    monkeypatch.setattr(settings, "VISION_RETRY_ATTEMPTS", 3)
+    monkeypatch.setattr(settings, "VISION_RETRY_BACKOFF_BASE", 0.2)
+    monkeypatch.setattr(settings, "VISION_RETRY_BACKOFF_MAX", 0.5)
+    # The top of each jitter range, so the delays show the exponential cap
+    monkeypatch.setattr(vision_client_module.random, "uniform", lambda low, high: high)
+    backoff_delay = vision_client_module._backoff_delay
+    delays = []
+
+    def record(attempt):
+        delays.append(backoff_delay(attempt))
+        return 0.0 # no need to actually wait
+
+    monkeypatch.setattr(vision_client_module, "_backoff_delay", record)
+    answers = iter([503, 503, 503, 200])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(next(answers), json={})
+
+    vision, outcomes = run(handler)
+    assert outcomes == [200]
+    assert delays == [0.2, 0.4, 0.5] # doubled per attempt, capped at VISION_RETRY_BACKOFF_MAX
+    assert vision.stats()["analyze"]["retries"] == 3
+
+def test_retries_stop_after_the_configured_attempts(monkeypatch):
+    monkeypatch.setattr(settings, "VISION_RETRY_ATTEMPTS", 1)
+    monkeypatch.setattr(settings, "VISION_RETRY_BACKOFF_BASE", 0.0)
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.url.host)
+        if request.url.host == "w1":
+            raise httpx.ConnectError("refused", request=request)
+        return httpx.Response(503)
+
+    vision, outcomes = run(handler, urls=("http://w1", "http://w2"))
+    # A connection failure, then the other worker straight away, which is draining
+    assert seen == ["w1", "w2"] and outcomes == [503]
+    assert vision.stats()["analyze"]["retries"] == 1
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+class Upstream:
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+        self.healthy = True
+        self.failures = 0 # Consecutive failed health checks or undeliverable requests
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+
+    def as_dict(self) -> Dict:
+        return {
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+        }
+
+class UpstreamPool:
+    """
+    The Vision Service workers behind the gateway. Each request goes to the healthy
+    worker with the fewest outstanding requests (ties rotate, so an idle pool is used
+    round-robin). A worker is taken out after `unhealthy_after` consecutive failures
+    (health checks or requests that could not be delivered), or at once when its
+    /health says it is draining, and comes back on its next passing health check.
+    """
+    def __init__(self, base_urls: Iterable[str], unhealthy_after: int = 2):
+        self.upstreams = [Upstream(url) for url in base_urls]
+        if not self.upstreams:
+            raise ValueError("UpstreamPool needs at least one upstream")
+        self.unhealthy_after = unhealthy_after
+        self.turn = 0
+        self.health_task: Optional[asyncio.Task] = None
+
+    def pick(self, exclude: Iterable[Upstream] = ()) -> Upstream:
+        """
+        The least loaded healthy upstream not in `exclude`. Falls back to unhealthy
+        ones (and then to excluded ones) rather than failing outright: a check may
+        simply not have noticed a recovery yet.
+        """
+        excluded = set(exclude)
+        candidates = (
+            [u for u in self.upstreams if u.healthy and u not in excluded]
+            or [u for u in self.upstreams if u not in excluded]
+            or self.upstreams
+        )
+        start = self.turn % len(candidates)
+        self.turn += 1
+        rotated = candidates[start:] + candidates[:start]
+        # min() keeps the first of equals, so ties go to whoever is next in turn
+        return min(rotated, key=lambda upstream: upstream.outstanding)
+
+    def acquire(self, upstream: Upstream):
+        upstream.outstanding += 1
+        upstream.requests += 1
+
+    def release(self, upstream: Upstream):
+        upstream.outstanding -= 1
+
+    def mark_success(self, upstream: Upstream):
+        upstream.failures = 0
+        if not upstream.healthy:
+            upstream.healthy = True
+            logger.info("Vision upstream healthy", extra={"upstream": upstream.base_url})
+
+    def mark_failure(self, upstream: Upstream, draining: bool = False):
+        upstream.failures += 1
+        upstream.errors += 1
+        if upstream.healthy and (draining or upstream.failures >= self.unhealthy_after):
+            upstream.healthy = False
+            logger.warning(
+                "Vision upstream unhealthy",
+                extra={"upstream": upstream.base_url, "failures": upstream.failures, "draining": draining},
+            )
+
+    async def check(self, client: httpx.AsyncClient, upstream: Upstream, timeout: float):
+        try:
+            resp = await client.get(f"{upstream.base_url}/health", timeout=timeout)
+        except httpx.HTTPError:
+            self.mark_failure(upstream)
+            return
+        if resp.status_code == 200:
+            self.mark_success(upstream)
+        else:
+            # 503 is a worker draining before shutdown: stop sending it work right away
+            self.mark_failure(upstream, draining=resp.status_code == 503)
+
+    async def run_health_checks(self, client: httpx.AsyncClient, interval: float, timeout: float):
+        while True:
+            await asyncio.gather(*(self.check(client, upstream, timeout) for upstream in self.upstreams))
+            await asyncio.sleep(interval)
+
+    def start(self, client: httpx.AsyncClient, interval: float, timeout: float):
+        if self.health_task is None:
+            self.health_task = asyncio.create_task(self.run_health_checks(client, interval, timeout))
+
+    async def aclose(self):
+        if self.health_task is not None:
+            self.health_task.cancel()
+            await asyncio.gather(self.health_task, return_exceptions=True)
+            self.health_task = None
+
+    def snapshot(self) -> List[Dict]:
+        return [{"url": upstream.base_url, **upstream.as_dict()} for upstream in self.upstreams]
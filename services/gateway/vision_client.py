@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import random
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+import httpx
+
+from services.gateway.config import settings
+from services.gateway.upstream_pool import Upstream, UpstreamPool
+from services.common.deadlines import DEADLINE_EXCEEDED_HEADER, DEADLINE_HEADER, remaining
+from services.common.observability import current_trace, observe_stage
+
+logger = logging.getLogger(__name__)
+
+# Failures where the request never reached the Vision Service, so retrying cannot
+# double-bill an LLM call.
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+# 503 is a worker refusing work (draining or overloaded) before any provider call. A 502
+# or 504 may come back after the provider call was made and paid for, so they are not retried.
+RETRYABLE_STATUS_CODES = {503}
+
+class DeadlineExceeded(Exception):
+    """
+    The request's time budget ran out before the Vision Service could be asked.
+    """
+
+class RouteTimings:
+    """
+    Running totals for one gateway route, split into connection setup
+    (TCP connect + TLS handshake) and the upstream call itself.
+    """
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.retries = 0
+        self.errors = 0
+        self.deadline_exceeded = 0
+        self.connect_seconds = 0.0
+        self.upstream_seconds = 0.0
+
+    def as_dict(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reused_connections": self.requests - self.new_connections,
+            "retries": self.retries,
+            "errors": self.errors,
+            "deadline_exceeded": self.deadline_exceeded,
+            "connect_seconds_total": round(self.connect_seconds, 6),
+            "upstream_seconds_total": round(self.upstream_seconds, 6),
+            "connect_seconds_avg": round(self.connect_seconds / self.requests, 6) if self.requests else 0.0,
+            "upstream_seconds_avg": round(self.upstream_seconds / self.requests, 6) if self.requests else 0.0,
+        }
+
+class _ConnectTrace:
+    """
+    httpcore trace hook measuring how long the request spent opening a connection.
+    Stays at zero when a pooled keep-alive connection was reused.
+    """
+    def __init__(self):
+        self.connect_seconds = 0.0
+        self.opened_connection = False
+        self._started: Dict[str, float] = {}
+
+    async def __call__(self, event_name: str, info: Dict):
+        for phase in ("connect_tcp", "start_tls"):
+            if event_name == f"connection.{phase}.started":
+                self._started[phase] = time.perf_counter()
+                self.opened_connection = True
+            elif event_name in (f"connection.{phase}.complete", f"connection.{phase}.failed"):
+                started = self._started.pop(phase, None)
+                if started is not None:
+                    self.connect_seconds += time.perf_counter() - started
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """
+    Keeps a streamed response counted as outstanding on its upstream until it is closed.
+    """
+    def __init__(self, inner: httpx.AsyncByteStream, release: Callable[[], None]):
+        self.inner = inner
+        self.release = release
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self.inner:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self.inner.aclose()
+        finally:
+            if self.release is not None:
+                self.release()
+                self.release = None
+
+def upstream_urls() -> List[str]:
+    urls = [url.strip() for url in settings.VISION_SERVICE_URLS.split(",") if url.strip()]
+    return urls or [settings.VISION_SERVICE_BASE_URL]
+
+class VisionClient:
+    """
+    One pooled, keep-alive HTTP client for all gateway -> Vision Service traffic.
+    Opened in the app lifespan and shared by every request handler. Requests name a
+    path; the upstream pool picks which Vision Service worker serves it.
+    """
+    def __init__(self):
+        self.client: Optional[httpx.AsyncClient] = None
+        self.timings: Dict[str, RouteTimings] = {}
+        self.pool = UpstreamPool(upstream_urls(), settings.VISION_UNHEALTHY_AFTER)
+
+    async def start(self):
+        if self.client is not None:
+            return
+
+        http2 = settings.VISION_HTTP2
+        if http2:
+            try:
+                import h2 # noqa: F401
+            except ImportError:
+                logger.warning("VISION_HTTP2 is enabled but the 'h2' package is missing. Using HTTP/1.1.")
+                http2 = False
+
+        self.client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.VISION_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.VISION_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.VISION_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(settings.VISION_ANALYZE_TIMEOUT, connect=settings.VISION_CONNECT_TIMEOUT),
+        )
+        if len(self.pool.upstreams) > 1:
+            self.pool.start(self.client, settings.VISION_HEALTH_INTERVAL, settings.VISION_HEALTH_TIMEOUT)
+
+    async def aclose(self):
+        await self.pool.aclose()
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def post(self, route: str, path: str, timeout: float, **kwargs) -> httpx.Response:
+        return await self.request("POST", route, path, timeout, **kwargs)
+
+    async def get(self, route: str, path: str, timeout: float, **kwargs) -> httpx.Response:
+        return await self.request("GET", route, path, timeout, **kwargs)
+
+    async def stream(self, route: str, path: str, timeout: float, **kwargs) -> httpx.Response:
+        """
+        POSTs and returns as soon as the response headers arrive; the caller reads the
+        body incrementally (aiter_raw) and must close the response.
+        """
+        return await self.request("POST", route, path, timeout, stream=True, **kwargs)
+
+    async def request(
+        self, method: str, route: str, path: str, timeout: float, stream: bool = False, **kwargs
+    ) -> httpx.Response:
+        """
+        Sends a request to a Vision Service worker, retrying when it could not be
+        delivered: on another worker straight away when there is one, otherwise with
+        jittered exponential backoff. Raises httpx.HTTPStatusError for error responses.
+
+        `timeout` is capped by what is left of the request's budget, and the Vision
+        Service is told the time left (DEADLINE_HEADER) so it stops when we would.
+        Raises DeadlineExceeded when nothing is left.
+        """
+        if self.client is None:
+            # Handlers can run without the lifespan (e.g. TestClient outside a `with` block)
+            await self.start()
+
+        trace = current_trace()
+        if trace is not None:
+            # The Vision Service continues this request's trace as a child span
+            kwargs["headers"] = {**(kwargs.get("headers") or {}), "traceparent": trace.child().header()}
+
+        timings = self.timings.setdefault(route, RouteTimings())
+        attempt = 0
+        tried: List[Upstream] = []
+        while True:
+            # Uploaded files are streamed from disk, rewind them in case this is a retry
+            for _, file_tuple in kwargs.get("files") or []:
+                file_tuple[1].seek(0)
+
+            left = remaining()
+            budget = timeout if left is None else min(timeout, left)
+            if budget <= 0:
+                timings.deadline_exceeded += 1
+                raise DeadlineExceeded(f"No time left for {method} {path}")
+            kwargs["headers"] = {**(kwargs.get("headers") or {}), DEADLINE_HEADER: f"{budget:.3f}"}
+            request_timeout = httpx.Timeout(budget, connect=min(budget, settings.VISION_CONNECT_TIMEOUT))
+
+            upstream = self.pool.pick(exclude=tried)
+            tried.append(upstream)
+            self.pool.acquire(upstream)
+            trace = _ConnectTrace()
+            started = time.perf_counter()
+            try:
+                upstream_request = self.client.build_request(
+                    method, upstream.base_url + path, timeout=request_timeout, extensions={"trace": trace}, **kwargs
+                )
+                resp = await self.client.send(upstream_request, stream=stream)
+            except RETRYABLE_ERRORS:
+                self.pool.release(upstream)
+                self.pool.mark_failure(upstream)
+                if attempt >= settings.VISION_RETRY_ATTEMPTS:
+                    timings.errors += 1
+                    raise
+            except httpx.TimeoutException as e:
+                self.pool.release(upstream)
+                timings.errors += 1
+                if left is not None and left <= timeout:
+                    # The caller's budget ran out, not the route's timeout
+                    timings.deadline_exceeded += 1
+                    raise DeadlineExceeded(f"Time budget ran out waiting for {method} {path}") from e
+                raise
+            except BaseException:
+                self.pool.release(upstream)
+                raise
+            else:
+                elapsed = time.perf_counter() - started
+                observe_stage("vision_hop", elapsed)
+                timings.requests += 1
+                timings.new_connections += trace.opened_connection
+                timings.connect_seconds += trace.connect_seconds
+                timings.upstream_seconds += elapsed - trace.connect_seconds
+
+                if stream:
+                    resp.stream = _ReleasingStream(resp.stream, lambda upstream=upstream: self.pool.release(upstream))
+                else:
+                    self.pool.release(upstream)
+                if resp.status_code not in RETRYABLE_STATUS_CODES:
+                    self.pool.mark_success(upstream)
+                timings.deadline_exceeded += DEADLINE_EXCEEDED_HEADER in resp.headers
+                if resp.status_code not in RETRYABLE_STATUS_CODES or attempt >= settings.VISION_RETRY_ATTEMPTS:
+                    if resp.is_error:
+                        timings.errors += 1
+                        if stream:
+                            # Error bodies are small; read them so callers can relay the detail
+                            await resp.aread()
+                    resp.raise_for_status()
+                    return resp
+                if stream:
+                    await resp.aclose()
+
+            attempt += 1
+            timings.retries += 1
+            if len(tried) >= len(self.pool.upstreams):
+                # Every worker was tried; give them a moment before going round again
+                tried = []
+                await asyncio.sleep(_backoff_delay(attempt))
+
+    def stats(self) -> Dict:
+        return {route: timing.as_dict() for route, timing in self.timings.items()}
+
+    def upstreams(self) -> List[Dict]:
+        return self.pool.snapshot()
+
+def _backoff_delay(attempt: int) -> float:
+    # "Full jitter": spreads retries from many gateway requests so they do not hit the
+    # Vision Service in lockstep after a blip.
+    cap = min(settings.VISION_RETRY_BACKOFF_MAX, settings.VISION_RETRY_BACKOFF_BASE * (2 ** (attempt - 1)))
+    return random.uniform(0, cap)
+
+vision_client = VisionClient()
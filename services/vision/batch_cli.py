@@ -0,0 +1,101 @@
+"""
+Command-line runner for analyzing a whole product catalog.
+
+Usage:
+    python -m services.vision.batch_cli A1.0_data_product_images.csv --out results.jsonl
+    python -m services.vision.batch_cli catalog.csv --format parquet --out results/ --concurrency 16
+
+Re-running the same command resumes from the checkpoint file (defaults to <out>.ckpt).
+
+Nightly re-runs can be incremental: with --manifest, only products whose images,
+prompt or model changed since the last run are analyzed, and the other results are
+carried forward from the manifest:
+    python -m services.vision.batch_cli catalog.csv --out results-2026-10-17.jsonl --manifest catalog.manifest
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from services.vision.config import settings
+from services.vision.services.batch_runner import (
+    BatchRunner,
+    Checkpoint,
+    Fingerprinter,
+    JsonlSink,
+    Manifest,
+    ParquetSink,
+    iter_catalog,
+)
+from services.vision.services.pipeline import build_image_fetcher, build_pipeline
+from services.vision.services.prompt_templates import get_template
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run visual analysis over a product catalog CSV.")
+    parser.add_argument("csv_path", help="Catalog CSV (Product Id, Image Count, Image1..Image14)")
+    parser.add_argument("--out", required=True, help="JSONL file, or directory of parts for parquet")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl")
+    parser.add_argument("--concurrency", type=int, default=settings.BATCH_CONCURRENCY)
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <out>.ckpt)")
+    parser.add_argument("--no-resume", action="store_true", help="Ignore an existing checkpoint and overwrite the output")
+    parser.add_argument("--errors", help="Write failed products as JSONL to this file")
+    parser.add_argument("--manifest", help="Incremental mode: re-analyze only what changed since the run that wrote this manifest")
+    parser.add_argument(
+        "--no-image-digests", action="store_true", help="Incremental mode: compare image URLs only, without downloading images"
+    )
+    return parser.parse_args(argv)
+
+async def run(args: argparse.Namespace) -> int:
+    checkpoint_path = args.checkpoint or args.out.rstrip("/\\") + ".ckpt"
+    if args.no_resume:
+        open(checkpoint_path, "w").close()
+
+    if args.format == "parquet":
+        sink = ParquetSink(args.out, append=not args.no_resume)
+    else:
+        sink = JsonlSink(args.out, append=not args.no_resume)
+
+    pipeline = build_pipeline()
+    manifest = fingerprinter = digest_fetcher = None
+    if args.manifest:
+        manifest = Manifest(args.manifest)
+        if not args.no_image_digests:
+            digest_fetcher = pipeline.image_fetcher or build_image_fetcher()
+        model = getattr(pipeline.provider, "model", type(pipeline.provider).__name__)
+        fingerprinter = Fingerprinter(get_template("single", model).version, model, digest_fetcher)
+
+    runner = BatchRunner(
+        service=pipeline.service,
+        sink=sink,
+        checkpoint=Checkpoint(checkpoint_path),
+        concurrency=args.concurrency,
+        manifest=manifest,
+        fingerprinter=fingerprinter,
+    )
+    try:
+        summary = await runner.run(iter_catalog(args.csv_path))
+    finally:
+        if manifest is not None:
+            manifest.close()
+        if digest_fetcher is not None and digest_fetcher is not pipeline.image_fetcher:
+            await digest_fetcher.aclose()
+        await pipeline.aclose()
+
+    if args.errors and summary.failures:
+        with open(args.errors, "w", encoding="utf-8") as f:
+            for product_id, error in summary.failures.items():
+                f.write(json.dumps({"product_id": product_id, "error": error}) + "\n")
+
+    print(
+        f"Processed {summary.total} products: {summary.succeeded} succeeded, "
+        f"{summary.failed} failed, {summary.skipped} skipped (already done)."
+    )
+    if manifest is not None:
+        print(f"Incremental: {summary.unchanged} unchanged (carried forward), {summary.removed} removed from the catalog.")
+    return 1 if summary.failed else 0
+
+def main(argv=None) -> int:
+    return asyncio.run(run(parse_args(argv)))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,11 +4,122 @@ class Settings(BaseSettings):
     PROJECT_NAME: str = "AI-Powered Visual Product Measurement System"
     API_V1_STR: str = "/api/v1"
     CORS_ORIGINS: list[str] = ["*"] # Allow all for prototype simplicity
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json" # options: "json", "text"
 
     # LLM Configuration
     GROQ_API_KEY: str = ""
     OPENAI_API_KEY: str = ""
-    LLM_PROVIDER: str = "mock" # options: "mock", "groq", "openai"
+    LLM_PROVIDER: str = "mock" # options: "mock", "groq", "openai"; a comma-separated list routes across them
+    GROQ_BASE_URL: str = "" # Override the Groq endpoint, e.g. a local fake provider
+    MOCK_LATENCY_MS: float = 0.0 # Simulated latency of the mock provider (load testing)
+    MOCK_LATENCY_JITTER_MS: float = 0.0 # +/- uniform jitter around MOCK_LATENCY_MS
+    MOCK_CPU_MS: float = 0.0 # CPU time burned per mock call, standing in for per-request work (scaling tests)
+    MOCK_LATENCY_DISTRIBUTION: str = "uniform" # options: "uniform" (MOCK_LATENCY_MS +/- jitter), "lognormal" (median MOCK_LATENCY_MS), "exponential" (mean MOCK_LATENCY_MS)
+    MOCK_LATENCY_SIGMA: float = 0.5 # Spread of the lognormal distribution; larger means a longer tail
+    MOCK_ERROR_RATE: float = 0.0 # Fraction of mock calls failing with a provider error
+    MOCK_RATE_LIMIT_RATE: float = 0.0 # Fraction of mock calls rejected as rate limited (429)
+    MOCK_RETRY_AFTER_SECONDS: float = 1.0 # Retry-After of injected 429s
+    MOCK_SEED: int = 0 # Changes every mock answer; the same seed gives the same answers in every process
+
+    # Provider Rate Limiting (token bucket + AIMD concurrency around the Groq client)
+    GROQ_REQUESTS_PER_MINUTE: float = 30.0
+    GROQ_BURST: int = 5
+    GROQ_INITIAL_CONCURRENCY: int = 4
+    GROQ_MIN_CONCURRENCY: int = 1
+    GROQ_MAX_CONCURRENCY: int = 16
+    GROQ_LATENCY_TARGET_SECONDS: float = 15.0 # Slower calls shrink the concurrency limit
+    PROVIDER_QUEUE_TIMEOUT_SECONDS: float = 30.0 # Max wait for admission before answering 429
+
+    # Response Parsing (malformed model JSON is repaired; a few bad fields are re-asked for)
+    RESPONSE_FIELD_RETRY_MAX_FIELDS: int = 4 # More invalid fields than this falls back instead; 0 disables
+
+    # Prompt Templates (static request parts are serialized once; input tokens are estimated before each call)
+    PROMPT_TOKENS_PER_IMAGE: int = 1601 # Estimated input tokens per image; compare with "prompts" in /stats and tune
+
+    # Provider Routing (when LLM_PROVIDER lists several providers)
+    ROUTER_WINDOW: int = 100 # Recent calls per provider behind the latency/error statistics
+    ROUTER_WINDOW_SECONDS: float = 300.0 # Older calls are forgotten, so recovered providers get re-measured
+    ROUTER_MIN_SAMPLES: int = 5 # Providers with fewer recent calls are tried first
+    ROUTER_BREAKER_FAILURES: int = 5 # Consecutive failures that open a provider's circuit
+    ROUTER_BREAKER_RESET_SECONDS: float = 30.0 # How long an open circuit rejects calls before a trial
+    ROUTER_HEDGE_ENABLED: bool = False # Duplicate slow calls to the next provider
+    ROUTER_HEDGE_QUANTILE: float = 0.95 # Hedge once a call runs longer than this latency quantile
+    ROUTER_HEDGE_MIN_DELAY_MS: float = 50.0
+    ROUTER_HEDGE_MAX_DELAY_MS: float = 30000.0
+
+    # Provider Micro-Batching (several concurrent products share one LLM request)
+    MICRO_BATCH_ENABLED: bool = False
+    MICRO_BATCH_MAX_SIZE: int = 4 # Products per provider request
+    MICRO_BATCH_MAX_WAIT_MS: float = 50.0 # How long the first product waits for company
+    MICRO_BATCH_MAX_IMAGES: int = 5 # Provider limit on images per request
+
+    # Upload Limits (checked while the body streams in, before it is fully read)
+    UPLOAD_MAX_FILES: int = 14
+    UPLOAD_MAX_FILE_BYTES: int = 10 * 1024 * 1024
+    UPLOAD_MAX_REQUEST_BYTES: int = 50 * 1024 * 1024
+
+    # Result Cache (keyed on image digest + model + system prompt hash)
+    RESULT_CACHE_BACKEND: str = "memory" # options: "memory", "sqlite", "none"
+    RESULT_CACHE_MAX_ENTRIES: int = 10000
+    RESULT_CACHE_TTL_SECONDS: float = 7 * 24 * 3600.0
+    RESULT_CACHE_PATH: str = "vision_result_cache.sqlite3" # Used by the sqlite backend
+
+    # Image Preprocessing (fetch, downscale and re-encode before the provider call)
+    IMAGE_PREPROCESS_ENABLED: bool = False # Requires Pillow
+    IMAGE_MAX_EDGE: int = 1024 # Longest edge in pixels after downscaling
+    IMAGE_OUTPUT_FORMAT: str = "JPEG" # options: "JPEG", "WEBP", "PNG"
+    IMAGE_OUTPUT_QUALITY: int = 85
+    IMAGE_PREPROCESS_WORKERS: int = 2 # Decode/encode worker processes
+
+    # Image Fetching (shared downloader used by preprocessing and prefetching)
+    IMAGE_PREFETCH_ENABLED: bool = False # Download images here instead of letting the provider fetch URLs
+    IMAGE_FETCH_TIMEOUT: float = 20.0
+    IMAGE_FETCH_PER_HOST_LIMIT: int = 8 # Concurrent downloads per host
+    IMAGE_FETCH_MAX_BYTES: int = 20 * 1024 * 1024 # Larger images are left for the provider to fetch
+    IMAGE_FETCH_MAX_REDIRECTS: int = 3
+    IMAGE_FETCH_ALLOW_PRIVATE_HOSTS: bool = False # Allow images on loopback/private addresses (local development)
+    IMAGE_CACHE_DIR: str = ".image_cache" # Empty string disables the on-disk image cache
+    IMAGE_CACHE_MAX_BYTES: int = 1024 * 1024 * 1024
+
+    # Perceptual Dedup (reuse the analysis of a near-identical image set, e.g. one frame in several sizes)
+    DEDUP_ENABLED: bool = False # Requires Pillow and numpy; turns on image prefetching
+    DEDUP_HASH_ALGORITHM: str = "phash" # options: "phash", "dhash"
+    DEDUP_MAX_DISTANCE: int = 6 # Max differing bits (of 64) for two images to count as the same
+    DEDUP_INDEX_PATH: str = "vision_dedup_index.sqlite3" # Empty string keeps the index in memory only
+    DEDUP_MAX_ENTRIES: int = 100000
+
+    # Results Store (columnar copy of every analysis with a product_id, queried via /results)
+    RESULTS_STORE_ENABLED: bool = True
+    RESULTS_STORE_DIR: str = ".vision_results" # Empty string keeps results in memory only
+    RESULTS_FLUSH_ROWS: int = 1000 # Rows buffered before they are written as one segment
+    RESULTS_FLUSH_SECONDS: float = 30.0 # ...or at the next result after this long without a write
+    RESULTS_COMPACT_FRACTION: float = 0.3 # Compact once superseded rows are this share of all rows...
+    RESULTS_COMPACT_MIN_ROWS: int = 1000 # ...and at least this many
+    SIMILARITY_EXACT_THRESHOLD: int = 50000 # Up to this many candidate rows, k-NN is a plain numpy scan
+    SIMILARITY_GRID_CELL_WIDTH: float = 1.0 # Grid cell size on the -5..5 score scale, for larger searches
+
+    # Batch Processing
+    BATCH_CONCURRENCY: int = 8 # Max products analyzed in parallel per batch
+    BATCH_MAX_ITEMS: int = 500 # Max products accepted by a single /process-batch call
+
+    # Async Jobs (POST /jobs returns immediately; workers drain a persistent queue)
+    JOB_QUEUE_PATH: str = "vision_jobs.sqlite3"
+    JOB_WORKERS: int = 4 # Jobs analyzed concurrently by this process
+    JOB_MAX_PENDING: int = 10000 # Submissions beyond this get 429
+    JOB_MAX_ATTEMPTS: int = 3 # Provider errors are retried with backoff up to this many runs
+    JOB_RETENTION_SECONDS: float = 24 * 3600.0 # Finished jobs are purged after this
+    JOB_CALLBACK_TIMEOUT: float = 10.0
+    JOB_CALLBACK_ATTEMPTS: int = 3
+    JOB_CALLBACK_SECRET: str = "" # When set, callbacks carry an HMAC-SHA256 X-Signature header
+    JOB_REQUEUE_ON_START: bool = True # Off when several processes share JOB_QUEUE_PATH (run_workers requeues once at launch)
+    JOB_OWNER: str = "" # Id this process claims jobs under (random when empty); run_workers sets worker-N so a restarted worker's jobs can be requeued
+
+    # Multi-Worker Deployment (python -m services.vision.run_workers)
+    WORKER_DRAIN_SECONDS: float = 5.0 # After SIGTERM, /health answers 503 this long (still serving) so the gateway moves traffic away
+    WORKER_SHUTDOWN_TIMEOUT: float = 30.0 # Then in-flight requests and running jobs get this long to finish
+    RESULTS_STORE_WRITER: str = "" # Per-worker subdirectory of RESULTS_STORE_DIR; set by run_workers so workers can share it
+    RESULTS_REFRESH_SECONDS: float = 1.0 # How often /results looks for segments flushed by the other workers
 
     class Config:
         env_file = ".env"
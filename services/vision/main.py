@@ -1,26 +1,286 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional
-from services.vision.services.vision_engine import get_vision_service
+from contextlib import asynccontextmanager
+import asyncio
+import math
+from fastapi import FastAPI, HTTPException, Depends, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from services.common.deadlines import DeadlineMiddleware, DeadlineStats
+from services.common.observability import ObservabilityMiddleware, configure_logging, metrics_response, stage
+from services.common.uploads import UPLOAD_REQUEST_BODY, receive_upload
+from pydantic import BaseModel, HttpUrl
+from typing import Annotated, List, Optional
+from services.vision.services.pipeline import AnalysisPipeline, build_pipeline
+from services.vision.services.batch_runner import CatalogProduct, iter_batch_results, iter_indexed_results
+from services.vision.services.job_queue import JobStore, JobWorkerPool, QueueFull
+from services.common.schemas import (
+    BatchAnalysisResponse,
+    BatchItemResult,
+    JobStatus,
+    JobStatusResponse,
+    JobSubmitted,
+    ProductAnalysisResponse,
+    ResultPage,
+    ResultQuery,
+    SimilarityResponse,
+    SimilarProduct,
+    SimilarQuery,
+)
+from services.vision.models.image_payload import ImagePayload
+from services.vision.services.rate_limiter import ProviderOverloadedError
+from services.vision.services.results_store import DIMENSIONS, ResultsStore
 from services.vision.config import settings
 
-app = FastAPI(title="Vision Service", version="1.0.0")
+configure_logging("vision", settings.LOG_LEVEL, settings.LOG_FORMAT)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Provider clients, pools and caches are built once and shared by every request
+    app.state.pipeline = build_pipeline()
+    app.state.jobs = JobWorkerPool(
+        JobStore(settings.JOB_QUEUE_PATH, settings.JOB_OWNER or None),
+        app.state.pipeline.service,
+        concurrency=settings.JOB_WORKERS,
+        max_attempts=settings.JOB_MAX_ATTEMPTS,
+        callback_timeout=settings.JOB_CALLBACK_TIMEOUT,
+        callback_attempts=settings.JOB_CALLBACK_ATTEMPTS,
+        callback_secret=settings.JOB_CALLBACK_SECRET,
+        retention_seconds=settings.JOB_RETENTION_SECONDS,
+        on_result=app.state.pipeline.record,
+        requeue_on_start=settings.JOB_REQUEUE_ON_START,
+    )
+    app.state.jobs.start()
+    yield
+    await app.state.jobs.aclose(settings.WORKER_SHUTDOWN_TIMEOUT)
+    await app.state.pipeline.aclose()
+
+app = FastAPI(title="Vision Service", version="1.0.0", lifespan=lifespan)
+# Cancels the handler, and with it the provider call, when the caller's budget runs out or it disconnects
+deadline_stats = DeadlineStats()
+app.add_middleware(DeadlineMiddleware, service="vision", stats=deadline_stats)
+app.add_middleware(ObservabilityMiddleware)
+
+@app.exception_handler(ProviderOverloadedError)
+async def provider_overloaded_handler(request: Request, exc: ProviderOverloadedError):
+    headers = {}
+    if exc.retry_after is not None:
+        headers["Retry-After"] = str(max(1, math.ceil(exc.retry_after)))
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers=headers)
+
+def get_pipeline(request: Request) -> AnalysisPipeline:
+    pipeline = getattr(request.app.state, "pipeline", None)
+    if pipeline is None:
+        # Running without the lifespan (e.g. TestClient outside a `with` block)
+        pipeline = request.app.state.pipeline = build_pipeline()
+    return pipeline
+
+def get_jobs(request: Request) -> JobWorkerPool:
+    jobs = getattr(request.app.state, "jobs", None)
+    if jobs is None:
+        # Workers are background tasks and only exist while the lifespan is running
+        raise HTTPException(status_code=503, detail="Job workers are not running.")
+    return jobs
 
 class AnalysisRequest(BaseModel):
     image_urls: List[str]
     product_id: Optional[str] = None
 
+class JobRequest(AnalysisRequest):
+    callback_url: Optional[HttpUrl] = None
+
+class BatchAnalysisRequest(BaseModel):
+    items: List[AnalysisRequest]
+
 @app.post("/process")
-async def process_images(request: AnalysisRequest):
+async def process_images(request: AnalysisRequest, pipeline: AnalysisPipeline = Depends(get_pipeline)):
     try:
-        service = get_vision_service()
-        result = await service.analyze_images(request.image_urls)
+        result = await pipeline.service.analyze_images(request.image_urls)
         if request.product_id:
             result.product_id = request.product_id
+        await pipeline.record([result])
         return result
+    except ProviderOverloadedError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/process-upload", openapi_extra=UPLOAD_REQUEST_BODY)
+async def process_upload(request: Request, pipeline: AnalysisPipeline = Depends(get_pipeline)):
+    """
+    Binary counterpart of /process: images arrive as multipart file parts and stay
+    raw bytes until the provider boundary.
+    """
+    with stage("upload_read"):
+        files, product_id = await receive_upload(
+            request,
+            max_files=settings.UPLOAD_MAX_FILES,
+            max_file_bytes=settings.UPLOAD_MAX_FILE_BYTES,
+            max_request_bytes=settings.UPLOAD_MAX_REQUEST_BYTES,
+        )
+        try:
+            images = [ImagePayload(data=await file.read(), mime_type=file.content_type or "image/jpeg") for file in files]
+        finally:
+            for file in files:
+                await file.close()
+    if not images:
+        raise HTTPException(status_code=400, detail="At least one image file must be uploaded.")
+
+    try:
+        result = await pipeline.service.analyze_images(images)
+        if product_id:
+            result.product_id = product_id
+        await pipeline.record([result])
+        return result
+    except ProviderOverloadedError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _batch_products(request: BatchAnalysisRequest) -> List[CatalogProduct]:
+    if not request.items:
+        raise HTTPException(status_code=400, detail="At least one item must be provided.")
+    if len(request.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(request.items)} items (max {settings.BATCH_MAX_ITEMS}).",
+        )
+    # Results are matched up by position, so items may omit product_id (or repeat one)
+    return [CatalogProduct(product_id=item.product_id, image_urls=item.image_urls) for item in request.items]
+
+@app.post("/process-batch", response_model=BatchAnalysisResponse)
+async def process_batch(request: BatchAnalysisRequest, pipeline: AnalysisPipeline = Depends(get_pipeline)):
+    products = _batch_products(request)
+    results: List[Optional[BatchItemResult]] = [None] * len(products)
+    async for index, item in iter_indexed_results(pipeline.service, products, settings.BATCH_CONCURRENCY):
+        results[index] = item
+    await pipeline.record(item.result for item in results)
+
+    failed = sum(1 for item in results if item.error is not None)
+    return BatchAnalysisResponse(results=results, succeeded=len(results) - failed, failed=failed)
+
+# Stop proxies (nginx) from buffering the stream, which would defeat its purpose
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+@app.post("/process-stream")
+async def process_stream(
+    body: BatchAnalysisRequest,
+    request: Request,
+    format: Optional[str] = None,
+    pipeline: AnalysisPipeline = Depends(get_pipeline),
+):
+    """
+    Streams each product's result (or error) as soon as it finishes, in completion
+    order. NDJSON by default; Server-Sent Events with ?format=sse or
+    `Accept: text/event-stream`, ending with a `done` event carrying the totals.
+    """
+    products = _batch_products(body)
+    if format is None:
+        format = "sse" if "text/event-stream" in request.headers.get("accept", "") else "ndjson"
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'sse'.")
+
+    async def events():
+        succeeded = failed = 0
+        async for item in iter_batch_results(pipeline.service, products, settings.BATCH_CONCURRENCY):
+            await pipeline.record([item.result])
+            if item.error is None:
+                succeeded += 1
+            else:
+                failed += 1
+            if format == "sse":
+                yield f"event: {'error' if item.error else 'result'}\ndata: {item.model_dump_json()}\n\n"
+            else:
+                yield item.model_dump_json() + "\n"
+        if format == "sse":
+            # An explicit end marker, otherwise EventSource clients reconnect when the stream closes
+            yield f'event: done\ndata: {{"succeeded": {succeeded}, "failed": {failed}}}\n\n'
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type, headers=STREAM_HEADERS)
+
+@app.post("/jobs", response_model=JobSubmitted, status_code=202)
+async def submit_job(request: JobRequest, jobs: JobWorkerPool = Depends(get_jobs)):
+    """
+    Queues an analysis and returns at once. Poll /jobs/{job_id}, or pass a
+    callback_url to receive the final status as a POST.
+    """
+    if not request.image_urls:
+        raise HTTPException(status_code=400, detail="At least one image URL must be provided.")
+    try:
+        job_id = await jobs.submit(
+            request.image_urls,
+            request.product_id,
+            str(request.callback_url) if request.callback_url else None,
+            settings.JOB_MAX_PENDING,
+        )
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+    return JobSubmitted(job_id=job_id, status=JobStatus.QUEUED, status_url=f"/jobs/{job_id}")
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job(job_id: str, jobs: JobWorkerPool = Depends(get_jobs)):
+    status = await asyncio.to_thread(jobs.store.get, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return status
+
+async def get_results_store(pipeline: AnalysisPipeline = Depends(get_pipeline)) -> ResultsStore:
+    if pipeline.results_store is None:
+        raise HTTPException(status_code=404, detail="The results store is disabled.")
+    # Picks up what the other workers sharing the store directory have flushed
+    await asyncio.to_thread(pipeline.results_store.refresh, settings.RESULTS_REFRESH_SECONDS)
+    return pipeline.results_store
+
+@app.get("/results", response_model=ResultPage)
+async def query_results(query: Annotated[ResultQuery, Query()], store: ResultsStore = Depends(get_results_store)):
+    """
+    Stored analyses matching the filters (e.g. ?formality_min=3&is_transparent=true),
+    served from the columnar store without any LLM calls.
+    """
+    total, results = await asyncio.to_thread(store.query, query)
+    return ResultPage(total=total, results=results)
+
+@app.get("/results/similar", response_model=SimilarityResponse)
+async def similar_results(query: Annotated[SimilarQuery, Query()], pipeline: AnalysisPipeline = Depends(get_pipeline)):
+    """
+    The stored products closest to `product_id` (or to explicit dimension values, which
+    also override the reference product's) across the five continuous dimensions,
+    e.g. ?product_id=sku-1&frame_shape=Round&limit=20.
+    """
+    store = await get_results_store(pipeline)
+    index = pipeline.similarity
+    target = [getattr(query, name) for name in DIMENSIONS]
+    if query.product_id is not None:
+        stored = await asyncio.to_thread(index.target_of, query.product_id)
+        if stored is None:
+            raise HTTPException(status_code=404, detail="No stored result for this product.")
+        target = [given if given is not None else value for given, value in zip(target, stored)]
+    elif None in target:
+        raise HTTPException(status_code=400, detail=f"Give a product_id or all of: {', '.join(DIMENSIONS)}.")
+
+    matches = await asyncio.to_thread(index.similar, target, query.limit, query, query.product_id)
+    return SimilarityResponse(results=[
+        SimilarProduct(product_id=result.product_id, distance=round(distance, 4), result=result)
+        for result, distance in matches
+    ])
+
+@app.get("/results/{product_id:path}", response_model=ProductAnalysisResponse)
+async def get_result(product_id: str, store: ResultsStore = Depends(get_results_store)):
+    result = await asyncio.to_thread(store.get, product_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="No stored result for this product.")
+    return result
+
+@app.get("/stats")
+def stats(request: Request, pipeline: AnalysisPipeline = Depends(get_pipeline)):
+    jobs = getattr(request.app.state, "jobs", None)
+    return {**pipeline.stats(), "jobs": jobs.snapshot() if jobs is not None else None, "deadlines": deadline_stats.snapshot()}
+
+@app.get("/metrics")
+def metrics(request: Request):
+    return metrics_response(request.headers.get("accept"))
+
 @app.get("/health")
-def health_check():
+def health_check(request: Request):
+    if getattr(request.app.state, "draining", False):
+        # Still serving, but shutting down: load balancers should stop sending work here
+        return JSONResponse(status_code=503, content={"status": "draining", "service": "vision"})
     return {"status": "ok", "service": "vision"}
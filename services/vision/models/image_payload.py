@@ -0,0 +1,42 @@
+import base64
+import hashlib
+from dataclasses import dataclass
+from typing import Union
+
+from services.common.observability import stage
+
+@dataclass(frozen=True)
+class ImagePayload:
+    """
+    Raw image bytes received from an upload. Kept binary through the service and only
+    base64-encoded at the provider boundary, when a provider needs a data: URL.
+    """
+    data: bytes
+    mime_type: str = "image/jpeg"
+
+    def to_data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{base64.b64encode(self.data).decode('ascii')}"
+
+    @property
+    def digest(self) -> str:
+        return hashlib.sha256(self.data).hexdigest()
+
+# What IVisionService.analyze_images accepts per image: a URL (http(s) or data:) or raw bytes
+ImageSource = Union[str, ImagePayload]
+
+def image_identity(image: ImageSource) -> str:
+    """
+    Stable string identifying an image: the URL itself, or a content digest for bytes.
+    """
+    if isinstance(image, ImagePayload):
+        return f"sha256:{image.digest}"
+    return image
+
+def image_url(image: ImageSource) -> str:
+    """
+    URL form of an image for providers that take image_url message parts.
+    """
+    if isinstance(image, ImagePayload):
+        with stage("base64_encode"):
+            return image.to_data_url()
+    return image
@@ -0,0 +1,190 @@
+"""
+Runs several Vision Service worker processes on consecutive ports, to sit behind the
+gateway's upstream pool.
+
+Usage:
+    python -m services.vision.run_workers --workers 4 --port 8001
+    # and point the gateway at them:
+    VISION_SERVICE_URLS=http://127.0.0.1:8001,http://127.0.0.1:8002,http://127.0.0.1:8003,http://127.0.0.1:8004
+
+The workers share the job queue, the result cache (the in-memory backend is switched
+to sqlite so a hit on one worker is a hit on all), the dedup index file (a lookup
+that misses loads what the other workers added since) and the results store
+directory (one writer subdirectory per worker). A worker that dies has its
+running jobs requeued and is restarted, after a growing delay if it keeps dying
+soon after starting (e.g. its port is taken).
+
+SIGTERM or Ctrl+C drains every worker: /health answers 503 for WORKER_DRAIN_SECONDS
+while requests are still served, so the gateway moves traffic away first; then
+in-flight requests and running jobs get WORKER_SHUTDOWN_TIMEOUT to finish. A second
+signal stops at once.
+"""
+import argparse
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+import uvicorn
+
+from services.common.observability import configure_logging
+from services.vision.config import settings
+from services.vision.services.job_queue import JobStore
+
+logger = logging.getLogger(__name__)
+
+class DrainingServer(uvicorn.Server):
+    """
+    uvicorn server that, on the first exit signal, marks the app as draining and
+    only starts the graceful shutdown `drain_seconds` later.
+    """
+    def __init__(self, config: uvicorn.Config, drain_seconds: float):
+        super().__init__(config)
+        self.drain_seconds = drain_seconds
+        self.draining = False
+
+    def handle_exit(self, sig, frame):
+        if self.draining:
+            # Second signal: skip the rest of the drain and the graceful shutdown
+            self.should_exit = self.force_exit = True
+            return
+        self.draining = True
+        self.config.app.state.draining = True
+        logger.info("Draining worker", extra={"port": self.config.port, "drain_seconds": self.drain_seconds})
+        timer = threading.Timer(self.drain_seconds, super().handle_exit, (sig, frame))
+        timer.daemon = True
+        timer.start()
+
+def serve(host: str, port: int):
+    from services.vision.main import app
+
+    config = uvicorn.Config(
+        app, host=host, port=port, log_config=None, timeout_graceful_shutdown=settings.WORKER_SHUTDOWN_TIMEOUT
+    )
+    DrainingServer(config, settings.WORKER_DRAIN_SECONDS).run()
+
+def worker_owner(index: int) -> str:
+    # Stable across restarts, so the supervisor knows whose jobs a dead worker left running
+    return f"worker-{index}"
+
+def worker_env(index: int) -> Dict[str, str]:
+    env = {
+        **os.environ,
+        "JOB_REQUEUE_ON_START": "false",
+        "JOB_OWNER": worker_owner(index),
+        "RESULTS_STORE_WRITER": f"worker-{index}",
+    }
+    if settings.RESULT_CACHE_BACKEND.lower() == "memory":
+        env["RESULT_CACHE_BACKEND"] = "sqlite"
+    return env
+
+class Supervisor:
+    RESTART_BACKOFF_BASE = 1.0 # Delay before restarting a worker that died soon after starting...
+    RESTART_BACKOFF_MAX = 30.0 # ...doubling with each such death, up to this
+    STABLE_AFTER = 30.0 # A worker that ran this long restarts at once
+
+    def __init__(self, workers: int, host: str, port: int):
+        self.host = host
+        self.ports = [port + i for i in range(workers)]
+        self.processes: List[Optional[subprocess.Popen]] = [None] * workers
+        self.started_at = [0.0] * workers
+        self.quick_deaths = [0] * workers
+        self.restart_at: List[Optional[float]] = [None] * workers
+        self.signals = 0
+
+    def spawn(self, index: int):
+        # Own session, so a terminal's Ctrl+C reaches the workers only through stop()
+        self.processes[index] = subprocess.Popen(
+            [sys.executable, "-m", "services.vision.run_workers", "--serve", "--host", self.host, "--port", str(self.ports[index])],
+            env=worker_env(index),
+            start_new_session=True,
+        )
+        self.started_at[index] = time.monotonic()
+
+    def stop(self, sig, frame):
+        self.signals += 1
+        for process in self.processes:
+            if process is not None and process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+
+    def check(self):
+        """
+        Restarts workers that died: their running jobs go back to the queue at once,
+        the process comes back after the backoff delay.
+        """
+        now = time.monotonic()
+        for index, process in enumerate(self.processes):
+            if self.restart_at[index] is not None:
+                if now >= self.restart_at[index]:
+                    self.restart_at[index] = None
+                    self.spawn(index)
+                continue
+            if process.poll() is None:
+                continue
+
+            if now - self.started_at[index] >= self.STABLE_AFTER:
+                self.quick_deaths[index] = 0
+            else:
+                self.quick_deaths[index] += 1
+            delay = 0.0
+            if self.quick_deaths[index]:
+                delay = min(self.RESTART_BACKOFF_MAX, self.RESTART_BACKOFF_BASE * 2 ** (self.quick_deaths[index] - 1))
+            store = JobStore(settings.JOB_QUEUE_PATH)
+            try:
+                requeued = store.requeue_running(worker_owner(index))
+            finally:
+                store.close()
+            logger.warning(
+                "Vision worker exited, restarting",
+                extra={"port": self.ports[index], "code": process.returncode, "requeued_jobs": requeued, "delay": delay},
+            )
+            self.restart_at[index] = now + delay
+
+    def run(self):
+        # Jobs left running by a previous deployment; once, since the workers only requeue their own
+        store = JobStore(settings.JOB_QUEUE_PATH)
+        requeued = store.requeue_running()
+        store.close()
+        if requeued:
+            logger.info("Requeued interrupted jobs", extra={"jobs": requeued})
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for index in range(len(self.ports)):
+            self.spawn(index)
+        print("VISION_SERVICE_URLS=" + ",".join(f"http://{self.host}:{port}" for port in self.ports), flush=True)
+
+        while not self.signals:
+            time.sleep(0.5)
+            if not self.signals:
+                self.check()
+
+        deadline = time.monotonic() + settings.WORKER_DRAIN_SECONDS + settings.WORKER_SHUTDOWN_TIMEOUT + 5
+        for process in self.processes:
+            try:
+                process.wait(timeout=max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run several Vision Service workers for the gateway's upstream pool.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001, help="Port of the first worker; the others follow")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS) # one worker, started by the supervisor
+    args = parser.parse_args(argv)
+
+    configure_logging("vision", settings.LOG_LEVEL, settings.LOG_FORMAT)
+    if args.serve:
+        serve(args.host, args.port)
+    else:
+        Supervisor(args.workers, args.host, args.port).run()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
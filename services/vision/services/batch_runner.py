@@ -0,0 +1,466 @@
+import asyncio
+import csv
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+from typing import AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from pydantic import BaseModel
+
+from services.common.schemas import BatchItemResult
+from services.vision.services.image_fetcher import ImageFetcher
+from services.vision.services.vision_engine import IVisionService
+
+logger = logging.getLogger(__name__)
+
+MAX_CATALOG_IMAGES = 14 # Image1..Image14 columns in the catalog export
+
+class CatalogProduct(BaseModel):
+    product_id: Optional[str] = None # Always set for catalog rows; API batch items may omit it
+    image_urls: List[str]
+
+def iter_catalog(csv_path: str) -> Iterator[CatalogProduct]:
+    """
+    Lazily reads a catalog CSV shaped like A1.0_data_product_images.csv
+    (Product Id, Image Count, Image1..Image14). Rows without images are skipped.
+    """
+    # utf-8-sig strips the BOM the catalog export puts in front of "Product Id"
+    with open(csv_path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            product_id = (row.get("Product Id") or "").strip()
+            if not product_id:
+                continue
+
+            image_urls = []
+            for i in range(1, MAX_CATALOG_IMAGES + 1):
+                url = (row.get(f"Image{i}") or "").strip()
+                if url:
+                    image_urls.append(url)
+
+            # Trust "Image Count" only as an upper bound, the URL columns are the source of truth
+            count = (row.get("Image Count") or "").strip()
+            if count.isdigit() and int(count) > 0:
+                image_urls = image_urls[:int(count)]
+
+            if image_urls:
+                yield CatalogProduct(product_id=product_id, image_urls=image_urls)
+
+async def _aiter(items: Iterable) -> AsyncIterator:
+    for item in items:
+        yield item
+
+async def iter_batch_results(
+    service: IVisionService,
+    products: Union[Iterable[CatalogProduct], AsyncIterable[CatalogProduct]],
+    concurrency: int,
+) -> AsyncIterator[BatchItemResult]:
+    """
+    Fans products out to the vision service with at most `concurrency` calls in flight
+    and yields each result as soon as it completes (completion order, not input order).
+    Failures are yielded as items with `error` set instead of aborting the batch.
+    """
+    async for _, item in iter_indexed_results(service, products, concurrency):
+        yield item
+
+async def iter_indexed_results(
+    service: IVisionService,
+    products: Union[Iterable[CatalogProduct], AsyncIterable[CatalogProduct]],
+    concurrency: int,
+) -> AsyncIterator[Tuple[int, BatchItemResult]]:
+    """
+    iter_batch_results, with each item's position in `products` so results can be
+    matched up with products that have no (or no unique) product_id.
+    """
+    source = products.__aiter__() if isinstance(products, AsyncIterable) else _aiter(products)
+    pulling = asyncio.Lock() # an async generator cannot be advanced by two workers at once
+    position = 0
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    finished = object()
+
+    async def analyze(product: CatalogProduct) -> BatchItemResult:
+        try:
+            result = await service.analyze_images(product.image_urls)
+            result.product_id = product.product_id
+            return BatchItemResult(product_id=product.product_id, result=result)
+        except Exception as e:
+            return BatchItemResult(product_id=product.product_id, error=str(e))
+
+    async def worker():
+        # Workers pull from a shared iterator so a 200k row catalog never
+        # materializes as 200k pending tasks.
+        nonlocal position
+        while True:
+            async with pulling:
+                try:
+                    product = await source.__anext__()
+                except StopAsyncIteration:
+                    return
+                index, position = position, position + 1
+            await queue.put((index, await analyze(product)))
+
+    async def produce():
+        try:
+            await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+        except Exception as e:
+            # e.g. a malformed catalog row, hand it to the consumer instead of hanging it
+            await queue.put(e)
+        await queue.put(finished)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is finished:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        producer.cancel()
+
+class ResultSink(ABC):
+    """
+    Destination for batch results. `write` and `close` return the product ids that
+    are durably stored after the call, which is what the checkpoint records.
+    """
+    @abstractmethod
+    def write(self, record: Dict) -> List[str]:
+        pass
+
+    @abstractmethod
+    def close(self) -> List[str]:
+        pass
+
+class JsonlSink(ResultSink):
+    """
+    Appends to an existing file so a resumed run continues it; `append=False`
+    starts the file over.
+    """
+    def __init__(self, path: str, append: bool = True):
+        self.file = open(path, "a" if append else "w", encoding="utf-8")
+
+    def write(self, record: Dict) -> List[str]:
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        return [record["product_id"]]
+
+    def close(self) -> List[str]:
+        self.file.close()
+        return []
+
+class ParquetSink(ResultSink):
+    """
+    Writes results as numbered part files into a directory. Parquet files cannot be
+    appended to, so rows are buffered and flushed as a new part every `rows_per_file`
+    rows; a resumed run simply continues with the next part number, while
+    `append=False` removes the parts of earlier runs first.
+    """
+    def __init__(self, directory: str, rows_per_file: int = 1000, append: bool = True):
+        try:
+            import pyarrow # noqa: F401
+        except ImportError:
+            raise RuntimeError("Parquet output requires the 'pyarrow' package.")
+        os.makedirs(directory, exist_ok=True)
+        if not append:
+            for name in os.listdir(directory):
+                if name.endswith(".parquet"):
+                    os.remove(os.path.join(directory, name))
+        self.directory = directory
+        self.rows_per_file = rows_per_file
+        self.rows: List[Dict] = []
+        self.part = len([n for n in os.listdir(directory) if n.endswith(".parquet")])
+
+    def write(self, record: Dict) -> List[str]:
+        self.rows.append(record)
+        if len(self.rows) >= self.rows_per_file:
+            return self._flush()
+        return []
+
+    def close(self) -> List[str]:
+        return self._flush()
+
+    def _flush(self) -> List[str]:
+        if not self.rows:
+            return []
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        path = os.path.join(self.directory, f"part-{self.part:05d}.parquet")
+        pq.write_table(pa.Table.from_pylist(self.rows), path)
+        self.part += 1
+        flushed = [row["product_id"] for row in self.rows]
+        self.rows = []
+        return flushed
+
+class Checkpoint:
+    """
+    Append-only file of product ids whose results are safely written.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Set[str] = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.done = {line.strip() for line in f if line.strip()}
+        self.file = open(path, "a", encoding="utf-8")
+
+    def mark(self, product_ids: List[str]):
+        if not product_ids:
+            return
+        self.file.write("".join(f"{pid}\n" for pid in product_ids))
+        self.file.flush()
+        self.done.update(product_ids)
+
+    def close(self):
+        self.file.close()
+
+class ProductFingerprint(BaseModel):
+    """
+    Everything an analysis depends on. A product whose fingerprint matches the last
+    run's does not need to be analyzed again.
+    """
+    image_urls: List[str]
+    image_digests: List[str] # sha256 of each image's bytes; empty when only URLs are compared
+    prompt_hash: str
+    model: str
+    # Which image cache entry each digest was taken from (ImageFetcher.fresh_versions).
+    # Not compared: it only lets the next run reuse the digests without reading the images.
+    image_versions: List[Optional[str]] = []
+
+    def matches(self, other: "ProductFingerprint") -> bool:
+        return self.model_dump(exclude={"image_versions"}) == other.model_dump(
+            include=set(ProductFingerprint.model_fields) - {"image_versions"}
+        )
+
+class ManifestEntry(ProductFingerprint):
+    product_id: str
+    result: Dict # The record written to the sink for this product
+
+class Manifest:
+    """
+    SQLite table of every product's fingerprint and result from previous runs, which
+    incremental runs diff the catalog against. Writes are committed every
+    `commit_every` entries; entries lost to a crash only cost a re-analysis.
+    """
+    def __init__(self, path: str, commit_every: int = 100):
+        self.commit_every = commit_every
+        self.uncommitted = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS manifest (product_id TEXT PRIMARY KEY, entry TEXT NOT NULL)")
+
+    def get(self, product_id: str) -> Optional[ManifestEntry]:
+        row = self.conn.execute("SELECT entry FROM manifest WHERE product_id = ?", (product_id,)).fetchone()
+        return ManifestEntry.model_validate_json(row[0]) if row is not None else None
+
+    def put(self, entry: ManifestEntry):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO manifest (product_id, entry) VALUES (?, ?)", (entry.product_id, entry.model_dump_json())
+        )
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_every:
+            self.commit()
+
+    def prune(self, keep: Set[str]) -> int:
+        """
+        Drops products that are no longer in the catalog. Returns how many were dropped.
+        """
+        stale = [(pid,) for (pid,) in self.conn.execute("SELECT product_id FROM manifest") if pid not in keep]
+        self.conn.executemany("DELETE FROM manifest WHERE product_id = ?", stale)
+        self.commit()
+        return len(stale)
+
+    def commit(self):
+        self.conn.commit()
+        self.uncommitted = 0
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM manifest").fetchone()[0]
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+class Fingerprinter:
+    """
+    Fingerprints catalog products for a given prompt hash and model. With a fetcher,
+    images are downloaded (through its disk cache, so unchanged images cost a 304)
+    and hashed, which catches images replaced behind an unchanged URL; without one,
+    only the URLs are compared. When the URLs are unchanged and every image's cache
+    entry is the one the previous digests came from and still fresh, those digests
+    are reused without touching the images.
+    """
+    def __init__(self, prompt_hash: str, model: str, fetcher: Optional[ImageFetcher] = None):
+        self.prompt_hash = prompt_hash
+        self.model = model
+        self.fetcher = fetcher
+        self.reused = 0 # Products whose previous digests were reused
+
+    async def fingerprint(self, product: CatalogProduct, previous: Optional[ProductFingerprint] = None) -> ProductFingerprint:
+        digests: List[str] = []
+        versions: List[Optional[str]] = []
+        if self.fetcher is not None:
+            try:
+                if previous is not None and previous.image_urls == product.image_urls and previous.image_digests:
+                    versions = await self.fetcher.fresh_versions(product.image_urls)
+                    if all(versions) and versions == previous.image_versions:
+                        self.reused += 1
+                        digests = previous.image_digests
+                if not digests:
+                    payloads = await self.fetcher.fetch_all(product.image_urls)
+                    digests = [hashlib.sha256(payload.data).hexdigest() for payload in payloads]
+                    versions = await self.fetcher.fresh_versions(product.image_urls)
+            except Exception as e:
+                # Never matches a stored digest list, so the product is analyzed
+                logger.warning("Image digest failed", extra={"product_id": product.product_id, "error": str(e)})
+                digests, versions = [], []
+        return ProductFingerprint(
+            image_urls=product.image_urls,
+            image_digests=digests,
+            prompt_hash=self.prompt_hash,
+            model=self.model,
+            image_versions=versions,
+        )
+
+class BatchSummary(BaseModel):
+    total: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    skipped: int = 0
+    unchanged: int = 0 # Carried forward from the manifest (incremental runs)
+    removed: int = 0 # In the manifest but no longer in the catalog
+    failures: Dict[str, str] = {}
+
+class BatchRunner:
+    """
+    Runs a whole catalog through the vision service, streaming results to a sink.
+    Products already listed in the checkpoint are skipped, so re-running the same
+    command after a crash resumes where the previous run stopped. Failed products
+    are not checkpointed and are retried on the next run.
+
+    With a manifest (incremental mode), products are fingerprinted and only those
+    whose images, prompt or model changed since the last run are analyzed, starting
+    as soon as each is found; the others have their previous result written to the
+    sink unchanged.
+    """
+    def __init__(
+        self,
+        service: IVisionService,
+        sink: ResultSink,
+        checkpoint: Optional[Checkpoint] = None,
+        concurrency: int = 8,
+        manifest: Optional[Manifest] = None,
+        fingerprinter: Optional[Fingerprinter] = None,
+    ):
+        if (manifest is None) != (fingerprinter is None):
+            raise ValueError("Incremental runs need both a manifest and a fingerprinter")
+        self.service = service
+        self.sink = sink
+        self.checkpoint = checkpoint
+        self.concurrency = concurrency
+        self.manifest = manifest
+        self.fingerprinter = fingerprinter
+
+    async def run(self, products: Iterable[CatalogProduct]) -> BatchSummary:
+        summary = BatchSummary()
+        catalog_ids: Set[str] = set()
+
+        def pending() -> Iterator[CatalogProduct]:
+            for product in products:
+                catalog_ids.add(product.product_id)
+                if self.checkpoint and product.product_id in self.checkpoint.done:
+                    summary.skipped += 1
+                    continue
+                yield product
+
+        fingerprints: Dict[str, ProductFingerprint] = {}
+        source: Union[Iterable[CatalogProduct], AsyncIterator[CatalogProduct]] = pending()
+        if self.manifest is not None:
+            source = self._changed(source, fingerprints, summary)
+        try:
+
+            async for item in iter_batch_results(self.service, source, self.concurrency):
+                summary.total += 1
+                if item.error is not None:
+                    summary.failed += 1
+                    summary.failures[item.product_id] = item.error
+                    continue
+                summary.succeeded += 1
+                record = item.result.model_dump(mode="json")
+                self._commit(self.sink.write(record))
+                # A mock fallback is not a measurement worth carrying forward
+                if self.manifest is not None and not item.result.is_fallback:
+                    fingerprint = fingerprints[item.product_id]
+                    self.manifest.put(ManifestEntry(product_id=item.product_id, result=record, **fingerprint.model_dump()))
+        finally:
+            if self.manifest is not None:
+                await source.aclose()
+            self._commit(self.sink.close())
+            if self.checkpoint:
+                self.checkpoint.close()
+            if self.manifest is not None:
+                self.manifest.commit()
+
+        if self.manifest is not None:
+            summary.removed = self.manifest.prune(catalog_ids)
+        return summary
+
+    async def _changed(
+        self,
+        products: Iterator[CatalogProduct],
+        fingerprints: Dict[str, ProductFingerprint],
+        summary: BatchSummary,
+    ) -> AsyncIterator[CatalogProduct]:
+        """
+        Fingerprints products and writes the results of unchanged ones straight to the
+        sink. Yields the products that need a new analysis as they are found, so
+        analysis overlaps with diffing the rest of the catalog.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, self.concurrency) * 4)
+        finished = object()
+        changed = 0
+
+        async def worker():
+            nonlocal changed
+            for product in products:
+                previous = self.manifest.get(product.product_id)
+                fingerprint = await self.fingerprinter.fingerprint(product, previous)
+                if previous is not None and fingerprint.matches(previous):
+                    summary.unchanged += 1
+                    self._commit(self.sink.write(previous.result))
+                    continue
+                fingerprints[product.product_id] = fingerprint
+                changed += 1
+                await queue.put(product)
+
+        async def produce():
+            try:
+                # Fingerprinting is mostly image revalidation, bounded per host by the fetcher
+                await asyncio.gather(*(worker() for _ in range(max(1, self.concurrency) * 4)))
+            except Exception as e:
+                await queue.put(e)
+            await queue.put(finished)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                item = await queue.get()
+                if item is finished:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            producer.cancel()
+        logger.info(
+            "Catalog diffed against the manifest",
+            extra={"changed": changed, "unchanged": summary.unchanged, "digests_reused": self.fingerprinter.reused},
+        )
+
+    def _commit(self, product_ids: List[str]):
+        if self.checkpoint:
+            self.checkpoint.mark(product_ids)
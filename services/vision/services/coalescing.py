@@ -0,0 +1,67 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List
+
+from services.vision.models.image_payload import ImageSource
+from services.common.schemas import ProductAnalysisResponse
+from services.vision.services.result_cache import cache_key
+from services.vision.services.vision_engine import IVisionService
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls by key: the first caller starts the work, later
+    callers with the same key await the same in-flight task. The shared task is
+    only cancelled once every caller waiting on it has gone away.
+    """
+    def __init__(self):
+        self.in_flight: Dict[str, _Flight] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self.in_flight.get(key)
+        if flight is None:
+            self.calls += 1
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self.in_flight[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            # Shielded so one caller disconnecting does not cancel everyone else's result
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _forget(self, key: str, flight: _Flight):
+        if self.in_flight.get(key) is flight:
+            del self.in_flight[key]
+
+    def stats(self) -> Dict:
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self.in_flight)}
+
+class CoalescingVisionService(IVisionService):
+    """
+    Single-flight front for analyze_images: identical image sets submitted at the same
+    time share one provider call. Each caller gets its own deep copy, so the handlers'
+    product_id overwrite never leaks between callers.
+    """
+    def __init__(self, inner: IVisionService, group: SingleFlight):
+        self.inner = inner
+        self.group = group
+        self.model = getattr(inner, "model", type(inner).__name__)
+
+    async def analyze_images(self, image_urls: List[ImageSource]) -> ProductAnalysisResponse:
+        key = cache_key(image_urls, self.model)
+        result = await self.group.do(key, lambda: self.inner.analyze_images(image_urls))
+        return result.model_copy(deep=True)
@@ -0,0 +1,243 @@
+import asyncio
+import io
+import logging
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+from services.vision.models.image_payload import ImagePayload, ImageSource
+from services.common.schemas import ProductAnalysisResponse
+from services.vision.services.prompt_templates import get_template
+from services.vision.services.vision_engine import IVisionService
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8 # 8x8 bits -> one 64-bit hash per image
+
+def _grayscale(data: bytes, size: int):
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as img:
+        # Let the JPEG decoder downscale while decoding; hashes only need a thumbnail
+        img.draft("L", (size * 4, size * 4))
+        return img.convert("L").resize((size, size), Image.LANCZOS)
+
+def dhash(data: bytes) -> int:
+    """
+    Difference hash: one bit per horizontally adjacent pixel pair of a 9x8 thumbnail.
+    """
+    import numpy as np
+
+    pixels = np.asarray(_grayscale(data, HASH_SIZE + 1), dtype=np.int16)[:HASH_SIZE, :]
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def _dct_matrix(n: int):
+    import numpy as np
+
+    k = np.arange(n)[:, None]
+    matrix = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n))
+    matrix[0] /= np.sqrt(2)
+    return matrix * np.sqrt(2 / n)
+
+_DCT_32 = None
+
+def phash(data: bytes) -> int:
+    """
+    Perceptual hash: the low-frequency 8x8 block of a 32x32 DCT, thresholded at its median.
+    More robust than dHash to rescaling and recompression.
+    """
+    import numpy as np
+
+    global _DCT_32
+    if _DCT_32 is None:
+        _DCT_32 = _dct_matrix(32)
+    pixels = np.asarray(_grayscale(data, 32), dtype=np.float64)
+    coefficients = (_DCT_32 @ pixels @ _DCT_32.T)[:HASH_SIZE, :HASH_SIZE].flatten()
+    # The DC term only encodes overall brightness, keep it out of the threshold
+    bits = coefficients > np.median(coefficients[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+HASH_FUNCTIONS = {"phash": phash, "dhash": dhash}
+
+class PerceptualIndex:
+    """
+    Image-set hashes of analyzed products with their results, keyed by the model and
+    prompt version that produced them. Lookups compare a query against every stored
+    hash at once (XOR + popcount over a numpy uint64 array) and only accept sets
+    analyzed under the same model and prompt version.
+    Optionally persisted to SQLite so the index survives restarts. Processes sharing
+    the file see each other's additions: a lookup that misses first loads the rows
+    added since it last looked.
+    """
+    def __init__(self, path: Optional[str] = None, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries: Dict[int, tuple] = {} # entry id -> (model, prompt version, hashes, result json)
+        self.next_id = 0
+        self.synced_id = 0 # Highest row id read from SQLite
+        self._arrays = None # (hashes, owner entry ids), rebuilt lazily after changes
+        self.conn = None
+        if path:
+            self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(image_sets)")}
+            if columns and "prompt_version" not in columns:
+                # Written before entries were keyed; nothing says which prompt made them
+                logger.info("Dropping unkeyed perceptual index entries", extra={"path": path})
+                self.conn.execute("DROP TABLE image_sets")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS image_sets (id INTEGER PRIMARY KEY, model TEXT NOT NULL,"
+                " prompt_version TEXT NOT NULL, hashes TEXT NOT NULL, result TEXT NOT NULL)"
+            )
+            self._sync()
+
+    def _sync(self) -> int:
+        """
+        Loads rows other processes added since the last sync. Returns how many were new.
+        """
+        rows = self.conn.execute(
+            "SELECT id, model, prompt_version, hashes, result FROM image_sets WHERE id > ? ORDER BY id", (self.synced_id,)
+        ).fetchall()
+        added = 0
+        for entry_id, model, prompt_version, hashes, result in rows:
+            self.synced_id = entry_id
+            if entry_id not in self.entries:
+                self.entries[entry_id] = (model, prompt_version, [int(h, 16) for h in hashes.split(",")], result)
+                added += 1
+        self.next_id = max(self.next_id, self.synced_id + 1)
+        while len(self.entries) > self.max_entries:
+            # Trimmed here only; whoever added the row trims the file
+            del self.entries[next(iter(self.entries))]
+        if added:
+            self._arrays = None
+        return added
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _get_arrays(self):
+        import numpy as np
+
+        if self._arrays is None:
+            hashes, owners = [], []
+            for entry_id, (_, _, entry_hashes, _) in self.entries.items():
+                hashes.extend(entry_hashes)
+                owners.extend([entry_id] * len(entry_hashes))
+            self._arrays = (np.array(hashes, dtype=np.uint64), np.array(owners, dtype=np.int64))
+        return self._arrays
+
+    def find(self, model: str, prompt_version: str, hashes: List[int], max_distance: int) -> Optional[str]:
+        """
+        Returns the stored result of an image set analyzed under `model` and
+        `prompt_version` that matches `hashes` image for image (same size, every image
+        within `max_distance` bits of a distinct image in the set).
+        """
+        with self.lock:
+            result = self._find(model, prompt_version, hashes, max_distance)
+            if result is None and self.conn is not None and self._sync():
+                result = self._find(model, prompt_version, hashes, max_distance)
+            return result
+
+    def _find(self, model: str, prompt_version: str, hashes: List[int], max_distance: int) -> Optional[str]:
+        import numpy as np
+
+        if not self.entries or not hashes:
+            return None
+        stored, owners = self._get_arrays()
+        query = np.array(hashes, dtype=np.uint64)
+        # distances[i, j]: Hamming distance between query image i and stored image j
+        distances = np.bitwise_count(query[:, None] ^ stored[None, :])
+        close = distances <= max_distance
+
+        # Only sets with a close match for the first image can match as a whole
+        for entry_id in np.unique(owners[close[0]]):
+            entry_model, entry_version, entry_hashes, result = self.entries[int(entry_id)]
+            if (entry_model, entry_version) != (model, prompt_version) or len(entry_hashes) != len(hashes):
+                continue
+            if _sets_match(close[:, owners == entry_id]):
+                return result
+        return None
+
+    def add(self, model: str, prompt_version: str, hashes: List[int], result: str):
+        with self.lock:
+            entry_id = self.next_id
+            if self.conn is not None:
+                # SQLite assigns the id, so worker processes sharing the file never collide
+                entry_id = self.conn.execute(
+                    "INSERT INTO image_sets (model, prompt_version, hashes, result) VALUES (?, ?, ?, ?)",
+                    (model, prompt_version, ",".join(f"{h:016x}" for h in hashes), result),
+                ).lastrowid
+            self.next_id = entry_id + 1
+            self.entries[entry_id] = (model, prompt_version, hashes, result)
+            while len(self.entries) > self.max_entries:
+                oldest = next(iter(self.entries))
+                del self.entries[oldest]
+                if self.conn is not None:
+                    self.conn.execute("DELETE FROM image_sets WHERE id = ?", (oldest,))
+            self._arrays = None
+
+def _sets_match(close) -> bool:
+    """
+    True if every query image (row) can be paired with a distinct stored image (column).
+    Image sets are small, so simple augmenting-path matching is plenty.
+    """
+    rows, cols = close.shape
+    paired_with = [-1] * cols
+
+    def assign(row: int, seen: set) -> bool:
+        for col in range(cols):
+            if close[row, col] and col not in seen:
+                seen.add(col)
+                if paired_with[col] == -1 or assign(paired_with[col], seen):
+                    paired_with[col] = row
+                    return True
+        return False
+
+    return all(assign(row, set()) for row in range(rows))
+
+class DedupVisionService(IVisionService):
+    """
+    Reuses an earlier analysis when a product's images are perceptually the same as
+    an already analyzed set (e.g. one frame photographed for several sizes). Needs
+    image bytes, so it sits after prefetching/preprocessing; sets containing URLs
+    that could not be fetched are passed straight through.
+    """
+    def __init__(self, inner: IVisionService, index: PerceptualIndex, max_distance: int, algorithm: str = "phash"):
+        if algorithm not in HASH_FUNCTIONS:
+            raise ValueError(f"Unsupported hash algorithm: {algorithm}")
+        self.inner = inner
+        self.index = index
+        self.max_distance = max_distance
+        self.hash_image = HASH_FUNCTIONS[algorithm]
+        self.model = getattr(inner, "model", type(inner).__name__)
+        self.stats = {"lookups": 0, "llm_calls_saved": 0, "unhashable": 0}
+
+    async def analyze_images(self, image_urls: List[ImageSource]) -> ProductAnalysisResponse:
+        hashes = None
+        if image_urls and all(isinstance(image, ImagePayload) for image in image_urls):
+            try:
+                hashes = await asyncio.to_thread(lambda: [self.hash_image(image.data) for image in image_urls])
+            except Exception as e:
+                logger.warning("Perceptual hashing skipped", extra={"error": str(e)})
+        if hashes is None:
+            self.stats["unhashable"] += 1
+            return await self.inner.analyze_images(image_urls)
+
+        self.stats["lookups"] += 1
+        # Results made under another model or prompt are never reused
+        prompt_version = get_template("single", self.model).version
+        match = await asyncio.to_thread(self.index.find, self.model, prompt_version, hashes, self.max_distance)
+        if match is not None:
+            self.stats["llm_calls_saved"] += 1
+            return ProductAnalysisResponse.model_validate_json(match)
+
+        result = await self.inner.analyze_images(image_urls)
+        if not result.is_fallback:
+            await asyncio.to_thread(
+                self.index.add, self.model, prompt_version, hashes, result.model_dump_json(exclude={"product_id"})
+            )
+        return result
+
+    def snapshot(self) -> Dict:
+        return {**self.stats, "indexed_sets": len(self.index)}
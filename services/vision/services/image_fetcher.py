@@ -0,0 +1,342 @@
+import asyncio
+import hashlib
+import ipaddress
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from services.vision.models.image_payload import ImagePayload, ImageSource
+from services.common.schemas import ProductAnalysisResponse
+from services.vision.services.vision_engine import IVisionService
+
+logger = logging.getLogger(__name__)
+
+MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+
+class ImageFetchRefused(Exception):
+    """
+    A download the fetcher will not make or finish: a body over `max_bytes`, too
+    many redirects, or a host that resolves to a non-public address.
+    """
+
+class CachedBlob:
+    def __init__(
+        self,
+        data: bytes,
+        mime_type: str,
+        etag: Optional[str],
+        last_modified: Optional[str],
+        expires_at: float = 0.0,
+    ):
+        self.data = data
+        self.mime_type = mime_type
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at # Until then the body is served without revalidating
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+class DiskBlobCache:
+    """
+    Size-bounded on-disk cache of downloaded images keyed by URL. Each entry is a
+    `<sha256(url)>.bin` body plus a `.json` sidecar with the validators (ETag /
+    Last-Modified) needed for conditional re-fetches. Least recently used entries
+    are evicted once the directory grows past `max_bytes`.
+    """
+    def __init__(self, directory: str, max_bytes: int):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.total_bytes = sum(
+            os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory) if name.endswith(".bin")
+        )
+        self.evictions = 0
+
+    def _paths(self, url: str):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.directory, key)
+        return base + ".bin", base + ".json"
+
+    def get(self, url: str, body: bool = True) -> Optional[CachedBlob]:
+        """
+        With `body=False` only the sidecar is read and the blob's data is empty.
+        """
+        body_path, meta_path = self._paths(url)
+        data = b""
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if body:
+                with open(body_path, "rb") as f:
+                    data = f.read()
+        except (OSError, ValueError):
+            return None
+        if body:
+            # Touch so eviction sees this entry as recently used
+            os.utime(body_path)
+        return CachedBlob(
+            data, meta.get("mime_type", "image/jpeg"), meta.get("etag"), meta.get("last_modified"), meta.get("expires_at", 0.0)
+        )
+
+    def put(self, url: str, blob: CachedBlob):
+        if len(blob.data) > self.max_bytes:
+            return
+        body_path, meta_path = self._paths(url)
+        with self.lock:
+            previous = os.path.getsize(body_path) if os.path.exists(body_path) else 0
+            # Write-then-rename so a crash never leaves a truncated body behind; the
+            # pid keeps workers sharing the cache directory out of each other's temp files
+            tmp_path = f"{body_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(blob.data)
+            os.replace(tmp_path, body_path)
+            self._write_meta(meta_path, url, blob)
+            self.total_bytes += len(blob.data) - previous
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def put_meta(self, url: str, blob: CachedBlob):
+        """
+        Refreshes the validators of an existing entry (after a 304) without rewriting its body.
+        """
+        _, meta_path = self._paths(url)
+        self._write_meta(meta_path, url, blob)
+
+    def _write_meta(self, meta_path: str, url: str, blob: CachedBlob):
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "url": url,
+                    "mime_type": blob.mime_type,
+                    "etag": blob.etag,
+                    "last_modified": blob.last_modified,
+                    "expires_at": blob.expires_at,
+                },
+                f,
+            )
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".bin"):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        # Evict down to 90% so a full cache does not evict on every single write
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if self.total_bytes <= target:
+                break
+            for stale in (path, path[:-len(".bin")] + ".json"):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+            self.total_bytes -= size
+            self.evictions += 1
+
+class ImageFetcher:
+    """
+    Shared async downloader for product images. Limits concurrent requests per host
+    (catalog images all live on one CDN) and keeps a disk cache: fresh entries
+    (Cache-Control max-age) are served without a request, stale ones are revalidated
+    with If-None-Match / If-Modified-Since and a 304 serves the cached bytes.
+
+    The URLs come from clients, so bodies are read up to `max_bytes` and redirects are
+    followed here, at most `max_redirects` of them, checking every hop's host: unless
+    `allow_private_hosts` is set, hosts resolving to loopback, private, link-local or
+    otherwise non-public addresses are refused.
+    """
+    def __init__(
+        self,
+        per_host_limit: int = 8,
+        timeout: float = 20.0,
+        cache: Optional[DiskBlobCache] = None,
+        client: Optional[httpx.AsyncClient] = None,
+        max_bytes: int = 20 * 1024 * 1024,
+        max_redirects: int = 3,
+        allow_private_hosts: bool = False,
+    ):
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.cache = cache
+        self.client = client
+        self.max_bytes = max_bytes
+        self.max_redirects = max_redirects
+        self.allow_private_hosts = allow_private_hosts
+        self.host_limits: Dict[str, asyncio.Semaphore] = {}
+        self.stats = {
+            "requests": 0, "cache_fresh": 0, "downloaded": 0, "not_modified": 0, "bytes_downloaded": 0, "errors": 0,
+            "refused": 0,
+        }
+
+    def _client(self) -> httpx.AsyncClient:
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_keepalive_connections=self.per_host_limit * 4),
+            )
+        return self.client
+
+    async def fetch(self, url: str) -> ImagePayload:
+        cached = await asyncio.to_thread(self.cache.get, url) if self.cache else None
+        if cached is not None and cached.is_fresh:
+            self.stats["cache_fresh"] += 1
+            return ImagePayload(data=cached.data, mime_type=cached.mime_type)
+
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+
+        host = urlsplit(url).netloc
+        limit = self.host_limits.setdefault(host, asyncio.Semaphore(self.per_host_limit))
+        self.stats["requests"] += 1
+        try:
+            async with limit:
+                resp, content = await self._get(url, headers)
+            if resp.status_code == 304 and cached is not None:
+                self.stats["not_modified"] += 1
+                if self.cache is not None:
+                    # Revalidated: store the refreshed freshness window
+                    cached.expires_at = _expires_at(resp.headers) or cached.expires_at
+                    await asyncio.to_thread(self.cache.put_meta, url, cached)
+                return ImagePayload(data=cached.data, mime_type=cached.mime_type)
+            resp.raise_for_status()
+        except ImageFetchRefused:
+            self.stats["refused"] += 1
+            raise
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+
+        mime_type = resp.headers.get("content-type", "image/jpeg").split(";")[0]
+        self.stats["downloaded"] += 1
+        self.stats["bytes_downloaded"] += len(content)
+
+        cache_control = resp.headers.get("cache-control", "")
+        expires_at = _expires_at(resp.headers)
+        cacheable = "no-store" not in cache_control and (
+            expires_at or resp.headers.get("etag") or resp.headers.get("last-modified")
+        )
+        if self.cache is not None and cacheable:
+            blob = CachedBlob(
+                content, mime_type, resp.headers.get("etag"), resp.headers.get("last-modified"), expires_at
+            )
+            await asyncio.to_thread(self.cache.put, url, blob)
+        return ImagePayload(data=content, mime_type=mime_type)
+
+    async def _get(self, url: str, headers: Dict[str, str]) -> Tuple[httpx.Response, bytes]:
+        """
+        GET with the redirects followed by hand, so every hop is checked. Returns the
+        final response (already closed) and its body.
+        """
+        for _ in range(self.max_redirects + 1):
+            await self._check_host(url)
+            async with self._client().stream("GET", url, headers=headers) as resp:
+                if resp.has_redirect_location:
+                    url = str(resp.url.join(resp.headers["location"]))
+                    continue
+                return resp, await self._read(url, resp)
+        raise ImageFetchRefused(f"More than {self.max_redirects} redirects")
+
+    async def _read(self, url: str, resp: httpx.Response) -> bytes:
+        length = resp.headers.get("content-length")
+        if length and length.isdigit() and int(length) > self.max_bytes:
+            raise ImageFetchRefused(f"{url} is {length} bytes, over the {self.max_bytes} byte limit")
+        chunks, size = [], 0
+        async for chunk in resp.aiter_bytes():
+            size += len(chunk)
+            # Content-Length may be missing or wrong, so the count is what decides
+            if size > self.max_bytes:
+                raise ImageFetchRefused(f"{url} is over the {self.max_bytes} byte limit")
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    async def _check_host(self, url: str):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ImageFetchRefused(f"Unsupported URL scheme: {parts.scheme}")
+        if self.allow_private_hosts or not parts.hostname:
+            return
+        try:
+            addresses = [ipaddress.ip_address(parts.hostname)]
+        except ValueError:
+            try:
+                infos = await asyncio.get_running_loop().getaddrinfo(parts.hostname, parts.port or 443)
+            except OSError:
+                return # Unresolvable: the request itself fails
+            addresses = [ipaddress.ip_address(info[4][0].split("%")[0]) for info in infos]
+        for address in addresses:
+            if not address.is_global:
+                raise ImageFetchRefused(f"{parts.hostname} resolves to a non-public address ({address})")
+
+    async def fetch_all(self, urls: List[str]) -> List[ImagePayload]:
+        return await asyncio.gather(*(self.fetch(url) for url in urls))
+
+    async def fresh_versions(self, urls: List[str]) -> List[Optional[str]]:
+        """
+        For each URL whose cache entry is still fresh (so fetch would serve it without a
+        request), a string that changes whenever that entry is rewritten: its validators
+        and freshness deadline. None for anything else. Reads only the cache sidecars.
+        """
+        if self.cache is None:
+            return [None] * len(urls)
+
+        def read() -> List[Optional[str]]:
+            versions = []
+            for url in urls:
+                blob = self.cache.get(url, body=False)
+                fresh = blob is not None and blob.is_fresh
+                versions.append(json.dumps([blob.etag, blob.last_modified, blob.expires_at]) if fresh else None)
+            return versions
+
+        return await asyncio.to_thread(read)
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+def _expires_at(headers: httpx.Headers) -> float:
+    cache_control = headers.get("cache-control", "")
+    if "no-cache" in cache_control:
+        return 0.0
+    match = MAX_AGE_PATTERN.search(cache_control)
+    return time.time() + int(match.group(1)) if match else 0.0
+
+class PrefetchingVisionService(IVisionService):
+    """
+    Downloads http(s) images through the shared ImageFetcher so the provider gets
+    bytes instead of fetching every URL itself. Anything that fails to download is
+    passed through as the original URL.
+    """
+    def __init__(self, inner: IVisionService, fetcher: ImageFetcher):
+        self.inner = inner
+        self.fetcher = fetcher
+        self.model = getattr(inner, "model", type(inner).__name__)
+
+    async def analyze_images(self, image_urls: List[ImageSource]) -> ProductAnalysisResponse:
+        async def prefetch(image: ImageSource) -> ImageSource:
+            if isinstance(image, str) and image.startswith(("http://", "https://")):
+                try:
+                    return await self.fetcher.fetch(image)
+                except Exception as e:
+                    logger.warning("Image prefetch failed", extra={"url": image, "error": str(e)})
+            return image
+
+        images = await asyncio.gather(*(prefetch(image) for image in image_urls))
+        return await self.inner.analyze_images(list(images))
@@ -0,0 +1,216 @@
+import asyncio
+import base64
+import io
+import logging
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from prometheus_client import Counter
+from pydantic import BaseModel, computed_field
+
+from services.vision.models.image_payload import ImagePayload, ImageSource
+from services.common.schemas import ProductAnalysisResponse
+from services.vision.services.image_fetcher import ImageFetcher
+from services.vision.services.vision_engine import IVisionService
+
+logger = logging.getLogger(__name__)
+
+PREPROCESS_BYTES = Counter(
+    "image_preprocess_bytes_total",
+    "Image bytes going into and coming out of preprocessing; the difference is what it saved.",
+    ["direction"],
+)
+
+OUTPUT_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+# JPEG segments kept when stripping: APP0 (JFIF) and APP14 (Adobe, which tells decoders the color transform)
+JPEG_KEPT_APP_MARKERS = {0xE0, 0xEE}
+PNG_METADATA_CHUNKS = {b"eXIf", b"iCCP", b"tEXt", b"zTXt", b"iTXt", b"tIME"}
+
+def strip_metadata(data: bytes, image_format: str) -> Optional[bytes]:
+    """
+    Drops the EXIF/XMP/ICC metadata and comments of a JPEG or PNG without decoding
+    its pixels. None for other formats, or when the file does not parse.
+    """
+    try:
+        if image_format == "JPEG":
+            return _strip_jpeg(data)
+        if image_format == "PNG":
+            return _strip_png(data)
+    except (IndexError, struct.error, ValueError):
+        pass
+    return None
+
+def _strip_jpeg(data: bytes) -> bytes:
+    if data[:2] != b"\xff\xd8":
+        raise ValueError("Not a JPEG")
+    out, pos = [data[:2]], 2
+    while True:
+        if data[pos] != 0xFF:
+            raise ValueError("Expected a marker")
+        while data[pos] == 0xFF: # Fill bytes
+            pos += 1
+        marker = data[pos]
+        (length,) = struct.unpack(">H", data[pos + 1:pos + 3])
+        segment = b"\xff" + data[pos:pos + 1 + length]
+        if len(segment) != length + 2:
+            raise ValueError("Truncated segment")
+        pos += 1 + length
+        if marker == 0xDA: # Start of scan: the rest is image data
+            out.append(segment)
+            out.append(data[pos:])
+            return b"".join(out)
+        if not (0xE1 <= marker <= 0xEF or marker == 0xFE) or marker in JPEG_KEPT_APP_MARKERS:
+            out.append(segment)
+
+def _strip_png(data: bytes) -> bytes:
+    if data[:8] != b"\x89PNG\r\n\x1a\n":
+        raise ValueError("Not a PNG")
+    out, pos = [data[:8]], 8
+    while pos < len(data):
+        (length,) = struct.unpack(">I", data[pos:pos + 4])
+        chunk_type = data[pos + 4:pos + 8]
+        end = pos + 12 + length
+        if end > len(data):
+            raise ValueError("Truncated chunk")
+        if chunk_type not in PNG_METADATA_CHUNKS:
+            out.append(data[pos:end])
+        pos = end
+        if chunk_type == b"IEND":
+            return b"".join(out)
+    raise ValueError("Missing IEND")
+
+def reencode_image(data: bytes, max_edge: int, output_format: str, quality: int) -> Tuple[bytes, str]:
+    """
+    Decodes an image, downscales it so its longest edge is at most `max_edge`, and
+    re-encodes it without EXIF/ICC metadata. Runs in a worker process, so it only
+    takes and returns plain bytes. When re-encoding would not make an image smaller,
+    its original bytes are returned with the metadata cut out instead (JPEG and PNG
+    whose EXIF does not rotate them); anything else gets the re-encode.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as img:
+        original_format = img.format
+        original_mime = Image.MIME.get(img.format, "image/jpeg")
+        rotated = img.getexif().get(0x0112, 1) != 1 # EXIF Orientation
+        # Apply the EXIF rotation before the metadata is dropped
+        img = ImageOps.exif_transpose(img)
+        resized = max(img.size) > max_edge
+        if resized:
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        if output_format == "JPEG" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+
+        out = io.BytesIO()
+        img.save(out, format=output_format, quality=quality, optimize=True)
+        encoded = out.getvalue()
+
+    if not resized and not rotated and len(encoded) >= len(data):
+        stripped = strip_metadata(data, original_format)
+        if stripped is not None and len(stripped) <= len(encoded):
+            return stripped, original_mime
+    return encoded, OUTPUT_MIME_TYPES[output_format]
+
+class PreprocessStats(BaseModel):
+    requests: int = 0
+    images: int = 0
+    images_failed: int = 0
+    bytes_in: int = 0
+    bytes_out: int = 0
+
+    @computed_field
+    @property
+    def bytes_saved(self) -> int:
+        return self.bytes_in - self.bytes_out
+
+class ImagePreprocessor:
+    """
+    Fetches each image, then downsizes and re-encodes it in a process pool so
+    decoding never blocks the event loop.
+    """
+    def __init__(
+        self,
+        max_edge: int,
+        output_format: str = "JPEG",
+        quality: int = 85,
+        max_workers: int = 2,
+        fetcher: Optional[ImageFetcher] = None,
+    ):
+        output_format = output_format.upper()
+        if output_format not in OUTPUT_MIME_TYPES:
+            raise ValueError(f"Unsupported output format: {output_format}")
+        self.max_edge = max_edge
+        self.output_format = output_format
+        self.quality = quality
+        self.max_workers = max_workers
+        self.fetcher = fetcher or ImageFetcher()
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.stats = PreprocessStats()
+
+    async def prepare(self, images: List[ImageSource]) -> Tuple[List[ImageSource], int, int]:
+        """
+        Returns the processed images plus total bytes before and after. Images that
+        cannot be fetched or decoded are passed through untouched for the provider.
+        """
+        processed = await asyncio.gather(*(self._prepare_one(image) for image in images))
+        bytes_in = sum(before for _, before, _ in processed)
+        bytes_out = sum(after for _, _, after in processed)
+
+        self.stats.requests += 1
+        self.stats.images += len(images)
+        self.stats.bytes_in += bytes_in
+        self.stats.bytes_out += bytes_out
+        PREPROCESS_BYTES.labels("in").inc(bytes_in)
+        PREPROCESS_BYTES.labels("out").inc(bytes_out)
+        return [image for image, _, _ in processed], bytes_in, bytes_out
+
+    async def _prepare_one(self, image: ImageSource) -> Tuple[ImageSource, int, int]:
+        try:
+            payload = await self._load(image)
+            data, mime_type = await asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), reencode_image, payload.data, self.max_edge, self.output_format, self.quality
+            )
+            return ImagePayload(data=data, mime_type=mime_type), len(payload.data), len(data)
+        except Exception as e:
+            logger.warning("Image preprocessing skipped", extra={"error": str(e)})
+            self.stats.images_failed += 1
+            return image, 0, 0
+
+    async def _load(self, image: ImageSource) -> ImagePayload:
+        if isinstance(image, ImagePayload):
+            return image
+        if image.startswith("data:"):
+            header, _, encoded = image.partition(",")
+            mime_type = header[len("data:"):].split(";")[0] or "image/jpeg"
+            return ImagePayload(data=base64.b64decode(encoded), mime_type=mime_type)
+        return await self.fetcher.fetch(image)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self.executor
+
+    async def aclose(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+class PreprocessingVisionService(IVisionService):
+    """
+    Runs every request's images through the ImagePreprocessor before the provider call.
+    """
+    def __init__(self, inner: IVisionService, preprocessor: ImagePreprocessor):
+        self.inner = inner
+        self.preprocessor = preprocessor
+        self.model = getattr(inner, "model", type(inner).__name__)
+
+    async def analyze_images(self, image_urls: List[ImageSource]) -> ProductAnalysisResponse:
+        images, bytes_in, bytes_out = await self.preprocessor.prepare(image_urls)
+        logger.info(
+            "Preprocessed images",
+            extra={"images": len(images), "bytes_in": bytes_in, "bytes_out": bytes_out, "bytes_saved": bytes_in - bytes_out},
+        )
+        return await self.inner.analyze_images(images)
@@ -0,0 +1,326 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from services.common.schemas import JobStatus, JobStatusResponse, ProductAnalysisResponse
+from services.vision.services.rate_limiter import ProviderOverloadedError
+from services.vision.services.vision_engine import IVisionService
+
+logger = logging.getLogger(__name__)
+
+class QueueFull(Exception):
+    pass
+
+class JobStore:
+    """
+    Persistent job queue in SQLite (WAL). Jobs survive restarts: anything left
+    `running` by a crashed process is put back in the queue on startup. Several
+    processes can share one queue; each claims jobs under its own `owner` id, random
+    unless given (a stable id lets a supervisor requeue a dead process's jobs).
+    """
+    def __init__(self, path: str, owner: Optional[str] = None):
+        self.owner = owner or uuid.uuid4().hex
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, image_urls TEXT NOT NULL, product_id TEXT,"
+            " callback_url TEXT, result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL, available_at REAL NOT NULL, started_at REAL, finished_at REAL,"
+            " callback_status TEXT)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, available_at)")
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+        if "owner" not in columns: # queue files created before multi-worker support
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+
+    def submit(
+        self, image_urls: List[str], product_id: Optional[str], callback_url: Optional[str], max_pending: int
+    ) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.lock:
+            pending = self.conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (JobStatus.QUEUED, JobStatus.RUNNING)
+            ).fetchone()[0]
+            if pending >= max_pending:
+                raise QueueFull(f"Job queue is full ({pending} pending jobs).")
+            self.conn.execute(
+                "INSERT INTO jobs (id, status, image_urls, product_id, callback_url, created_at, available_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, JobStatus.QUEUED, json.dumps(image_urls), product_id, callback_url, now, now),
+            )
+        return job_id
+
+    def claim(self) -> Optional[Dict]:
+        """
+        Atomically moves the oldest available queued job to `running` and returns it.
+        """
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, attempts = attempts + 1, owner = ?"
+                " WHERE id = (SELECT id FROM jobs WHERE status = ? AND available_at <= ?"
+                " ORDER BY available_at LIMIT 1)"
+                " RETURNING id, image_urls, product_id, callback_url, attempts",
+                (JobStatus.RUNNING, now, self.owner, JobStatus.QUEUED, now),
+            ).fetchone()
+        if row is None:
+            return None
+        job_id, image_urls, product_id, callback_url, attempts = row
+        return {
+            "id": job_id,
+            "image_urls": json.loads(image_urls),
+            "product_id": product_id,
+            "callback_url": callback_url,
+            "attempts": attempts,
+        }
+
+    def complete(self, job_id: str, result: str):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = NULL, finished_at = ? WHERE id = ?",
+                (JobStatus.SUCCEEDED, result, time.time(), job_id),
+            )
+
+    def fail(self, job_id: str, error: str):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                (JobStatus.FAILED, error, time.time(), job_id),
+            )
+
+    def retry_later(self, job_id: str, delay: float, count_attempt: bool = True):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, available_at = ?, attempts = attempts - ? WHERE id = ?",
+                (JobStatus.QUEUED, time.time() + delay, 0 if count_attempt else 1, job_id),
+            )
+
+    def set_callback_status(self, job_id: str, callback_status: str):
+        with self.lock:
+            self.conn.execute("UPDATE jobs SET callback_status = ? WHERE id = ?", (callback_status, job_id))
+
+    def get(self, job_id: str) -> Optional[JobStatusResponse]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT id, status, product_id, result, error, attempts, created_at, started_at, finished_at,"
+                " callback_status FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        job_id, status, product_id, result, error, attempts, created_at, started_at, finished_at, callback_status = row
+        return JobStatusResponse(
+            job_id=job_id,
+            status=status,
+            product_id=product_id,
+            result=ProductAnalysisResponse.model_validate_json(result) if result else None,
+            error=error,
+            attempts=attempts,
+            created_at=created_at,
+            started_at=started_at,
+            finished_at=finished_at,
+            callback_status=callback_status,
+        )
+
+    def requeue_running(self, owner: Optional[str] = None) -> int:
+        """
+        Returns running jobs to the queue: those claimed by `owner`, or every running
+        job (orphaned by a previous process) when no owner is given.
+        """
+        query = "UPDATE jobs SET status = ?, available_at = ? WHERE status = ?"
+        params = [JobStatus.QUEUED, time.time(), JobStatus.RUNNING]
+        if owner is not None:
+            query += " AND owner = ?"
+            params.append(owner)
+        with self.lock:
+            return self.conn.execute(query, params).rowcount
+
+    def purge_finished(self, older_than_seconds: float) -> int:
+        with self.lock:
+            return self.conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (JobStatus.SUCCEEDED, JobStatus.FAILED, time.time() - older_than_seconds),
+            ).rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self.lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status.value: 0 for status in JobStatus} | dict(rows)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class JobWorkerPool:
+    """
+    Runs queued jobs through the analysis service with `concurrency` worker tasks.
+    Workers are woken on submit and otherwise poll, so delayed retries are picked up.
+    A job that hits provider backpressure goes back to the queue after the advertised
+    delay; other errors are retried up to `max_attempts` before the job fails.
+
+    With `requeue_on_start` off, start() leaves other processes' running jobs alone
+    (for workers sharing a queue, where the launcher requeues orphans once).
+    """
+    POLL_INTERVAL = 1.0
+
+    def __init__(
+        self,
+        store: JobStore,
+        service: IVisionService,
+        concurrency: int,
+        max_attempts: int = 3,
+        retry_backoff: float = 2.0,
+        callback_timeout: float = 10.0,
+        callback_attempts: int = 3,
+        callback_secret: str = "",
+        retention_seconds: float = 24 * 3600.0,
+        on_result: Optional[Callable[[List[ProductAnalysisResponse]], Awaitable[None]]] = None,
+        requeue_on_start: bool = True,
+    ):
+        self.store = store
+        self.service = service
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.callback_timeout = callback_timeout
+        self.callback_attempts = callback_attempts
+        self.callback_secret = callback_secret
+        self.retention_seconds = retention_seconds
+        self.on_result = on_result # e.g. AnalysisPipeline.record
+        self.requeue_on_start = requeue_on_start
+        self.draining = False
+        self.wakeup = asyncio.Event()
+        self.tasks: List[asyncio.Task] = []
+        self.client: Optional[httpx.AsyncClient] = None
+        self.last_purge = 0.0
+        self.stats = {"processed": 0, "failed": 0, "retried": 0, "callbacks_sent": 0, "callbacks_failed": 0}
+
+    def start(self):
+        requeued = self.store.requeue_running() if self.requeue_on_start else 0
+        if requeued:
+            logger.info("Requeued jobs left running by a previous process", extra={"jobs": requeued})
+        self.client = httpx.AsyncClient(timeout=self.callback_timeout)
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def submit(self, image_urls: List[str], product_id: Optional[str], callback_url: Optional[str], max_pending: int) -> str:
+        job_id = await asyncio.to_thread(self.store.submit, image_urls, product_id, callback_url, max_pending)
+        self.wakeup.set()
+        return job_id
+
+    async def _worker(self):
+        while not self.draining:
+            job = None
+            try:
+                # Cleared before claiming, so a submit that lands after an empty claim still wakes us
+                self.wakeup.clear()
+                job = await asyncio.to_thread(self.store.claim)
+                if job is None:
+                    if time.monotonic() - self.last_purge > 3600:
+                        self.last_purge = time.monotonic()
+                        await asyncio.to_thread(self.store.purge_finished, self.retention_seconds)
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(), self.POLL_INTERVAL)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._run(job)
+            except Exception as e:
+                # One bad job (or a store hiccup) must not take this worker down with it
+                logger.exception("Job worker error", extra={"job_id": job["id"] if job else None, "error": str(e)})
+                await asyncio.sleep(self.POLL_INTERVAL)
+
+    async def _run(self, job: Dict):
+        try:
+            result = await self.service.analyze_images(job["image_urls"])
+        except ProviderOverloadedError as e:
+            # Backpressure is not the job's fault: wait it out without spending an attempt
+            self.stats["retried"] += 1
+            await asyncio.to_thread(self.store.retry_later, job["id"], e.retry_after or 5.0, False)
+            return
+        except Exception as e:
+            if job["attempts"] < self.max_attempts:
+                self.stats["retried"] += 1
+                await asyncio.to_thread(
+                    self.store.retry_later, job["id"], self.retry_backoff * 2 ** (job["attempts"] - 1)
+                )
+                return
+            self.stats["failed"] += 1
+            await asyncio.to_thread(self.store.fail, job["id"], str(e))
+        else:
+            if job["product_id"]:
+                result.product_id = job["product_id"]
+            self.stats["processed"] += 1
+            await asyncio.to_thread(self.store.complete, job["id"], result.model_dump_json())
+            if self.on_result is not None:
+                try:
+                    await self.on_result([result])
+                except Exception as e:
+                    # The job itself succeeded; its client still gets the callback
+                    logger.exception("Job result hook failed", extra={"job_id": job["id"], "error": str(e)})
+
+        if job["callback_url"]:
+            await self._send_callback(job["id"], job["callback_url"])
+
+    async def _send_callback(self, job_id: str, callback_url: str):
+        """
+        POSTs the final job status to the client's callback URL. When a secret is set,
+        the body is signed (X-Signature: sha256=<hmac>) so receivers can verify it.
+        """
+        status = await asyncio.to_thread(self.store.get, job_id)
+        body = status.model_dump_json().encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if self.callback_secret:
+            digest = hmac.new(self.callback_secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+            headers["X-Signature"] = f"sha256={digest}"
+
+        for attempt in range(self.callback_attempts):
+            try:
+                resp = await self.client.post(callback_url, content=body, headers=headers)
+                resp.raise_for_status()
+                self.stats["callbacks_sent"] += 1
+                await asyncio.to_thread(self.store.set_callback_status, job_id, "delivered")
+                return
+            except httpx.HTTPError as e:
+                logger.warning("Job callback failed", extra={"job_id": job_id, "attempt": attempt + 1, "error": str(e)})
+                if attempt + 1 < self.callback_attempts:
+                    await asyncio.sleep(2.0 ** attempt)
+        self.stats["callbacks_failed"] += 1
+        await asyncio.to_thread(self.store.set_callback_status, job_id, "failed")
+
+    def snapshot(self) -> Dict:
+        return {**self.stats, "workers": len(self.tasks), "jobs": self.store.counts()}
+
+    async def aclose(self, drain_timeout: float = 0.0):
+        """
+        Stops claiming jobs and gives the running ones up to `drain_timeout` seconds to
+        finish before cancelling them.
+        """
+        self.draining = True
+        self.wakeup.set() # idle workers see `draining` and exit
+        if self.tasks and drain_timeout > 0:
+            _, pending = await asyncio.wait(self.tasks, timeout=drain_timeout)
+            if pending:
+                logger.warning("Cancelling jobs still running after the drain timeout", extra={"jobs": len(pending)})
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+        # Jobs interrupted mid-analysis are requeued here, or on the next start after a crash
+        self.store.requeue_running(self.store.owner)
+        self.store.close()
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+from services.vision.models.image_payload import ImageSource
+from services.common.schemas import ProductAnalysisResponse
+from services.vision.services.rate_limiter import ProviderOverloadedError
+from services.vision.services.vision_engine import IVisionService
+
+logger = logging.getLogger(__name__)
+
+class MicroBatchingVisionService(IVisionService):
+    """
+    Collects concurrent analyze_images calls for up to `max_wait` seconds and sends
+    them to the provider as one multi-product request (inner.analyze_batch), so the
+    fixed system prompt is paid once per batch instead of once per product.
+    Products the batch answer does not cover are retried with single calls.
+    """
+    def __init__(self, inner: IVisionService, max_batch_size: int, max_wait: float, max_images: int):
+        self.inner = inner
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_images = max_images # Provider limit on images in one request
+        self.model = getattr(inner, "model", type(inner).__name__)
+        self.pending: List[Tuple[List[ImageSource], asyncio.Future]] = []
+        self.pending_images = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.tasks: Set[asyncio.Task] = set()
+        self.stats = {"batches": 0, "batched_products": 0, "single_calls": 0, "fallbacks": 0}
+
+    async def analyze_images(self, image_urls: List[ImageSource]) -> ProductAnalysisResponse:
+        if self.max_batch_size <= 1 or len(image_urls) >= self.max_images:
+            self.stats["single_calls"] += 1
+            return await self.inner.analyze_images(image_urls)
+
+        if self.pending_images + len(image_urls) > self.max_images:
+            self._flush()
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((image_urls, future))
+        self.pending_images += len(image_urls)
+        if len(self.pending) >= self.max_batch_size:
+            self._flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending, self.pending_images = self.pending, [], 0
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, batch: List[Tuple[List[ImageSource], asyncio.Future]]):
+        # Callers that went away while waiting are dropped before the provider call
+        live = [(images, future) for images, future in batch if not future.done()]
+        if not live:
+            return
+        if len(live) == 1:
+            self.stats["single_calls"] += 1
+            results: List[Optional[ProductAnalysisResponse]] = [None]
+        else:
+            self.stats["batches"] += 1
+            self.stats["batched_products"] += len(live)
+            try:
+                results = await self.inner.analyze_batch([images for images, _ in live])
+            except ProviderOverloadedError as e:
+                for _, future in live:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            except Exception as e:
+                logger.warning("Batched analysis failed, falling back to single calls", extra={"error": str(e)})
+                results = [None] * len(live)
+            self.stats["fallbacks"] += sum(1 for result in results if result is None)
+            for result in results:
+                if result is not None:
+                    result._prompt_template = "batch"
+
+        async def resolve(images: List[ImageSource], future: asyncio.Future, result: Optional[ProductAnalysisResponse]):
+            try:
+                if result is None:
+                    result = await self.inner.analyze_images(images)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                return
+            if not future.done():
+                future.set_result(result)
+
+        await asyncio.gather(*(resolve(images, future, result) for (images, future), result in zip(live, results)))
+
+    def snapshot(self) -> Dict:
+        return {**self.stats, "pending": len(self.pending)}
@@ -0,0 +1,223 @@
+import asyncio
+import time
+from typing import Dict, Iterable, Optional
+
+from services.vision.config import settings
+from services.common.schemas import ProductAnalysisResponse
+from services.vision.services.coalescing import CoalescingVisionService, SingleFlight
+from services.vision.services.image_dedup import DedupVisionService, PerceptualIndex
+from services.vision.services.image_fetcher import DiskBlobCache, ImageFetcher, PrefetchingVisionService
+from services.vision.services.image_preprocessor import ImagePreprocessor, PreprocessingVisionService
+from services.vision.services.micro_batcher import MicroBatchingVisionService
+from services.vision.services.provider_router import ProviderRouter
+from services.vision.services.result_cache import (
+    CachedVisionService,
+    MemoryResultCache,
+    ResultCacheBackend,
+    SqliteResultCache,
+)
+from services.vision.services.results_store import ResultsStore
+from services.vision.services.similarity import SimilarityIndex
+from services.vision.services.vision_engine import IVisionService, get_vision_service
+
+class AnalysisPipeline:
+    """
+    The provider plus every stage wrapped around it. Built once per process (in the
+    app lifespan or by the batch CLI) so clients, pools and caches are reused across
+    requests, and closed on shutdown.
+    """
+    def __init__(
+        self,
+        provider: IVisionService,
+        service: IVisionService,
+        single_flight: SingleFlight,
+        result_cache: Optional[ResultCacheBackend] = None,
+        image_fetcher: Optional[ImageFetcher] = None,
+        preprocessor: Optional[ImagePreprocessor] = None,
+        micro_batcher: Optional[MicroBatchingVisionService] = None,
+        dedup: Optional[DedupVisionService] = None,
+        results_store: Optional[ResultsStore] = None,
+    ):
+        self.provider = provider
+        self.service = service
+        self.single_flight = single_flight
+        self.result_cache = result_cache
+        self.image_fetcher = image_fetcher
+        self.preprocessor = preprocessor
+        self.micro_batcher = micro_batcher
+        self.dedup = dedup
+        self.results_store = results_store
+        self._similarity: Optional[SimilarityIndex] = None
+
+    @property
+    def similarity(self) -> Optional[SimilarityIndex]:
+        """
+        k-NN index over the results store, created on first use (and again if the
+        store is swapped).
+        """
+        if self.results_store is None:
+            return None
+        if self._similarity is None or self._similarity.store is not self.results_store:
+            self._similarity = SimilarityIndex(
+                self.results_store,
+                cell_width=settings.SIMILARITY_GRID_CELL_WIDTH,
+                exact_threshold=settings.SIMILARITY_EXACT_THRESHOLD,
+            )
+        return self._similarity
+
+    async def record(self, results: Iterable[Optional[ProductAnalysisResponse]]):
+        """
+        Keeps finished analyses in the results store so they can be queried later
+        without new LLM calls. Mock fallbacks are not real measurements and are skipped.
+        Rows are written to disk in bulk once enough have accumulated (or aged), and
+        superseded rows are compacted away once they make up enough of the store.
+        """
+        store = self.results_store
+        if store is None:
+            return
+        # Off the event loop: the store's lock is also held by queries while they scan
+        await asyncio.to_thread(store.append, [result for result in results if result is not None and not result.is_fallback])
+        if store.pending_rows >= settings.RESULTS_FLUSH_ROWS or (
+            store.pending_rows and time.monotonic() - store.last_flush >= settings.RESULTS_FLUSH_SECONDS
+        ):
+            await asyncio.to_thread(store.flush)
+        if store.superseded >= settings.RESULTS_COMPACT_MIN_ROWS and store.superseded >= store.n * settings.RESULTS_COMPACT_FRACTION:
+            await asyncio.to_thread(store.compact)
+
+    def stats(self) -> Dict:
+        return {
+            "result_cache": self.result_cache.stats() if self.result_cache is not None else None,
+            "preprocess": self.preprocessor.stats.model_dump() if self.preprocessor is not None else None,
+            "image_fetcher": self.image_fetcher.stats if self.image_fetcher is not None else None,
+            "coalescing": self.single_flight.stats(),
+            "micro_batching": self.micro_batcher.snapshot() if self.micro_batcher is not None else None,
+            "dedup": self.dedup.snapshot() if self.dedup is not None else None,
+            "results_store": self.results_store.snapshot() if self.results_store is not None else None,
+            "similarity": self._similarity.snapshot() if self._similarity is not None else None,
+            "provider_throttle": self.provider.throttle.snapshot() if hasattr(self.provider, "throttle") else None,
+            "response_parser": self.provider.parser.snapshot() if hasattr(self.provider, "parser") else None,
+            "prompts": self.provider.prompt_usage.snapshot() if hasattr(self.provider, "prompt_usage") else None,
+            "router": self.provider.snapshot() if isinstance(self.provider, ProviderRouter) else None,
+        }
+
+    async def aclose(self):
+        if self.preprocessor is not None:
+            await self.preprocessor.aclose()
+        if self.image_fetcher is not None:
+            await self.image_fetcher.aclose()
+        await self.provider.aclose()
+        if self.results_store is not None:
+            await asyncio.to_thread(self.results_store.flush)
+
+def build_result_cache() -> Optional[ResultCacheBackend]:
+    backend = settings.RESULT_CACHE_BACKEND.lower()
+    if backend == "none":
+        return None
+    if backend == "sqlite":
+        return SqliteResultCache(
+            settings.RESULT_CACHE_PATH, settings.RESULT_CACHE_MAX_ENTRIES, settings.RESULT_CACHE_TTL_SECONDS
+        )
+    return MemoryResultCache(settings.RESULT_CACHE_MAX_ENTRIES, settings.RESULT_CACHE_TTL_SECONDS)
+
+def build_image_fetcher() -> ImageFetcher:
+    cache = None
+    if settings.IMAGE_CACHE_DIR:
+        cache = DiskBlobCache(settings.IMAGE_CACHE_DIR, settings.IMAGE_CACHE_MAX_BYTES)
+    return ImageFetcher(
+        per_host_limit=settings.IMAGE_FETCH_PER_HOST_LIMIT,
+        timeout=settings.IMAGE_FETCH_TIMEOUT,
+        cache=cache,
+        max_bytes=settings.IMAGE_FETCH_MAX_BYTES,
+        max_redirects=settings.IMAGE_FETCH_MAX_REDIRECTS,
+        allow_private_hosts=settings.IMAGE_FETCH_ALLOW_PRIVATE_HOSTS,
+    )
+
+def build_provider() -> IVisionService:
+    """
+    The provider named by LLM_PROVIDER, or a router across all of them when it lists several.
+    """
+    names = [name.strip().lower() for name in settings.LLM_PROVIDER.split(",") if name.strip()]
+    if len(names) <= 1:
+        return get_vision_service()
+    return ProviderRouter(
+        {name: get_vision_service(name) for name in names},
+        window=settings.ROUTER_WINDOW,
+        max_age=settings.ROUTER_WINDOW_SECONDS,
+        min_samples=settings.ROUTER_MIN_SAMPLES,
+        failure_threshold=settings.ROUTER_BREAKER_FAILURES,
+        reset_timeout=settings.ROUTER_BREAKER_RESET_SECONDS,
+        hedge=settings.ROUTER_HEDGE_ENABLED,
+        hedge_quantile=settings.ROUTER_HEDGE_QUANTILE,
+        hedge_min_delay=settings.ROUTER_HEDGE_MIN_DELAY_MS / 1000.0,
+        hedge_max_delay=settings.ROUTER_HEDGE_MAX_DELAY_MS / 1000.0,
+    )
+
+def build_pipeline() -> AnalysisPipeline:
+    """
+    The configured provider wrapped with the analysis pipeline stages:
+    result cache -> request coalescing -> image preprocessing (or plain prefetching)
+    -> perceptual dedup -> micro-batching -> provider.
+    """
+    provider = build_provider()
+    service = provider
+
+    micro_batcher = None
+    if settings.MICRO_BATCH_ENABLED:
+        micro_batcher = MicroBatchingVisionService(
+            service,
+            max_batch_size=settings.MICRO_BATCH_MAX_SIZE,
+            max_wait=settings.MICRO_BATCH_MAX_WAIT_MS / 1000.0,
+            max_images=settings.MICRO_BATCH_MAX_IMAGES,
+        )
+        service = micro_batcher
+
+    dedup = None
+    if settings.DEDUP_ENABLED:
+        dedup = DedupVisionService(
+            service,
+            PerceptualIndex(settings.DEDUP_INDEX_PATH or None, settings.DEDUP_MAX_ENTRIES),
+            max_distance=settings.DEDUP_MAX_DISTANCE,
+            algorithm=settings.DEDUP_HASH_ALGORITHM.lower(),
+        )
+        service = dedup
+
+    image_fetcher = None
+    preprocessor = None
+    if settings.IMAGE_PREPROCESS_ENABLED:
+        image_fetcher = build_image_fetcher()
+        preprocessor = ImagePreprocessor(
+            max_edge=settings.IMAGE_MAX_EDGE,
+            output_format=settings.IMAGE_OUTPUT_FORMAT,
+            quality=settings.IMAGE_OUTPUT_QUALITY,
+            max_workers=settings.IMAGE_PREPROCESS_WORKERS,
+            fetcher=image_fetcher,
+        )
+        service = PreprocessingVisionService(service, preprocessor)
+    elif settings.IMAGE_PREFETCH_ENABLED or settings.DEDUP_ENABLED:
+        # Dedup hashes image bytes, so it needs the images downloaded here
+        image_fetcher = build_image_fetcher()
+        service = PrefetchingVisionService(service, image_fetcher)
+
+    single_flight = SingleFlight()
+    service = CoalescingVisionService(service, single_flight)
+
+    # The cache sits outermost so hits skip fetching and re-encoding entirely
+    result_cache = build_result_cache()
+    if result_cache is not None:
+        service = CachedVisionService(service, result_cache)
+
+    results_store = None
+    if settings.RESULTS_STORE_ENABLED:
+        results_store = ResultsStore(settings.RESULTS_STORE_DIR or None, writer=settings.RESULTS_STORE_WRITER)
+
+    return AnalysisPipeline(
+        provider=provider,
+        service=service,
+        single_flight=single_flight,
+        result_cache=result_cache,
+        image_fetcher=image_fetcher,
+        preprocessor=preprocessor,
+        micro_batcher=micro_batcher,
+        dedup=dedup,
+        results_store=results_store,
+    )
@@ -1,5 +1,7 @@
 import json
-from services.vision.models.schemas import ProductAnalysisResponse
+
+from services.common.schemas import ProductAnalysisResponse
+from services.vision.services.response_parser import coerce_fields, extract_json
 
 SYSTEM_PROMPT = """
 You are a highly advanced Visual Product Measurement System. 
@@ -27,19 +29,54 @@ Output must be a valid JSON object matching the specified schema.
 (The user will parse your output into Pydantic models. Ensure keys match exact snake_case names.)
 """
 
+BATCH_INSTRUCTIONS = """
+# MULTIPLE PRODUCTS
+This request contains several different products. Each product's images are introduced
+by a line "Product <key>:". Analyze every product independently, using only its own images.
+Respond with one JSON object of the form {"results": [ ... ]}, holding one entry per product.
+Each entry has a "key" field with the product key, plus the `continuous_dimensions`,
+`discrete_attributes` and `metadata` objects described above.
+"""
+
+USER_PROMPT = "Analyze these product images and extract the visual measurements."
+
 class PromptManager:
     @staticmethod
     def construct_system_prompt() -> str:
         return SYSTEM_PROMPT
 
     @staticmethod
-    def construct_user_message(image_urls: list[str]) -> list:
-        content = [
-            {"type": "text", "text": "Analyze these product images and extract the visual measurements."}
-        ]
-        for url in image_urls:
-            content.append({
-                "type": "image_url",
-                "image_url": {"url": url}
-            })
-        return content
+    def construct_batch_system_prompt() -> str:
+        return SYSTEM_PROMPT + BATCH_INSTRUCTIONS
+
+    @staticmethod
+    def construct_field_retry_message(fields: list[str]) -> str:
+        """
+        Follow-up turn asking only for the fields the first answer got wrong.
+        """
+        listed = ", ".join(f"`{field}`" for field in fields)
+        return (
+            f"These fields of your answer were missing or invalid: {listed}. "
+            "Respond with a JSON object containing only those fields, nested under their "
+            "section keys as in the schema, with valid values."
+        )
+
+    @staticmethod
+    def parse_batch_response(content: str, keys: list[str]) -> dict[str, ProductAnalysisResponse]:
+        """
+        Splits a multi-product answer back into one response per key. Entries that are
+        missing, unknown or invalid are left out so the caller can retry them singly.
+        """
+        data = json.loads(extract_json(content)[0])
+        entries = data.get("results", []) if isinstance(data, dict) else data
+        parsed = {}
+        for entry in entries if isinstance(entries, list) else []:
+            if not isinstance(entry, dict) or entry.get("key") not in keys:
+                continue
+            try:
+                parsed[entry["key"]] = ProductAnalysisResponse.model_validate(
+                    coerce_fields({k: v for k, v in entry.items() if k != "key"}, ProductAnalysisResponse)
+                )
+            except ValueError:
+                continue
+        return parsed
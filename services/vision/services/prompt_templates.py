@@ -0,0 +1,191 @@
+import base64
+import hashlib
+import json
+import math
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from prometheus_client import Counter
+
+from services.common.observability import stage
+from services.common.schemas import ProductAnalysisResponse
+from services.vision.config import settings
+from services.vision.models.image_payload import ImagePayload, ImageSource
+from services.vision.services.prompt_manager import USER_PROMPT, PromptManager
+
+PROMPT_TOKENS = Counter(
+    "llm_prompt_tokens_total",
+    "Provider input tokens by prompt template and version: estimated before the call, reported by the provider after it.",
+    ["template", "version", "source"],
+)
+
+CHARS_PER_TOKEN = 4 # Rough average for English prose and JSON
+MESSAGE_OVERHEAD_TOKENS = 4 # Role markers and separators around each chat message
+
+def _dumps(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+@lru_cache(maxsize=None)
+def _schema_json() -> bytes:
+    return json.dumps(ProductAnalysisResponse.model_json_schema(), sort_keys=True).encode("utf-8")
+
+def estimate_text_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def text_part(text: str) -> bytes:
+    return b'{"type":"text","text":' + _dumps(text) + b"}"
+
+def image_part(image: ImageSource) -> bytes:
+    """
+    Serialized image_url message part. Uploads are base64-encoded straight into the
+    body, without building a data: URL string first.
+    """
+    if isinstance(image, ImagePayload):
+        with stage("base64_encode"):
+            encoded = base64.b64encode(image.data)
+        mime = _dumps(image.mime_type)[1:-1]
+        return b'{"type":"image_url","image_url":{"url":"data:' + mime + b";base64," + encoded + b'"}}'
+    return b'{"type":"image_url","image_url":{"url":' + _dumps(image) + b"}}"
+
+class PromptTemplate:
+    """
+    The static part of a chat completions request (model, sampling options, system
+    prompt and an optional fixed user text) serialized once. Requests serialize only
+    their own message parts and are spliced in after it.
+
+    `version` digests everything besides the images that shapes an answer, the
+    response schema included: results made under another version are out of date.
+    """
+    def __init__(
+        self,
+        name: str,
+        model: str,
+        system_prompt: str,
+        user_prompt: Optional[str] = None,
+        temperature: float = 0.1,
+        tokens_per_image: Optional[int] = None,
+    ):
+        self.name = name
+        static = {
+            "model": model,
+            "temperature": temperature,
+            "response_format": {"type": "json_object"},
+            "messages": [{"role": "system", "content": system_prompt}],
+        }
+        # Left open after the system message: requests append their turns and close it
+        self.prefix = _dumps(static)[:-2]
+        self.user_prefix = [text_part(user_prompt)] if user_prompt is not None else []
+        self.version = hashlib.sha256(self.prefix + b"".join(self.user_prefix) + _schema_json()).hexdigest()[:12]
+        self.static_tokens = estimate_text_tokens(system_prompt) + 2 * MESSAGE_OVERHEAD_TOKENS
+        if user_prompt is not None:
+            self.static_tokens += estimate_text_tokens(user_prompt)
+        self.tokens_per_image = settings.PROMPT_TOKENS_PER_IMAGE if tokens_per_image is None else tokens_per_image
+
+    def request(self, images: List[ImageSource] = ()) -> "PromptRequest":
+        request = PromptRequest(self, list(self.user_prefix), self.static_tokens)
+        request.add_images(images)
+        return request
+
+class PromptRequest:
+    """
+    One provider request: the template's serialized prefix, this request's user
+    content parts and follow-up turns, and the input tokens estimated for all of it.
+    """
+    def __init__(self, template: PromptTemplate, parts: List[bytes], estimated_tokens: int, turns: List[bytes] = ()):
+        self.template = template
+        self.parts = parts
+        self.turns = list(turns)
+        self.estimated_tokens = estimated_tokens
+
+    def add_text(self, text: str):
+        self.parts.append(text_part(text))
+        self.estimated_tokens += estimate_text_tokens(text)
+
+    def add_images(self, images: List[ImageSource]):
+        for image in images:
+            self.parts.append(image_part(image))
+        self.estimated_tokens += len(images) * self.template.tokens_per_image
+
+    def follow_up(self, answer: str, question: str) -> "PromptRequest":
+        """
+        The same request continued with the model's answer and another user turn.
+        """
+        turns = self.turns + [
+            _dumps({"role": "assistant", "content": answer}),
+            _dumps({"role": "user", "content": question}),
+        ]
+        added = estimate_text_tokens(answer) + estimate_text_tokens(question) + 2 * MESSAGE_OVERHEAD_TOKENS
+        return PromptRequest(self.template, self.parts, self.estimated_tokens + added, turns)
+
+    def body(self, max_tokens: int) -> bytes:
+        chunks = [self.template.prefix, b',{"role":"user","content":[', b",".join(self.parts), b"]}"]
+        for turn in self.turns:
+            chunks += [b",", turn]
+        chunks.append(b'],"max_tokens":%d}' % max_tokens)
+        return b"".join(chunks)
+
+@lru_cache(maxsize=None)
+def get_template(kind: str, model: str) -> PromptTemplate:
+    """
+    The shared template for a request kind: "single" (one product) or "batch"
+    (several products, each introduced by its key).
+    """
+    if kind == "single":
+        return PromptTemplate("single", model, PromptManager.construct_system_prompt(), USER_PROMPT)
+    if kind == "batch":
+        return PromptTemplate("batch", model, PromptManager.construct_batch_system_prompt())
+    raise ValueError(f"Unknown prompt template: {kind}")
+
+def batch_request(model: str, products: Dict[str, List[ImageSource]]) -> PromptRequest:
+    """
+    One request for several products, keyed so the answers can be matched back.
+    """
+    request = get_template("batch", model).request()
+    request.add_text(f"Analyze each of these products ({', '.join(products)}) and extract the visual measurements.")
+    for key, images in products.items():
+        request.add_text(f"Product {key}:")
+        request.add_images(images)
+    return request
+
+class PromptUsage:
+    """
+    Input tokens per template version, estimated and as reported by the provider, so
+    the estimate (and PROMPT_TOKENS_PER_IMAGE) can be checked against real usage.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.templates: Dict[str, Dict] = {}
+
+    def record(self, request: PromptRequest, reported: Optional[int]):
+        template = request.template
+        PROMPT_TOKENS.labels(template.name, template.version, "estimated").inc(request.estimated_tokens)
+        if reported is not None:
+            PROMPT_TOKENS.labels(template.name, template.version, "reported").inc(reported)
+        with self.lock:
+            entry = self.templates.setdefault(f"{template.name}:{template.version}", {
+                "template": template.name,
+                "version": template.version,
+                "requests": 0,
+                "estimated_tokens": 0,
+                "reported_requests": 0,
+                "reported_tokens": 0,
+                "estimated_for_reported": 0,
+            })
+            entry["requests"] += 1
+            entry["estimated_tokens"] += request.estimated_tokens
+            if reported is not None:
+                entry["reported_requests"] += 1
+                entry["reported_tokens"] += reported
+                entry["estimated_for_reported"] += request.estimated_tokens
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            entries = [dict(entry) for entry in self.templates.values()]
+        snapshot = {}
+        for entry in entries:
+            estimated = entry.pop("estimated_for_reported")
+            # Reported / estimated over the calls that have both; 1.0 is a perfect estimate
+            entry["reported_to_estimated"] = round(entry["reported_tokens"] / estimated, 3) if estimated else None
+            snapshot[f'{entry["template"]}:{entry["version"]}'] = entry
+        return snapshot
@@ -0,0 +1,299 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from prometheus_client import Counter
+
+from services.vision.models.image_payload import ImageSource
+from services.common.schemas import ProductAnalysisResponse
+from services.vision.services.rate_limiter import ProviderOverloadedError
+from services.vision.services.vision_engine import IVisionService
+
+logger = logging.getLogger(__name__)
+
+ROUTED_CALLS = Counter(
+    "provider_routed_calls_total", "Provider calls made by the router, by outcome.", ["provider", "outcome"]
+)
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds; then lets a single trial call through (half-open) whose
+    outcome closes or re-opens it.
+    """
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def available(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self.trial_running)
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def on_call(self):
+        if self.state == "half_open":
+            self.trial_running = True
+
+    def on_cancel(self):
+        self.trial_running = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.trial_running or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self.trial_running:
+                logger.warning("Circuit breaker opened", extra={"failures": self.failures})
+            self.opened_at = time.monotonic()
+        self.trial_running = False
+
+class ProviderStats:
+    """
+    Latency and outcome of a provider's recent calls: the last `window` calls, minus
+    any older than `max_age` seconds so a provider that recovered is re-measured.
+    """
+    def __init__(self, window: int, max_age: float):
+        self.samples: Deque[Tuple[float, float, bool]] = deque(maxlen=window) # (at, latency, ok)
+        self.max_age = max_age
+        self.inflight = 0
+
+    def record(self, latency: float, ok: bool):
+        self.samples.append((time.monotonic(), latency, ok))
+
+    def _recent(self) -> List[Tuple[float, float, bool]]:
+        cutoff = time.monotonic() - self.max_age
+        while self.samples and self.samples[0][0] < cutoff:
+            self.samples.popleft()
+        return list(self.samples)
+
+    def latency_quantile(self, q: float) -> Optional[float]:
+        # Failed calls often return fast; only successful calls describe the latency
+        latencies = sorted(latency for _, latency, ok in self._recent() if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def error_rate(self) -> float:
+        recent = self._recent()
+        return sum(1 for _, _, ok in recent if not ok) / len(recent) if recent else 0.0
+
+    def count(self) -> int:
+        return len(self._recent())
+
+class RoutedProvider:
+    def __init__(self, name: str, service: IVisionService, stats: ProviderStats, breaker: CircuitBreaker):
+        self.name = name
+        self.service = service
+        self.stats = stats
+        self.breaker = breaker
+
+class ProviderRouter(IVisionService):
+    """
+    Routes each analysis to the healthy provider with the lowest expected latency
+    (rolling p50 divided by success rate). Providers with fewer than `min_samples`
+    recent calls are tried first so they get measured. With hedging on, a duplicate
+    request goes to the next provider when the first has not answered within its own
+    p95 latency; whichever succeeds first wins and the other call is cancelled.
+    Failed calls (errors or mock fallbacks) fail over to the next provider.
+    """
+    def __init__(
+        self,
+        providers: Dict[str, IVisionService],
+        window: int = 100,
+        max_age: float = 300.0,
+        min_samples: int = 5,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        hedge: bool = False,
+        hedge_quantile: float = 0.95,
+        hedge_min_delay: float = 0.05,
+        hedge_max_delay: float = 30.0,
+    ):
+        if not providers:
+            raise ValueError("ProviderRouter needs at least one provider")
+        self.providers = [
+            RoutedProvider(name, service, ProviderStats(window, max_age), CircuitBreaker(failure_threshold, reset_timeout))
+            for name, service in providers.items()
+        ]
+        self.min_samples = min_samples
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_delay = hedge_max_delay
+        self.model = "+".join(getattr(p.service, "model", p.name) for p in self.providers)
+        self.counters = {"hedges": 0, "hedges_won": 0, "failovers": 0}
+
+    def _score(self, provider: RoutedProvider) -> Tuple[int, float]:
+        stats = provider.stats
+        if stats.count() + stats.inflight < self.min_samples:
+            return (0, 0.0)
+        p50 = stats.latency_quantile(0.5)
+        success = 1.0 - stats.error_rate()
+        if p50 is None or success <= 0:
+            return (2, 0.0)
+        return (1, p50 / success)
+
+    def ranked(self) -> List[RoutedProvider]:
+        # sorted() is stable, so ties keep the configured order
+        return sorted((p for p in self.providers if p.breaker.available()), key=self._score)
+
+    def _hedge_delay(self, provider: RoutedProvider) -> float:
+        delay = provider.stats.latency_quantile(self.hedge_quantile)
+        if delay is None:
+            delay = self.hedge_max_delay
+        return min(self.hedge_max_delay, max(self.hedge_min_delay, delay))
+
+    async def _call(self, provider: RoutedProvider, image_urls: List[ImageSource]) -> ProductAnalysisResponse:
+        provider.breaker.on_call()
+        provider.stats.inflight += 1
+        started = time.perf_counter()
+        try:
+            result = await provider.service.analyze_images(image_urls)
+        except asyncio.CancelledError:
+            provider.breaker.on_cancel()
+            ROUTED_CALLS.labels(provider.name, "cancelled").inc()
+            raise
+        except Exception:
+            self._record(provider, time.perf_counter() - started, False)
+            raise
+        finally:
+            provider.stats.inflight -= 1
+        self._record(provider, time.perf_counter() - started, not result.is_fallback)
+        return result
+
+    def _record(self, provider: RoutedProvider, latency: float, ok: bool):
+        provider.stats.record(latency, ok)
+        if ok:
+            provider.breaker.record_success()
+        else:
+            provider.breaker.record_failure()
+        ROUTED_CALLS.labels(provider.name, "ok" if ok else "failed").inc()
+
+    async def analyze_images(self, image_urls: List[ImageSource]) -> ProductAnalysisResponse:
+        candidates = self.ranked()
+        if not candidates:
+            retry_after = min(p.breaker.retry_after() for p in self.providers)
+            raise ProviderOverloadedError("All providers are unavailable (circuit open)", retry_after=retry_after)
+
+        loop = asyncio.get_running_loop()
+        running: Dict[asyncio.Task, RoutedProvider] = {}
+        hedge_task: Optional[asyncio.Task] = None
+        hedged = False
+        last_error: Optional[Exception] = None
+        fallback: Optional[ProductAnalysisResponse] = None
+
+        def launch() -> asyncio.Task:
+            provider = candidates.pop(0)
+            task = loop.create_task(self._call(provider, image_urls))
+            running[task] = provider
+            return task
+
+        primary = launch()
+        try:
+            while running:
+                timeout = None
+                if self.hedge and not hedged and candidates:
+                    timeout = self._hedge_delay(running[primary])
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    self.counters["hedges"] += 1
+                    hedge_task = launch()
+                    continue
+
+                for task in done:
+                    running.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        last_error = e
+                        continue
+                    if result.is_fallback:
+                        fallback = result
+                        continue
+                    if task is hedge_task:
+                        self.counters["hedges_won"] += 1
+                    return result
+
+                if not running and candidates:
+                    self.counters["failovers"] += 1
+                    primary = launch()
+        finally:
+            # The losing (or abandoned) calls are not needed any more
+            for task in running:
+                task.cancel()
+
+        if fallback is not None:
+            return fallback
+        raise last_error
+
+    async def analyze_batch(self, image_sets: List[List[ImageSource]]) -> List[Optional[ProductAnalysisResponse]]:
+        """
+        Sends the whole batch to the best provider, failing over to the next one on
+        error. Batches are not hedged: duplicating them would double the largest calls.
+        """
+        last_error: Optional[Exception] = None
+        fallback: Optional[List[Optional[ProductAnalysisResponse]]] = None
+        for provider in self.ranked():
+            provider.breaker.on_call()
+            started = time.perf_counter()
+            try:
+                results = await provider.service.analyze_batch(image_sets)
+            except asyncio.CancelledError:
+                provider.breaker.on_cancel()
+                raise
+            except Exception as e:
+                self._record(provider, time.perf_counter() - started, False)
+                last_error = e
+                continue
+            ok = any(result is not None and not result.is_fallback for result in results)
+            # Per-product latency keeps batch and single calls comparable
+            self._record(provider, (time.perf_counter() - started) / max(1, len(image_sets)), ok)
+            if ok:
+                return results
+            fallback = results
+        if fallback is not None:
+            return fallback
+        if last_error is not None:
+            raise last_error
+        retry_after = min(p.breaker.retry_after() for p in self.providers)
+        raise ProviderOverloadedError("All providers are unavailable (circuit open)", retry_after=retry_after)
+
+    async def aclose(self):
+        for provider in self.providers:
+            await provider.service.aclose()
+
+    def snapshot(self) -> Dict:
+        providers = {}
+        for provider in self.providers:
+            p50 = provider.stats.latency_quantile(0.5)
+            p95 = provider.stats.latency_quantile(self.hedge_quantile)
+            providers[provider.name] = {
+                "state": provider.breaker.state,
+                "samples": provider.stats.count(),
+                "inflight": provider.stats.inflight,
+                "error_rate": round(provider.stats.error_rate(), 4),
+                "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            }
+        return {**self.counters, "providers": providers}
@@ -0,0 +1,198 @@
+import asyncio
+import re
+import time
+from typing import Awaitable, Callable, Dict, Mapping, Optional, TypeVar
+
+T = TypeVar("T")
+
+DURATION_PART = re.compile(r"([\d.]+)(ms|h|m|s)")
+
+class ProviderOverloadedError(Exception):
+    """
+    The provider is at its rate limit and the request could not be admitted before its
+    queue deadline. Surfaced to clients as 429 with Retry-After instead of mock data.
+    """
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class ProviderRateLimited(Exception):
+    """
+    Raised by a provider call that was rejected with 429 (or an equivalent overload
+    response); the throttle backs off and retries it while the deadline allows.
+    """
+    def __init__(self, retry_after: Optional[float] = None, headers: Optional[Mapping[str, str]] = None):
+        super().__init__("Provider rate limit hit")
+        self.retry_after = retry_after
+        self.headers = headers or {}
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Parses rate-limit durations such as "7.66s", "2m59.56s", "120ms" or a bare "30".
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        return None
+    scale = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    return sum(float(amount) * scale[unit] for amount, unit in parts)
+
+class TokenBucket:
+    """
+    Classic token bucket for request rate, plus a hard pause when the provider tells
+    us (via headers or a 429) that the quota is exhausted until some time.
+    """
+    def __init__(self, rate_per_second: float, burst: int):
+        self.rate = rate_per_second
+        self.capacity = float(max(1, burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> float:
+        """
+        Takes a token and returns 0, or returns how long to wait before trying again.
+        """
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate if self.rate > 0 else 1.0
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency limit: grows by roughly one slot per window of successful calls
+    under the latency target, halves on a rate-limit signal, and shrinks gently when
+    latency runs over target.
+    """
+    def __init__(self, initial: int, min_limit: int, max_limit: int, latency_target: float):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self, deadline: float) -> bool:
+        async with self.condition:
+            while self.in_flight >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                try:
+                    await asyncio.wait_for(self.condition.wait(), remaining)
+                except asyncio.TimeoutError:
+                    return False
+            self.in_flight += 1
+            return True
+
+    async def release(self):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify()
+
+    def on_success(self, latency: float):
+        if latency > self.latency_target:
+            self._decrease(0.9)
+        elif self.in_flight + 1 >= int(self.limit):
+            # Only grow when the current limit is actually being used
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def on_overload(self):
+        self._decrease(0.5)
+
+    def _decrease(self, factor: float):
+        now = time.monotonic()
+        # At most one decrease per second: a burst of 429s is a single congestion event
+        if now - self.last_decrease < 1.0:
+            return
+        self.last_decrease = now
+        self.limit = max(float(self.min_limit), self.limit * factor)
+
+class ProviderThrottle:
+    """
+    Admission control in front of a provider client. Each call waits for a rate token
+    and a concurrency slot, retrying 429s after the advertised delay, until its queue
+    deadline passes; then ProviderOverloadedError is raised.
+    """
+    def __init__(self, bucket: TokenBucket, limiter: AdaptiveConcurrencyLimiter, queue_timeout: float):
+        self.bucket = bucket
+        self.limiter = limiter
+        self.queue_timeout = queue_timeout
+        self.stats = {"admitted": 0, "rate_limited": 0, "rejected": 0}
+
+    async def run(self, call: Callable[[], Awaitable[T]]) -> T:
+        deadline = time.monotonic() + self.queue_timeout
+        while True:
+            await self._wait_for_token(deadline)
+            if not await self.limiter.acquire(deadline):
+                self._reject("Timed out waiting for a provider concurrency slot.", None)
+
+            started = time.monotonic()
+            try:
+                result = await call()
+            except ProviderRateLimited as e:
+                self.stats["rate_limited"] += 1
+                self.limiter.on_overload()
+                self.observe_headers(e.headers)
+                self.bucket.pause(e.retry_after if e.retry_after is not None else 1.0)
+                continue
+            finally:
+                await self.limiter.release()
+
+            self.stats["admitted"] += 1
+            self.limiter.on_success(time.monotonic() - started)
+            return result
+
+    async def _wait_for_token(self, deadline: float):
+        while True:
+            wait = self.bucket.try_acquire()
+            if wait <= 0:
+                return
+            if time.monotonic() + wait > deadline:
+                self._reject("Provider rate limit reached; request could not be queued in time.", wait)
+            await asyncio.sleep(wait)
+
+    def _reject(self, message: str, retry_after: Optional[float]):
+        self.stats["rejected"] += 1
+        raise ProviderOverloadedError(message, retry_after=retry_after)
+
+    def observe_headers(self, headers: Mapping[str, str]):
+        """
+        Applies provider rate-limit headers (Groq/OpenAI style x-ratelimit-*, retry-after):
+        when a quota is exhausted, no new calls start until it resets.
+        """
+        for kind in ("requests", "tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if remaining is not None and remaining.strip() in ("0", "0.0"):
+                reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                if reset:
+                    self.bucket.pause(reset)
+        retry_after = parse_duration(headers.get("retry-after"))
+        if retry_after:
+            self.bucket.pause(retry_after)
+
+    def snapshot(self) -> Dict:
+        return {
+            **self.stats,
+            "concurrency_limit": round(self.limiter.limit, 2),
+            "in_flight": self.limiter.in_flight,
+        }
@@ -0,0 +1,374 @@
+import json
+import logging
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Type, get_args, get_origin
+
+from prometheus_client import Counter
+from pydantic import BaseModel, ValidationError
+
+from services.common.schemas import ProductAnalysisResponse
+
+logger = logging.getLogger(__name__)
+
+PARSE_OUTCOMES = Counter(
+    "llm_response_parse_total",
+    "Provider answers by parse outcome: clean, repaired, field_retry (fixed by a follow-up), failed.",
+    ["outcome"],
+)
+
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null", "NaN": "null", "Infinity": "null"}
+_TRUE_WORDS = {"true", "yes", "y", "1"}
+_FALSE_WORDS = {"false", "no", "n", "0", "none", ""}
+_NUMBER = re.compile(r"[-+]?\d+(?:\.\d+)?")
+
+_PLAIN = re.compile(r"[^\"'{}\[\]/A-Za-z_]+") # Numbers, whitespace and separators, copied as-is
+_STRING = re.compile(r'"(?:[^"\\\n]|\\.)*"') # A well-formed double-quoted string
+_SIMPLE_QUOTED = re.compile(r"'([^'\\\n]*)'") # A single-quoted string without escapes
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_DANGLING_NUMBER = re.compile(r"(\d)[.eE+-]+$")
+_DANGLING_KEY = re.compile(r'([{,])\s*"(?:[^"\\]|\\.)*"$')
+
+def extract_json(text: str) -> Tuple[str, List[str]]:
+    """
+    Cuts the first JSON object out of a model answer (skipping markdown fences and
+    surrounding prose) and repairs what models commonly get wrong: trailing commas,
+    comments, single-quoted strings, Python literals, unquoted keys, raw newlines in
+    strings, mismatched brackets and output truncated before the closing brackets.
+    One pass; runs of plain characters and well-formed strings are copied in bulk.
+    Returns the JSON text and the names of the repairs applied.
+    """
+    start = text.find("{")
+    if start < 0:
+        raise ValueError("No JSON object in response")
+    if start > 0 and text[:start].strip():
+        repairs = {"leading_text"}
+    else:
+        repairs = set()
+
+    out: List[str] = []
+    closers: List[str] = []
+    i, n = start, len(text)
+    while i < n:
+        c = text[i]
+        if c == '"':
+            match = _STRING.match(text, i)
+            if match is not None:
+                out.append(match.group())
+                i = match.end()
+                continue
+        elif c == "'":
+            match = _SIMPLE_QUOTED.match(text, i)
+            if match is not None:
+                repairs.add("single_quotes")
+                out.append(json.dumps(match.group(1)))
+                i = match.end()
+                continue
+        if c == '"' or c == "'":
+            end, value = _scan_string(text, i)
+            if c == "'":
+                repairs.add("single_quotes")
+            if end > n:
+                repairs.add("truncated")
+            if "\n" in value:
+                repairs.add("newline_in_string")
+            out.append(json.dumps(value))
+            i = end
+        elif c == "{" or c == "[":
+            closers.append("}" if c == "{" else "]")
+            out.append(c)
+            i += 1
+        elif c == "}" or c == "]":
+            i += 1
+            if c not in closers:
+                repairs.add("mismatched_brackets") # stray closer, dropped
+                continue
+            if _drop_trailing_comma(out):
+                repairs.add("trailing_comma")
+            while closers[-1] != c:
+                repairs.add("mismatched_brackets")
+                out.append(closers.pop())
+            out.append(closers.pop())
+            if not closers:
+                break
+        elif c == "/" and text.startswith("//", i):
+            repairs.add("comments")
+            i = text.find("\n", i)
+            i = n if i < 0 else i
+        elif c == "/" and text.startswith("/*", i):
+            repairs.add("comments")
+            i = text.find("*/", i)
+            i = n if i < 0 else i + 2
+        elif c.isalpha() or c == "_":
+            word = _WORD.match(text, i).group()
+            i += len(word)
+            if _next_significant(text, i) == ":":
+                repairs.add("unquoted_keys")
+                out.append(json.dumps(word))
+            elif word in _PYTHON_LITERALS:
+                repairs.add("python_literals")
+                out.append(_PYTHON_LITERALS[word])
+            else:
+                out.append(word)
+        else:
+            match = _PLAIN.match(text, i)
+            run = match.group() if match is not None else c
+            out.append(run)
+            i += len(run)
+
+    if closers:
+        repairs.add("truncated")
+        return _close_truncated("".join(out), closers), sorted(repairs)
+    if text[i:].strip():
+        repairs.add("trailing_text")
+    return "".join(out), sorted(repairs)
+
+def _scan_string(text: str, start: int) -> Tuple[int, str]:
+    """
+    Reads the string literal opening at `start`. Returns the index after it (len + 1
+    when it never closes) and its decoded value.
+    """
+    quote = text[start]
+    i, n = start + 1, len(text)
+    chunks = []
+    while i < n:
+        c = text[i]
+        if c == "\\" and i + 1 < n:
+            escaped = text[i + 1]
+            if escaped == "u" and i + 6 <= n:
+                try:
+                    chunks.append(chr(int(text[i + 2:i + 6], 16)))
+                    i += 6
+                    continue
+                except ValueError:
+                    pass
+            chunks.append({"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}.get(escaped, escaped))
+            i += 2
+            continue
+        if c == quote:
+            return i + 1, "".join(chunks)
+        chunks.append(c)
+        i += 1
+    return n + 1, "".join(chunks)
+
+def _next_significant(text: str, i: int) -> str:
+    n = len(text)
+    while i < n and text[i].isspace():
+        i += 1
+    return text[i] if i < n else ""
+
+def _drop_trailing_comma(out: List[str]) -> bool:
+    j = len(out) - 1
+    while j >= 0 and not out[j].strip():
+        j -= 1
+    if j >= 0 and out[j].rstrip().endswith(","):
+        out[j] = out[j].rstrip()[:-1]
+        return True
+    return False
+
+def _close_truncated(text: str, closers: List[str]) -> str:
+    """
+    Trims a dangling `,`, `"key":`, `"key"` or half-written number left where the output
+    was cut off, then closes the open brackets.
+    """
+    text = _DANGLING_NUMBER.sub(r"\1", text.rstrip())
+    if text.endswith(","):
+        text = text[:-1]
+    elif text.endswith(":"):
+        text += "null"
+    elif closers[-1] == "}":
+        # A key with no value yet
+        text = _DANGLING_KEY.sub(lambda m: "{" if m.group(1) == "{" else "", text)
+    return text + "".join(reversed(closers))
+
+def _normalize_key(key: str) -> str:
+    return re.sub(r"[\s\-]+", "_", key.strip()).lower()
+
+class _FieldSpec(NamedTuple):
+    kind: Any # a BaseModel subclass, float, bool, str or list
+    low: Optional[float]
+    high: Optional[float]
+
+@lru_cache(maxsize=None)
+def _field_specs(model: Type[BaseModel]) -> Dict[str, _FieldSpec]:
+    """
+    How to coerce each field of `model`, resolved once per model. Bounds come from the
+    Field(ge=..., le=...) declarations so they stay in one place (the schema).
+    """
+    specs = {}
+    for name, info in model.model_fields.items():
+        annotation = info.annotation
+        if get_origin(annotation) is not None and type(None) in get_args(annotation):
+            annotation = next(arg for arg in get_args(annotation) if arg is not type(None))
+        kind = list if get_origin(annotation) is list else annotation
+        low = high = None
+        for constraint in info.metadata:
+            low = getattr(constraint, "ge", low)
+            high = getattr(constraint, "le", high)
+        specs[name] = _FieldSpec(kind, low, high)
+    return specs
+
+def _is_model(kind: Any) -> bool:
+    return isinstance(kind, type) and issubclass(kind, BaseModel)
+
+def _coerce(value: Any, spec: _FieldSpec, repairs: set) -> Any:
+    kind = spec.kind
+    if value is None:
+        return None
+    if kind is float:
+        if isinstance(value, str):
+            match = _NUMBER.search(value)
+            if match is None:
+                return value
+            value = float(match.group())
+            repairs.add("numeric_strings")
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            clamped = value
+            if spec.high is not None and clamped > spec.high:
+                clamped = spec.high
+            if spec.low is not None and clamped < spec.low:
+                clamped = spec.low
+            if clamped != value:
+                repairs.add("clamped")
+            return float(clamped)
+    elif kind is bool:
+        if isinstance(value, str) and value.strip().lower() in _TRUE_WORDS | _FALSE_WORDS:
+            repairs.add("boolean_strings")
+            return value.strip().lower() in _TRUE_WORDS
+    elif kind is str:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+    elif kind is list:
+        if isinstance(value, str):
+            repairs.add("list_from_string")
+            return [part.strip() for part in value.split(",") if part.strip()]
+    elif isinstance(value, dict) and _is_model(kind):
+        return coerce_fields(value, kind, repairs)
+    return value
+
+def coerce_fields(data: Dict, model: Type[BaseModel], repairs: Optional[set] = None) -> Dict:
+    """
+    Schema-guided cleanup of parsed JSON against `model`: normalizes key spelling,
+    moves fields a model flattened to the top level back into their section, converts
+    numeric/boolean strings and clamps scores into the bounds declared on the schema.
+    """
+    repairs = set() if repairs is None else repairs
+    specs = _field_specs(model)
+    data = {(key if key in specs else _normalize_key(key)): value for key, value in data.items()}
+
+    for name, spec in specs.items():
+        if name in data or not _is_model(spec.kind):
+            continue
+        section = _field_specs(spec.kind)
+        flattened = {key: data.pop(key) for key in list(data) if key in section}
+        if flattened:
+            repairs.add("flattened_sections")
+            data[name] = flattened
+
+    for name, value in data.items():
+        spec = specs.get(name)
+        if spec is not None:
+            data[name] = _coerce(value, spec, repairs)
+    return data
+
+def invalid_fields(error: ValidationError) -> List[str]:
+    return sorted({".".join(str(part) for part in err["loc"]) for err in error.errors()})
+
+class ParseResult:
+    def __init__(self, data: Optional[Dict], response: Optional[ProductAnalysisResponse], repairs: List[str], invalid: List[str]):
+        self.data = data # Best-effort parsed dict, kept for merging field retries
+        self.response = response
+        self.repairs = repairs
+        self.invalid_fields = invalid
+
+    @property
+    def ok(self) -> bool:
+        return self.response is not None
+
+class ResponseParser:
+    """
+    Turns raw model output into a ProductAnalysisResponse. Strict JSON takes the fast
+    path; anything else is repaired and coerced against the schema. Fields that are
+    still missing or invalid are reported individually, so the caller can ask the
+    model for just those fields (merge) instead of repeating the whole call.
+    """
+    def __init__(self, model: Type[BaseModel] = ProductAnalysisResponse):
+        self.model = model
+        self.stats = {"clean": 0, "repaired": 0, "field_retry": 0, "failed": 0}
+
+    def parse(self, content: str) -> ParseResult:
+        try:
+            return ParseResult(None, self.model.model_validate_json(content), [], [])
+        except ValueError:
+            pass
+
+        # Most malformed answers are fine JSON wrapped in fences or prose
+        start, end = content.find("{"), content.rfind("}")
+        if 0 <= start < end:
+            try:
+                data = json.loads(content[start:end + 1])
+                return self._validate(data, {"leading_text"} if content[:start].strip() else set())
+            except ValueError:
+                pass
+
+        try:
+            text, repairs = extract_json(content)
+            data = json.loads(text)
+        except ValueError as e:
+            logger.debug("Response is not repairable JSON", extra={"error": str(e)})
+            return ParseResult(None, None, [], ["*"])
+        return self._validate(data, set(repairs))
+
+    def merge(self, result: ParseResult, content: str) -> ParseResult:
+        """
+        Folds a follow-up answer that contains only some fields into an earlier result.
+        """
+        if result.data is None:
+            return result
+        try:
+            text, repairs = extract_json(content)
+            patch = json.loads(text)
+        except ValueError:
+            return result
+        if not isinstance(patch, dict):
+            return result
+        merged = _deep_merge(result.data, coerce_fields(patch, self.model))
+        return self._validate(merged, set(result.repairs) | set(repairs))
+
+    def _validate(self, data: Any, repairs: set) -> ParseResult:
+        if not isinstance(data, dict):
+            return ParseResult(None, None, sorted(repairs), ["*"])
+        try:
+            # Unwrapping alone is often enough; coercion only runs when validation fails
+            return ParseResult(data, self.model.model_validate(data), sorted(repairs), [])
+        except ValidationError:
+            pass
+        data = coerce_fields(data, self.model, repairs)
+        try:
+            return ParseResult(data, self.model.model_validate(data), sorted(repairs), [])
+        except ValidationError as e:
+            return ParseResult(data, None, sorted(repairs), invalid_fields(e))
+
+    def record(self, result: ParseResult, retried: bool = False):
+        if not result.ok:
+            outcome = "failed"
+        elif retried:
+            outcome = "field_retry"
+        else:
+            outcome = "repaired" if result.repairs else "clean"
+        self.stats[outcome] += 1
+        PARSE_OUTCOMES.labels(outcome).inc()
+
+    def snapshot(self) -> Dict:
+        parsed = sum(self.stats.values())
+        success = parsed - self.stats["failed"]
+        return {**self.stats, "success_rate": round(success / parsed, 4) if parsed else None}
+
+def _deep_merge(base: Dict, patch: Dict) -> Dict:
+    merged = dict(base)
+    for key, value in patch.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _deep_merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
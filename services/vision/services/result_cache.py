@@ -0,0 +1,204 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from services.common.schemas import ProductAnalysisResponse
+from services.vision.models.image_payload import ImageSource, image_identity
+from services.vision.services.prompt_templates import get_template
+from services.vision.services.vision_engine import IVisionService
+
+def image_set_digest(image_urls: List[ImageSource]) -> str:
+    """
+    Stable digest of an ordered image list. Uploads (bytes or data: URLs) are keyed
+    by content and remote images by URL.
+    """
+    h = hashlib.sha256()
+    for image in image_urls:
+        encoded = image_identity(image).encode("utf-8")
+        # Length prefix keeps ["ab", "c"] and ["a", "bc"] apart
+        h.update(len(encoded).to_bytes(8, "big"))
+        h.update(encoded)
+    return h.hexdigest()
+
+# Templates an analysis can be made with, in lookup order
+PROMPT_TEMPLATES = ("single", "batch")
+
+def cache_key(image_urls: List[ImageSource], model: str, template: str = "single") -> str:
+    # Model and prompt version are part of the key, so changing either never serves stale entries.
+    # The version is that of the template that made the analysis (micro-batched ones used "batch")
+    version = get_template(template, model).version
+    return hashlib.sha256(f"{model}|{version}|{image_set_digest(image_urls)}".encode("utf-8")).hexdigest()
+
+class ResultCacheBackend(ABC):
+    """
+    Key/value store for serialized ProductAnalysisResponse JSON.
+    """
+    # Backends that touch the disk are called off the event loop
+    blocking_io = False
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[str]:
+        return self.get_first([key])
+
+    def get_first(self, keys: List[str]) -> Optional[str]:
+        """
+        The value of the first of `keys` that is stored, counted as one lookup.
+        """
+        for key in keys:
+            value = self._get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    @abstractmethod
+    def _get(self, key: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: str):
+        pass
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+class MemoryResultCache(ResultCacheBackend):
+    """
+    In-process LRU with a per-entry TTL.
+    """
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    def _get(self, key: str) -> Optional[str]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if time.time() - stored_at > self.ttl_seconds:
+            del self.entries[key]
+            self.expirations += 1
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str):
+        self.entries[key] = (time.time(), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+class SqliteResultCache(ResultCacheBackend):
+    """
+    On-disk cache that survives restarts (e.g. between nightly catalog runs).
+    Least recently used entries are evicted once `max_entries` is exceeded.
+    """
+    blocking_io = True
+
+    def __init__(self, path: str, max_entries: int, ttl_seconds: float):
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at)")
+
+    def _get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT value, stored_at FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, stored_at = row
+            if now - stored_at > self.ttl_seconds:
+                self.conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self.expirations += 1
+                return None
+            self.conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+            return value
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            overflow = self._count() - self.max_entries
+            if overflow > 0:
+                self.conn.execute(
+                    "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY accessed_at LIMIT ?)",
+                    (overflow,),
+                )
+                self.evictions += overflow
+
+    def _count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self._count()
+
+class CachedVisionService(IVisionService):
+    """
+    Wraps any IVisionService and serves repeated image sets from the cache.
+    Every hit returns a fresh model, so callers may set product_id freely.
+    """
+    def __init__(self, inner: IVisionService, backend: ResultCacheBackend):
+        self.inner = inner
+        self.backend = backend
+        self.model = getattr(inner, "model", type(inner).__name__)
+
+    async def analyze_images(self, image_urls: List[ImageSource]) -> ProductAnalysisResponse:
+        keys = [cache_key(image_urls, self.model, template) for template in PROMPT_TEMPLATES]
+        cached = await self._call(self.backend.get_first, keys)
+        if cached is not None:
+            return ProductAnalysisResponse.model_validate_json(cached)
+
+        result = await self.inner.analyze_images(image_urls)
+        # Never cache fabricated fallback data in place of a real analysis
+        if not result.is_fallback:
+            key = keys[PROMPT_TEMPLATES.index(result.prompt_template)]
+            await self._call(self.backend.set, key, result.model_dump_json(exclude={"product_id"}))
+        return result
+
+    async def _call(self, fn, *args):
+        if self.backend.blocking_io:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
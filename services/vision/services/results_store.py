@@ -0,0 +1,532 @@
+import glob
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from services.common.schemas import (
+    ContinuousDimensions,
+    DiscreteAttributes,
+    ProductAnalysisResponse,
+    ResultQuery,
+    VisualMetadata,
+)
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = list(ContinuousDimensions.model_fields) # column order of the packed float32 matrix
+
+# Bit positions in the uint8 flags column
+FLAGS = {
+    "has_wirecore": 1,
+    "is_transparent": 2,
+    "looks_like_kids_product": 4,
+    "is_occluded_or_ambiguous": 8,
+}
+
+# Fixed-width per-row columns: name -> (trailing shape, dtype)
+COLUMNS = {
+    "dims": ((len(DIMENSIONS),), np.float32),
+    "confidence": ((), np.float32),
+    "flags": ((), np.uint8),
+    "frame_shape": ((), np.uint16), # dictionary codes
+    "texture_pattern": ((), np.uint16),
+    "notes": ((), np.uint32), # free text, so many more distinct values
+    "recorded_at": ((), np.float64),
+}
+
+def _flags(result: ProductAnalysisResponse) -> int:
+    attributes, metadata = result.discrete_attributes, result.metadata
+    return (
+        FLAGS["has_wirecore"] * attributes.has_wirecore
+        | FLAGS["is_transparent"] * attributes.is_transparent
+        | FLAGS["looks_like_kids_product"] * attributes.looks_like_kids_product
+        | FLAGS["is_occluded_or_ambiguous"] * metadata.is_occluded_or_ambiguous
+    )
+
+class _Dictionary:
+    """
+    Dictionary encoding for one string column: each distinct value gets a small integer
+    code, assigned in first-seen order so codes never change once persisted.
+    Code 0 is reserved for None.
+    """
+    def __init__(self):
+        self.values: List[Optional[str]] = [None]
+        self.codes: Dict[str, int] = {}
+        self.persisted = 1 # values[:persisted] are already in a segment file
+
+    def encode(self, value: Optional[str]) -> int:
+        if value is None:
+            return 0
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def lookup(self, value: str) -> Optional[int]:
+        return self.codes.get(value)
+
+    def extend(self, values: List[str]):
+        for value in values:
+            self.encode(value)
+
+class _Chain:
+    """
+    The segments of one writer (process) loaded so far, and how the dictionary codes
+    they were written with map to this store's.
+    """
+    def __init__(self, dictionaries: Iterable[str]):
+        self.loaded: Set[str] = set()
+        # The writer's code -> this store's code
+        self.remap: Dict[str, np.ndarray] = {name: np.zeros(1, dtype=np.int64) for name in dictionaries}
+
+def _pack_strings(values: List[str]) -> np.ndarray:
+    return np.frombuffer("\x1f".join(values).encode("utf-8"), dtype=np.uint8)
+
+def _unpack_strings(packed: np.ndarray) -> List[str]:
+    text = packed.tobytes().decode("utf-8")
+    return text.split("\x1f") if text else []
+
+class ResultsStore:
+    """
+    Append-only columnar store of analysis results. The five continuous dimensions
+    are one packed float32 matrix, booleans are bits of a uint8 column, and strings
+    (frame shape, texture, colors, notes) are dictionary-encoded integer columns;
+    the multi-valued dominant_colors column is stored as flat codes plus row offsets.
+    Queries are vectorized over the in-memory columns. With a directory, rows are
+    persisted in bulk as numbered .npz segments (flush) and reloaded at startup.
+    A product recorded again supersedes its older row; compact() drops superseded rows
+    from memory and rewrites this writer's segments as one base segment without them.
+
+    Several processes can share a directory when each has its own `writer` name: a
+    writer's segments go to <directory>/<writer>/, and the segments of the other
+    writers are read too (at startup and on refresh), with their dictionary codes
+    translated to this store's. A base segment replaces every earlier segment of its
+    writer, so readers start that writer's chain over from it.
+    """
+    def __init__(self, directory: Optional[str] = None, initial_capacity: int = 1024, writer: str = ""):
+        self.directory = directory
+        self.segment_dir = os.path.join(directory, writer) if directory and writer else directory
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.n = 0
+        self.persisted = 0 # rows [0, persisted) are on disk
+        self.color_count = 0
+        self.segments = 0
+        self.superseded = 0 # Rows replaced by a newer analysis of their product, until compacted
+        self.generation = 0 # Bumped when compaction renumbers the rows
+        self.last_flush = time.monotonic()
+        self.product_ids: List[str] = []
+        self.rows: Dict[str, int] = {} # product id -> its latest row
+        self._color_owners = np.empty(0, dtype=np.int64) # row of each color_codes position
+        self.dictionaries = {name: _Dictionary() for name in ("frame_shape", "texture_pattern", "color", "notes")}
+        self.chains: Dict[str, _Chain] = {}
+        self.last_refresh = 0.0
+        self._allocate(initial_capacity, initial_capacity * 2)
+
+        if directory:
+            os.makedirs(self.segment_dir, exist_ok=True)
+            # Our own segments first: their codes are ours, so the dictionaries come back as they were
+            self._load_chain(self.segment_dir, local=True)
+            self.persisted = self.n
+            for dictionary in self.dictionaries.values():
+                dictionary.persisted = len(dictionary.values)
+            for chain_dir in self._other_chains():
+                self._load_chain(chain_dir, local=False)
+            self.last_refresh = time.monotonic()
+
+    def _allocate(self, capacity: int, color_capacity: int):
+        def grow(name: str, shape, dtype) -> np.ndarray:
+            fresh = np.zeros(shape, dtype=dtype)
+            current = getattr(self, name, None)
+            if current is not None:
+                fresh[:len(current)] = current
+            return fresh
+
+        for name, (shape, dtype) in COLUMNS.items():
+            setattr(self, name, grow(name, (capacity, *shape), dtype))
+        self.alive = grow("alive", capacity, np.bool_)
+        self.local = grow("local", capacity, np.bool_) # written by this store, not loaded from another writer
+        # Row i's colors are color_codes[color_offsets[i]:color_offsets[i + 1]]
+        self.color_offsets = grow("color_offsets", capacity + 1, np.int64)
+        self.color_codes = grow("color_codes", color_capacity, np.uint16)
+
+    def _reserve(self, rows: int, colors: int):
+        capacity, color_capacity = len(self.dims), len(self.color_codes)
+        if self.n + rows <= capacity and self.color_count + colors <= color_capacity:
+            return
+        while self.n + rows > capacity:
+            capacity *= 2
+        while self.color_count + colors > color_capacity:
+            color_capacity *= 2
+        self._allocate(capacity, color_capacity)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @property
+    def pending_rows(self) -> int:
+        return int(self.local[self.persisted:self.n].sum())
+
+    def append(self, results: Iterable[ProductAnalysisResponse], recorded_at: Optional[float] = None):
+        """
+        Appends results in one bulk write to the columns. Results without a product_id
+        are skipped (there is nothing to look them up by).
+        """
+        results = [result for result in results if result.product_id]
+        if not results:
+            return
+        recorded_at = time.time() if recorded_at is None else recorded_at
+        colors = [[color.strip() for color in r.discrete_attributes.dominant_colors] for r in results]
+
+        with self.lock:
+            self._reserve(len(results), sum(len(c) for c in colors))
+            start, end = self.n, self.n + len(results)
+            encode = {name: dictionary.encode for name, dictionary in self.dictionaries.items()}
+
+            self.dims[start:end] = [
+                [getattr(r.continuous_dimensions, name) for name in DIMENSIONS] for r in results
+            ]
+            self.confidence[start:end] = [r.metadata.confidence_score for r in results]
+            self.flags[start:end] = [_flags(r) for r in results]
+            self.frame_shape[start:end] = [encode["frame_shape"](r.discrete_attributes.frame_shape) for r in results]
+            self.texture_pattern[start:end] = [encode["texture_pattern"](r.discrete_attributes.texture_pattern) for r in results]
+            self.notes[start:end] = [encode["notes"](r.metadata.image_quality_notes) for r in results]
+            self.recorded_at[start:end] = recorded_at
+            self.alive[start:end] = True
+            self.local[start:end] = True
+
+            flat = [encode["color"](color) for row_colors in colors for color in row_colors]
+            self.color_codes[self.color_count:self.color_count + len(flat)] = flat
+            self.color_offsets[start + 1:end + 1] = self.color_count + np.cumsum([len(c) for c in colors])
+            self.color_count += len(flat)
+
+            for row, result in enumerate(results, start):
+                self._index(result.product_id, row)
+            self.n = end
+
+    def _index(self, product_id: str, row: int):
+        previous = self.rows.get(product_id)
+        if previous is not None and self.recorded_at[previous] > self.recorded_at[row]:
+            # An older analysis from another writer's segment, loaded after the newer one
+            self.alive[row] = False
+            self.superseded += 1
+        else:
+            if previous is not None:
+                self.alive[previous] = False
+                self.superseded += 1
+            self.rows[product_id] = row
+        self.product_ids.append(product_id)
+
+    def flush(self) -> int:
+        """
+        Writes the rows appended since the last flush as a new segment file, along with
+        the dictionary values they introduced. Returns the number of rows written.
+        """
+        if not self.directory:
+            return 0
+        with self.flush_lock:
+            with self.lock:
+                start, end = self.persisted, self.n
+                # Rows loaded from other writers' segments in the meantime are theirs to keep
+                rows = start + np.flatnonzero(self.local[start:end])
+                if not len(rows):
+                    self.persisted = end
+                    return 0
+                segment, dictionary_sizes = self._segment(rows, {name: d.persisted for name, d in self.dictionaries.items()})
+                self.segments += 1
+                path = os.path.join(self.segment_dir, f"segment-{self.segments:08d}.npz")
+
+            self._write_segment(path, segment)
+            with self.lock:
+                self.persisted = end
+                for name, size in dictionary_sizes.items():
+                    self.dictionaries[name].persisted = size
+                self.last_flush = time.monotonic()
+            return len(rows)
+
+    def _segment(self, rows: np.ndarray, dictionary_starts: Dict[str, int]) -> Tuple[Dict[str, np.ndarray], Dict[str, int]]:
+        """
+        Segment arrays for `rows`, with each dictionary's values from its start index on.
+        The caller holds `lock`.
+        """
+        segment = {name: getattr(self, name)[rows] for name in COLUMNS}
+        firsts = self.color_offsets[rows]
+        counts = self.color_offsets[rows + 1] - firsts
+        positions = np.repeat(firsts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        segment["color_counts"] = counts.astype(np.uint16)
+        segment["color_codes"] = self.color_codes[positions]
+        segment["product_ids"] = _pack_strings([self.product_ids[row] for row in rows])
+        dictionary_sizes = {}
+        for name, dictionary in self.dictionaries.items():
+            segment[f"dictionary_{name}"] = _pack_strings(dictionary.values[dictionary_starts[name]:])
+            dictionary_sizes[name] = len(dictionary.values)
+        return segment, dictionary_sizes
+
+    def _write_segment(self, path: str, segment: Dict[str, np.ndarray]):
+        # Written under a temporary name first so a crash never leaves half a segment
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, **segment)
+        os.replace(path + ".tmp", path)
+
+    def compact(self) -> int:
+        """
+        Drops superseded rows. In memory the columns are rebuilt from the current rows
+        (renumbering them, see `generation`); with a directory, this writer's current
+        rows and full dictionaries are written as one base segment and its earlier
+        segments are deleted. Returns the number of rows dropped.
+        """
+        with self.flush_lock:
+            with self.lock:
+                n = self.n
+                keep = np.flatnonzero(self.alive[:n])
+                firsts = self.color_offsets[keep]
+                counts = self.color_offsets[keep + 1] - firsts
+                positions = np.repeat(firsts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+                color_codes = self.color_codes[positions]
+                columns = {name: getattr(self, name)[keep] for name in (*COLUMNS, "local")}
+
+                # Fresh arrays rather than in place: searches keep reading views of the old ones
+                for name in (*COLUMNS, "local", "alive", "color_offsets", "color_codes"):
+                    setattr(self, name, np.zeros_like(getattr(self, name)))
+                for name, values in columns.items():
+                    getattr(self, name)[:len(keep)] = values
+                self.alive[:len(keep)] = True
+                self.color_codes[:len(color_codes)] = color_codes
+                self.color_offsets[1:len(keep) + 1] = np.cumsum(counts)
+                self.color_count = len(color_codes)
+                self.product_ids = [self.product_ids[row] for row in keep]
+                self.rows = {product_id: row for row, product_id in enumerate(self.product_ids)}
+                self._color_owners = np.empty(0, dtype=np.int64)
+                self.n = len(keep)
+                self.superseded = 0
+                self.generation += 1
+                dropped = n - len(keep)
+
+                if not self.directory:
+                    logger.info("Results store compacted", extra={"rows": len(keep), "dropped": dropped})
+                    return dropped
+                # Every current local row goes into the base, including ones not flushed yet
+                segment, dictionary_sizes = self._segment(
+                    np.flatnonzero(self.local[:self.n]), {name: 1 for name in self.dictionaries}
+                )
+                self.persisted = self.n
+                for name, size in dictionary_sizes.items():
+                    self.dictionaries[name].persisted = size
+                self.segments += 1
+                base = os.path.join(self.segment_dir, f"segment-{self.segments:08d}-base.npz")
+
+            self._write_segment(base, segment)
+            for path in glob.glob(os.path.join(self.segment_dir, "segment-*.npz")):
+                if path != base and int(os.path.basename(path)[8:16]) < self.segments:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            with self.lock:
+                self.chains.setdefault(self.segment_dir, _Chain(self.dictionaries)).loaded = {base}
+                self.last_flush = time.monotonic()
+        logger.info("Results store compacted", extra={"rows": len(keep), "dropped": dropped})
+        return dropped
+
+    def _other_chains(self) -> List[str]:
+        """
+        Segment directories of the other writers sharing `directory`.
+        """
+        chains = [self.directory] + sorted(
+            entry.path for entry in os.scandir(self.directory) if entry.is_dir()
+        )
+        own = os.path.abspath(self.segment_dir)
+        return [chain for chain in chains if os.path.abspath(chain) != own]
+
+    def _load_chain(self, chain_dir: str, local: bool) -> int:
+        chain = self.chains.setdefault(chain_dir, _Chain(self.dictionaries))
+        paths = sorted(glob.glob(os.path.join(chain_dir, "segment-*.npz")))
+        bases = [path for path in paths if path.endswith("-base.npz")]
+        if bases:
+            # The writer compacted: its chain starts over at the latest base, with codes
+            # of its own. Rows already loaded from before are superseded by the base's.
+            paths = paths[paths.index(bases[-1]):]
+            if bases[-1] not in chain.loaded:
+                chain = self.chains[chain_dir] = _Chain(self.dictionaries)
+        loaded = 0
+        # Segments must be read in order: each extends the dictionaries of the ones before
+        for path in paths:
+            if path not in chain.loaded:
+                try:
+                    self._load_segment(path, chain, local)
+                except FileNotFoundError:
+                    # Deleted by a compaction since the listing; its base is read next time
+                    break
+                chain.loaded.add(path)
+                loaded += 1
+        return loaded
+
+    def refresh(self, min_interval: float = 1.0) -> int:
+        """
+        Loads segments other writers flushed since the last look (at most once per
+        `min_interval` seconds). Returns the number of segments loaded.
+        """
+        if not self.directory or time.monotonic() - self.last_refresh < min_interval:
+            return 0
+        self.last_refresh = time.monotonic()
+        loaded = 0
+        for chain_dir in self._other_chains():
+            with self.lock:
+                loaded += self._load_chain(chain_dir, local=False)
+        return loaded
+
+    def _load_segment(self, path: str, chain: _Chain, local: bool):
+        with np.load(path) as segment:
+            for name, dictionary in self.dictionaries.items():
+                added = _unpack_strings(segment[f"dictionary_{name}"])
+                codes = np.array([dictionary.encode(value) for value in added], dtype=np.int64)
+                chain.remap[name] = np.concatenate([chain.remap[name], codes])
+            product_ids = _unpack_strings(segment["product_ids"])
+            counts = segment["color_counts"].astype(np.int64)
+            self._reserve(len(product_ids), int(counts.sum()))
+            start, end = self.n, self.n + len(product_ids)
+            for name in COLUMNS:
+                values = segment[name]
+                if name in chain.remap:
+                    values = chain.remap[name][values]
+                getattr(self, name)[start:end] = values
+            self.alive[start:end] = True
+            self.local[start:end] = local
+            codes = chain.remap["color"][segment["color_codes"]]
+            self.color_codes[self.color_count:self.color_count + len(codes)] = codes
+            self.color_offsets[start + 1:end + 1] = self.color_count + np.cumsum(counts)
+            self.color_count += len(codes)
+        for row, product_id in enumerate(product_ids, start):
+            self._index(product_id, row)
+        self.n = end
+        if local:
+            self.segments = max(self.segments, int(os.path.basename(path)[8:16]))
+
+    def _rows_with_colors(self, codes: List[int]) -> np.ndarray:
+        """
+        Mask of rows whose dominant colors include every code in `codes`.
+        """
+        n = self.n
+        if len(self._color_owners) != self.color_count:
+            # Rebuilt once per append instead of a searchsorted per query
+            self._color_owners = np.repeat(np.arange(n), np.diff(self.color_offsets[:n + 1]))
+        mask = np.ones(n, dtype=np.bool_)
+        flat = self.color_codes[:self.color_count]
+        for code in codes:
+            has = np.zeros(n, dtype=np.bool_)
+            has[self._color_owners[np.flatnonzero(flat == code)]] = True
+            mask &= has
+        return mask
+
+    def filter_mask(self, query: ResultQuery) -> np.ndarray:
+        """
+        Boolean mask over rows [0, n) of the latest results matching every filter in
+        `query`. The caller holds `lock`.
+        """
+        n = self.n
+        mask = self.alive[:n].copy()
+        for i, name in enumerate(DIMENSIONS):
+            low, high = getattr(query, f"{name}_min"), getattr(query, f"{name}_max")
+            if low is not None:
+                mask &= self.dims[:n, i] >= low
+            if high is not None:
+                mask &= self.dims[:n, i] <= high
+        if query.confidence_min is not None:
+            mask &= self.confidence[:n] >= query.confidence_min
+        for name, bit in FLAGS.items():
+            wanted = getattr(query, name)
+            if wanted is not None:
+                mask &= ((self.flags[:n] & bit) != 0) == wanted
+        for name, column in (("frame_shape", self.frame_shape), ("texture_pattern", self.texture_pattern)):
+            values = getattr(query, name)
+            if values:
+                # One comparison per value is much cheaper than np.isin, which sorts
+                hit = np.zeros(n, dtype=np.bool_)
+                for value in values:
+                    code = self.dictionaries[name].lookup(value)
+                    if code is not None:
+                        hit |= column[:n] == code
+                mask &= hit
+        if query.color:
+            codes = [self.dictionaries["color"].lookup(color) for color in query.color]
+            if None in codes:
+                mask[:] = False
+            else:
+                mask &= self._rows_with_colors(codes)
+        return mask
+
+    def match(self, query: ResultQuery) -> np.ndarray:
+        """
+        Row indices of the latest results matching every condition in `query`, in the
+        order they were recorded.
+        """
+        with self.lock:
+            return np.flatnonzero(self.filter_mask(query))
+
+    def query(self, query: ResultQuery) -> Tuple[int, List[ProductAnalysisResponse]]:
+        # One lock hold: a compaction in between would renumber the matched rows
+        with self.lock:
+            rows = np.flatnonzero(self.filter_mask(query))
+            page = rows[query.offset:query.offset + query.limit]
+            return len(rows), [self._materialize(int(row)) for row in page]
+
+    def get(self, product_id: str) -> Optional[ProductAnalysisResponse]:
+        with self.lock:
+            row = self.rows.get(product_id)
+            return self._materialize(row) if row is not None else None
+
+    def materialize(self, rows: List[int], generation: Optional[int] = None) -> Optional[List[ProductAnalysisResponse]]:
+        """
+        The results in `rows`; None if they were numbered for another `generation`.
+        """
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return None
+            return [self._materialize(row) for row in rows]
+
+    def _materialize(self, row: int) -> ProductAnalysisResponse:
+        values = {name: dictionary.values for name, dictionary in self.dictionaries.items()}
+        flags = int(self.flags[row])
+        colors = self.color_codes[self.color_offsets[row]:self.color_offsets[row + 1]]
+        # float32 keeps ~7 significant digits; scores are given to one or two decimals
+        return ProductAnalysisResponse(
+            product_id=self.product_ids[row],
+            continuous_dimensions=ContinuousDimensions(
+                **{name: round(float(value), 4) for name, value in zip(DIMENSIONS, self.dims[row])}
+            ),
+            discrete_attributes=DiscreteAttributes(
+                has_wirecore=bool(flags & FLAGS["has_wirecore"]),
+                is_transparent=bool(flags & FLAGS["is_transparent"]),
+                dominant_colors=[values["color"][code] for code in colors],
+                frame_shape=values["frame_shape"][self.frame_shape[row]],
+                texture_pattern=values["texture_pattern"][self.texture_pattern[row]],
+                looks_like_kids_product=bool(flags & FLAGS["looks_like_kids_product"]),
+            ),
+            metadata=VisualMetadata(
+                image_quality_notes=values["notes"][self.notes[row]],
+                is_occluded_or_ambiguous=bool(flags & FLAGS["is_occluded_or_ambiguous"]),
+                confidence_score=round(float(self.confidence[row]), 4),
+            ),
+        )
+
+    def snapshot(self) -> Dict:
+        return {
+            "products": len(self.rows),
+            "rows": self.n,
+            "superseded_rows": self.superseded,
+            "pending_rows": self.pending_rows,
+            "segments": self.segments,
+            "writers": len(self.chains),
+            "column_bytes": int(
+                sum(getattr(self, name)[:self.n].nbytes for name in COLUMNS)
+                + self.alive[:self.n].nbytes
+                + self.local[:self.n].nbytes
+                + self.color_offsets[:self.n + 1].nbytes
+                + self.color_codes[:self.color_count].nbytes
+            ),
+        }
@@ -0,0 +1,204 @@
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.common.schemas import ProductAnalysisResponse, ResultQuery
+from services.vision.services.results_store import DIMENSIONS, ResultsStore
+
+logger = logging.getLogger(__name__)
+
+SCORE_MIN, SCORE_MAX = -5.0, 5.0 # ContinuousDimensions bounds
+
+def _distances(dims: np.ndarray, rows: np.ndarray, target: np.ndarray) -> np.ndarray:
+    diff = dims[rows] - target
+    return np.sqrt(np.einsum("ij,ij->i", diff, diff))
+
+def _top_k(rows: np.ndarray, distances: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    if len(rows) > k:
+        keep = np.argpartition(distances, k - 1)[:k]
+        rows, distances = rows[keep], distances[keep]
+    order = np.argsort(distances, kind="stable")
+    return rows[order], distances[order]
+
+class GridIndex:
+    """
+    Uniform grid over the 5-D score space: rows are sorted by cell, so a cell's rows
+    are one contiguous slice. A search visits shells of cells around the query's cell,
+    nearest first, and stops once no unvisited cell can hold a closer row.
+    """
+    def __init__(self, dims: np.ndarray, cell_width: float):
+        self.n = len(dims)
+        self.cell_width = cell_width
+        self.bins = int(np.ceil((SCORE_MAX - SCORE_MIN) / cell_width))
+        cells = self._cells(dims)
+        cell_ids = np.ravel_multi_index(cells.T, (self.bins,) * len(DIMENSIONS))
+        self.order = np.argsort(cell_ids, kind="stable")
+        sorted_ids = cell_ids[self.order]
+        self.cell_ids, self.starts = np.unique(sorted_ids, return_index=True)
+        self.ends = np.append(self.starts[1:], len(sorted_ids))
+        self._shells: Dict[int, np.ndarray] = {}
+
+    def _cells(self, points: np.ndarray) -> np.ndarray:
+        cells = np.floor((points - SCORE_MIN) / self.cell_width).astype(np.int64)
+        return np.clip(cells, 0, self.bins - 1)
+
+    def _shell(self, radius: int) -> np.ndarray:
+        """
+        Cell offsets at Chebyshev distance exactly `radius` from the center cell.
+        """
+        if radius not in self._shells:
+            side = np.arange(-radius, radius + 1)
+            grid = np.stack(np.meshgrid(*([side] * len(DIMENSIONS)), indexing="ij"), axis=-1).reshape(-1, len(DIMENSIONS))
+            self._shells[radius] = grid[np.abs(grid).max(axis=1) == radius]
+        return self._shells[radius]
+
+    def _rows_in_shell(self, center: np.ndarray, radius: int) -> np.ndarray:
+        cells = center + self._shell(radius)
+        cells = cells[((cells >= 0) & (cells < self.bins)).all(axis=1)]
+        if not len(cells):
+            return np.empty(0, dtype=np.int64)
+        wanted = np.ravel_multi_index(cells.T, (self.bins,) * len(DIMENSIONS))
+        # Most cells are empty; keep the ones that hold rows
+        positions = np.searchsorted(self.cell_ids, wanted)
+        found = positions < len(self.cell_ids)
+        found[found] = self.cell_ids[positions[found]] == wanted[found]
+        starts, ends = self.starts[positions[found]], self.ends[positions[found]]
+        lengths = ends - starts
+        total = int(lengths.sum())
+        if not total:
+            return np.empty(0, dtype=np.int64)
+        # Concatenated aranges of every [start, end) slice, without a Python loop
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return self.order[offsets + np.arange(total)]
+
+    def search(self, dims: np.ndarray, target: np.ndarray, k: int, mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        center = self._cells(target[None, :])[0]
+        rows = np.empty(0, dtype=np.int64)
+        distances = np.empty(0, dtype=np.float32)
+        for radius in range(self.bins):
+            shell = self._rows_in_shell(center, radius)
+            shell = shell[mask[shell]]
+            if len(shell):
+                shell_distances = _distances(dims, shell, target)
+                rows, distances = _top_k(np.concatenate([rows, shell]), np.concatenate([distances, shell_distances]), k)
+            # Unvisited cells are at least radius * cell_width away from the target
+            if len(rows) == k and distances[-1] <= radius * self.cell_width:
+                break
+        return rows, distances
+
+class SimilarityIndex:
+    """
+    k-nearest-neighbour search over the stored results' continuous dimensions
+    (Euclidean; all five share the -5..5 scale), with the store's filters applied.
+    Small catalogs and selective filters are scanned exactly with numpy; large ones
+    go through a GridIndex, rebuilt by the first query that finds the store grown by
+    `rebuild_fraction`. Rows appended since the last build are scanned exactly and
+    merged in, so results are always exact and current.
+    """
+    def __init__(self, store: ResultsStore, cell_width: float = 1.0, exact_threshold: int = 50000, rebuild_fraction: float = 0.1):
+        self.store = store
+        self.cell_width = cell_width
+        self.exact_threshold = exact_threshold
+        self.rebuild_fraction = rebuild_fraction
+        self.grid: Optional[GridIndex] = None
+        self.grid_generation = -1 # store.generation the grid's rows are numbered for
+        self.build_lock = threading.Lock()
+        self.stats = {"exact": 0, "grid": 0, "builds": 0}
+
+    def _current_grid(self, dims: np.ndarray, generation: int) -> GridIndex:
+        n = len(dims)
+
+        def stale(grid: Optional[GridIndex]) -> bool:
+            # A compaction renumbered the rows, or enough were appended since the build
+            return grid is None or self.grid_generation != generation or n - grid.n > grid.n * self.rebuild_fraction
+
+        grid = self.grid
+        if stale(grid):
+            with self.build_lock:
+                grid = self.grid
+                if stale(grid):
+                    started = time.perf_counter()
+                    grid = self.grid = GridIndex(dims, self.cell_width)
+                    self.grid_generation = generation
+                    self.stats["builds"] += 1
+                    logger.info(
+                        "Similarity grid built",
+                        extra={"rows": n, "cells": len(grid.cell_ids), "ms": round((time.perf_counter() - started) * 1000, 1)},
+                    )
+        return grid
+
+    def target_of(self, product_id: str) -> Optional[List[float]]:
+        """
+        The stored dimensions of `product_id`, in DIMENSIONS order.
+        """
+        with self.store.lock:
+            row = self.store.rows.get(product_id)
+            return self.store.dims[row].tolist() if row is not None else None
+
+    def search(
+        self,
+        target: List[float],
+        k: int,
+        query: ResultQuery,
+        exclude_product_id: Optional[str] = None,
+    ) -> List[Tuple[int, float]]:
+        """
+        The `k` stored rows closest to `target`, as (row, distance), nearest first.
+        """
+        return self._search(target, k, query, exclude_product_id)[0]
+
+    def similar(
+        self,
+        target: List[float],
+        k: int,
+        query: ResultQuery,
+        exclude_product_id: Optional[str] = None,
+    ) -> List[Tuple[ProductAnalysisResponse, float]]:
+        """
+        search, with the rows materialized as results.
+        """
+        while True:
+            matches, generation = self._search(target, k, query, exclude_product_id)
+            results = self.store.materialize([row for row, _ in matches], generation)
+            if results is not None:
+                return [(result, distance) for result, (_, distance) in zip(results, matches)]
+            # Compacted in between, so the rows point elsewhere now; search again
+
+    def _search(
+        self,
+        target: List[float],
+        k: int,
+        query: ResultQuery,
+        exclude_product_id: Optional[str],
+    ) -> Tuple[List[Tuple[int, float]], int]:
+        target = np.asarray(target, dtype=np.float32)
+        with self.store.lock:
+            generation = self.store.generation
+            n = self.store.n
+            dims = self.store.dims[:n] # stays valid: growth allocates new arrays
+            mask = self.store.filter_mask(query)
+            excluded = self.store.rows.get(exclude_product_id) if exclude_product_id else None
+        if excluded is not None:
+            mask[excluded] = False
+
+        # Only searches with many candidates pay for (and wait on) a grid build
+        grid = self._current_grid(dims, generation) if mask.sum() > self.exact_threshold else None
+        if grid is None:
+            self.stats["exact"] += 1
+            rows = np.flatnonzero(mask)
+            distances = _distances(dims, rows, target)
+            rows, distances = _top_k(rows, distances, k)
+        else:
+            self.stats["grid"] += 1
+            rows, distances = grid.search(dims, target, k, mask)
+            tail = np.flatnonzero(mask[grid.n:]) + grid.n
+            if len(tail):
+                tail_distances = _distances(dims, tail, target)
+                rows, distances = _top_k(np.concatenate([rows, tail]), np.concatenate([distances, tail_distances]), k)
+        return [(int(row), float(distance)) for row, distance in zip(rows, distances)], generation
+
+    def snapshot(self) -> Dict:
+        return {**self.stats, "indexed_rows": self.grid.n if self.grid is not None else 0}
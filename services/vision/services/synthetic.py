@@ -0,0 +1,115 @@
+import hashlib
+import struct
+from typing import Dict, List, Sequence
+
+from services.common.schemas import ContinuousDimensions, DiscreteAttributes, ProductAnalysisResponse, VisualMetadata
+
+DIMENSIONS = list(ContinuousDimensions.model_fields)
+COLORS = ["Black", "Silver", "Gold", "Tortoise", "Blue", "Red", "Clear", "Grey"]
+SHAPES = ["Rectangular", "Round", "Aviator", "Cat-eye", "Square", "Oval", "Geometric"]
+TEXTURES = ["Matte", "Glossy", "Translucent", "Tortoise Pattern", "Metallic"]
+QUALITY_NOTES = ["Average", "Below Average"]
+
+# A product's digest holds 32 16-bit words; each field is driven by its own word
+DIGEST_BYTES = 2 * 32
+_WORDS = ">32H"
+_DIMS = 0
+_FLAGS = _DIMS + len(DIMENSIONS) # has_wirecore, is_transparent, looks_like_kids_product, is_occluded_or_ambiguous
+_SHAPE = _FLAGS + 4
+_TEXTURE = _SHAPE + 1
+_NOTES = _TEXTURE + 1
+_CONFIDENCE = _NOTES + 1
+_COLOR_COUNT = _CONFIDENCE + 1
+_COLOR_RANKS = _COLOR_COUNT + 1 # one per palette color; the lowest ones are picked
+SLOTS = _COLOR_RANKS + len(COLORS)
+
+def key_digest(text: str, seed: int = 0) -> bytes:
+    """
+    Digest of a product (its image identities, or any id) under a seed: the source
+    of all its random draws. Stable across processes, unlike hash().
+    """
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=DIGEST_BYTES, salt=seed.to_bytes(16, "big")).digest()
+
+def synthetic_analysis(digest: bytes) -> ProductAnalysisResponse:
+    """
+    The analysis for one key_digest. Values are quantized like model answers: scores
+    in 0.1 steps from -5.0 to 5.0, confidence in 0.01 steps from 0.50 to 0.70.
+    """
+    u = [word / 65536 for word in struct.unpack(_WORDS, digest)]
+    ranks = sorted(range(len(COLORS)), key=lambda i: u[_COLOR_RANKS + i])
+    picked = sorted(ranks[:1 + int(u[_COLOR_COUNT] * 3)])
+    return ProductAnalysisResponse(
+        product_id=None,
+        continuous_dimensions=ContinuousDimensions(
+            **{name: (int(u[_DIMS + i] * 101) - 50) / 10 for i, name in enumerate(DIMENSIONS)}
+        ),
+        discrete_attributes=DiscreteAttributes(
+            has_wirecore=u[_FLAGS] < 0.5,
+            is_transparent=u[_FLAGS + 1] < 0.5,
+            dominant_colors=[COLORS[i] for i in picked],
+            frame_shape=SHAPES[int(u[_SHAPE] * len(SHAPES))],
+            texture_pattern=TEXTURES[int(u[_TEXTURE] * len(TEXTURES))],
+            looks_like_kids_product=u[_FLAGS + 2] < 0.5,
+        ),
+        metadata=VisualMetadata(
+            image_quality_notes=QUALITY_NOTES[int(u[_NOTES] * len(QUALITY_NOTES))],
+            is_occluded_or_ambiguous=u[_FLAGS + 3] < 0.1,
+            confidence_score=(50 + int(u[_CONFIDENCE] * 21)) / 100,
+        ),
+    )
+
+def synthetic_columns(digests: Sequence[bytes]) -> Dict:
+    """
+    The same analyses as synthetic_analysis for many digests at once, as
+    columns: dims (n, 5), flags (n, 4: wirecore, transparent, kids, occluded), shape,
+    texture and notes (indexes into SHAPES, TEXTURES, QUALITY_NOTES), confidence and
+    colors (n, len(COLORS) mask).
+    """
+    import numpy as np # only bulk generation needs it; the mock provider does not
+
+    u = np.frombuffer(b"".join(digests), dtype=">u2").reshape(len(digests), -1) / 65536
+    # Stable sorts break ties by palette order, as sorted() does in synthetic_analysis
+    order = np.argsort(u[:, _COLOR_RANKS:SLOTS], axis=1, kind="stable")
+    ranks = np.argsort(order, axis=1, kind="stable")
+    counts = 1 + np.floor(u[:, _COLOR_COUNT] * 3)
+    return {
+        "dims": (np.floor(u[:, _DIMS:_FLAGS] * 101) - 50) / 10,
+        "flags": u[:, _FLAGS:_SHAPE] < np.array([0.5, 0.5, 0.5, 0.1]),
+        "shape": np.floor(u[:, _SHAPE] * len(SHAPES)).astype(np.int64),
+        "texture": np.floor(u[:, _TEXTURE] * len(TEXTURES)).astype(np.int64),
+        "notes": np.floor(u[:, _NOTES] * len(QUALITY_NOTES)).astype(np.int64),
+        "confidence": (50 + np.floor(u[:, _CONFIDENCE] * 21)) / 100,
+        "colors": ranks < counts[:, None],
+    }
+
+def synthetic_results(product_ids: Sequence[str], seed: int = 0) -> List[ProductAnalysisResponse]:
+    """
+    Synthetic analyses for a catalog of product ids, keyed on the id. Generated in
+    bulk, for filling the results store and the search index in benchmarks.
+    """
+    columns = synthetic_columns([key_digest(product_id, seed) for product_id in product_ids])
+    dims = columns["dims"].tolist()
+    flags = columns["flags"].tolist()
+    palette = [[COLORS[i] for i, on in enumerate(row) if on] for row in columns["colors"].tolist()]
+    results = []
+    for i, (product_id, shape, texture, notes, confidence) in enumerate(zip(
+        product_ids, columns["shape"].tolist(), columns["texture"].tolist(), columns["notes"].tolist(),
+        columns["confidence"].tolist(),
+    )):
+        wirecore, transparent, kids, occluded = flags[i]
+        results.append(ProductAnalysisResponse(
+            product_id=product_id,
+            continuous_dimensions=ContinuousDimensions(**dict(zip(DIMENSIONS, dims[i]))),
+            discrete_attributes=DiscreteAttributes(
+                has_wirecore=wirecore,
+                is_transparent=transparent,
+                dominant_colors=palette[i],
+                frame_shape=SHAPES[shape],
+                texture_pattern=TEXTURES[texture],
+                looks_like_kids_product=kids,
+            ),
+            metadata=VisualMetadata(
+                image_quality_notes=QUALITY_NOTES[notes], is_occluded_or_ambiguous=occluded, confidence_score=confidence
+            ),
+        ))
+    return results
@@ -1,111 +1,287 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
-from services.vision.models.schemas import ProductAnalysisResponse, ContinuousDimensions, DiscreteAttributes, VisualMetadata
+from typing import List, Dict, Any, Optional
+from services.common.schemas import ProductAnalysisResponse
 from services.vision.services.prompt_manager import PromptManager
+from services.vision.services.prompt_templates import PromptRequest, PromptUsage, batch_request, get_template
+from services.vision.services.response_parser import ResponseParser
+from services.vision.models.image_payload import ImageSource, image_identity
+from services.vision.services.synthetic import key_digest, synthetic_analysis
+import asyncio
+import logging
+import math
 import random
+import time
 
-from groq import AsyncGroq
 from services.vision.config import settings
+from services.common.observability import PROVIDER_CANCELLATIONS, PROVIDER_FALLBACKS, stage
+from services.vision.services.rate_limiter import (
+    AdaptiveConcurrencyLimiter,
+    ProviderOverloadedError,
+    ProviderRateLimited,
+    ProviderThrottle,
+    TokenBucket,
+    parse_duration,
+)
+
+logger = logging.getLogger(__name__)
 
 class IVisionService(ABC):
     @abstractmethod
-    async def analyze_images(self, image_urls: List[str]) -> ProductAnalysisResponse:
+    async def analyze_images(self, image_urls: List[ImageSource]) -> ProductAnalysisResponse:
+        pass
+
+    async def analyze_batch(self, image_sets: List[List[ImageSource]]) -> List[Optional[ProductAnalysisResponse]]:
+        """
+        Analyzes several products, aligned with `image_sets`. Providers that can fit many
+        products in one prompt override this; None marks a product the batch answer
+        did not cover, which the caller retries with analyze_images.
+        """
+        return list(await asyncio.gather(*(self.analyze_images(images) for images in image_sets)))
+
+    async def aclose(self):
+        """
+        Releases clients and pools. Called once when the owning app shuts down.
+        """
         pass
 
+class MockProviderError(Exception):
+    """
+    A provider failure injected by the mock (MOCK_ERROR_RATE).
+    """
+
 class MockVisionService(IVisionService):
     """
-    Returns deterministic/randomized data for testing without API costs.
-    Now "Smart" - produces dynamic results based on image URL hash.
+    Fake provider for tests and load generation, without API costs. Answers are a
+    function of a digest of the images (and MOCK_SEED), so the same images get the
+    same analysis in every process and under any concurrency. Latency, CPU cost,
+    errors and 429s are drawn per call from the configured distributions.
     """
-    async def analyze_images(self, image_urls: List[str]) -> ProductAnalysisResponse:
-        # 1. Create a deterministic seed from the image URLs
-        # Concatenate all urls and hash
-        combined_string = "".join(image_urls)
-        seed_value = hash(combined_string)
-        random.seed(seed_value)
-
-        # 2. Generate Dynamic Continuous Dimensions (-5.0 to +5.0)
-        # We use random.uniform and round to 1 decimal place
-        dims = ContinuousDimensions(
-            gender_expression=round(random.uniform(-5.0, 5.0), 1),
-            visual_weight=round(random.uniform(-5.0, 5.0), 1),
-            embellishment=round(random.uniform(-5.0, 5.0), 1),
-            unconventionality=round(random.uniform(-5.0, 5.0), 1),
-            formality=round(random.uniform(-5.0, 5.0), 1)
-        )
+    model = "mock"
 
-        # 3. Generate Dynamic Discrete Attributes
-        colors = ["Black", "Silver", "Gold", "Tortoise", "Blue", "Red", "Clear", "Grey"]
-        shapes = ["Rectangular", "Round", "Aviator", "Cat-eye", "Square", "Oval", "Geometric"]
-        textures = ["Matte", "Glossy", "Translucent", "Tortoise Pattern", "Metallic"]
-
-        # Pick 1-3 random colors
-        dom_colors = random.sample(colors, k=random.randint(1, 3))
-
-        attrs = DiscreteAttributes(
-            has_wirecore=random.choice([True, False]),
-            is_transparent=random.choice([True, False]),
-            dominant_colors=dom_colors,
-            frame_shape=random.choice(shapes),
-            texture_pattern=random.choice(textures),
-            looks_like_kids_product=random.choice([True, False])
-        )
+    def __init__(
+        self,
+        latency_ms: Optional[float] = None,
+        latency_jitter_ms: Optional[float] = None,
+        cpu_ms: Optional[float] = None,
+        latency_distribution: Optional[str] = None,
+        latency_sigma: Optional[float] = None,
+        error_rate: Optional[float] = None,
+        rate_limit_rate: Optional[float] = None,
+        seed: Optional[int] = None,
+    ):
+        # Simulated provider latency, for load tests that need realistic in-flight times
+        self.latency_ms = settings.MOCK_LATENCY_MS if latency_ms is None else latency_ms
+        self.latency_jitter_ms = settings.MOCK_LATENCY_JITTER_MS if latency_jitter_ms is None else latency_jitter_ms
+        self.latency_distribution = (latency_distribution or settings.MOCK_LATENCY_DISTRIBUTION).lower()
+        self.latency_sigma = settings.MOCK_LATENCY_SIGMA if latency_sigma is None else latency_sigma
+        # Busy work per call: CPU-bound time that only more processes (not more tasks) can overlap
+        self.cpu_ms = settings.MOCK_CPU_MS if cpu_ms is None else cpu_ms
+        self.error_rate = settings.MOCK_ERROR_RATE if error_rate is None else error_rate
+        self.rate_limit_rate = settings.MOCK_RATE_LIMIT_RATE if rate_limit_rate is None else rate_limit_rate
+        self.seed = settings.MOCK_SEED if seed is None else seed
+        # Latency and fault draws only; answers never depend on call order
+        self.rng = random.Random(self.seed)
+        self.stats = {"calls": 0, "errors": 0, "rate_limited": 0}
 
-        # 4. Return Response
-        return ProductAnalysisResponse(
-            continuous_dimensions=dims,
-            discrete_attributes=attrs,
-            metadata=VisualMetadata(
-                image_quality_notes=random.choice(["Average", "Below Average"]),
-                is_occluded_or_ambiguous=random.random() < 0.1, # 10% chance
-                confidence_score=round(random.uniform(0.50, 0.70), 2)
-            )
-        )
+    def latency(self) -> float:
+        """
+        One simulated provider latency, in seconds.
+        """
+        if self.latency_ms <= 0 and self.latency_distribution != "uniform":
+            return 0.0
+        if self.latency_distribution == "lognormal":
+            # Median latency_ms with a long right tail, like real LLM calls
+            return self.rng.lognormvariate(math.log(self.latency_ms), self.latency_sigma) / 1000.0
+        if self.latency_distribution == "exponential":
+            return self.rng.expovariate(1000.0 / self.latency_ms)
+        jitter = self.rng.uniform(-self.latency_jitter_ms, self.latency_jitter_ms)
+        return max(0.0, self.latency_ms + jitter) / 1000.0
+
+    async def analyze_images(self, image_urls: List[ImageSource]) -> ProductAnalysisResponse:
+        self.stats["calls"] += 1
+        if self.rate_limit_rate > 0 and self.rng.random() < self.rate_limit_rate:
+            # What callers see when a real provider's quota stays exhausted
+            self.stats["rate_limited"] += 1
+            raise ProviderOverloadedError("Mock provider rate limit (injected).", retry_after=settings.MOCK_RETRY_AFTER_SECONDS)
+
+        delay = self.latency()
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                PROVIDER_CANCELLATIONS.labels("mock").inc()
+                raise
+        if self.cpu_ms > 0:
+            deadline = time.process_time() + self.cpu_ms / 1000.0
+            while time.process_time() < deadline:
+                pass
+        if self.error_rate > 0 and self.rng.random() < self.error_rate:
+            self.stats["errors"] += 1
+            raise MockProviderError("Mock provider error (injected).")
+
+        # Newlines cannot occur in URLs or digests, so the joined identities are unambiguous
+        return synthetic_analysis(key_digest("\n".join(image_identity(image) for image in image_urls), self.seed))
 
 class GroqVisionService(IVisionService):
     """
     Implementation using Groq Cloud API (Llama 3.2 Vision) with Fallback.
+    Calls go through a ProviderThrottle; when the quota is exhausted callers get
+    ProviderOverloadedError (backpressure) rather than fabricated mock results.
+
+    With `fallback=False` nothing is ever mocked: a missing key fails construction and
+    provider errors or invalid answers are raised to the caller.
     """
-    def __init__(self):
-        self.api_key = settings.GROQ_API_KEY
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        throttle: Optional[ProviderThrottle] = None,
+        fallback: bool = True,
+    ):
+        self.api_key = settings.GROQ_API_KEY if api_key is None else api_key
+        if not self.api_key and not fallback:
+            raise ValueError("GROQ_API_KEY is not set in configuration.")
         # If no key is set, we can log a warning, but we still init the client
         # so the try/catch in analyze_images triggers the fallback naturally.
         self.client = None
         if self.api_key:
-            self.client = AsyncGroq(api_key=self.api_key)
+            # Imported here, so deployments on other providers never load the SDK
+            from groq import AsyncGroq
+            # Retries are handled by the throttle, which knows about the rate limits
+            self.client = AsyncGroq(api_key=self.api_key, base_url=base_url or settings.GROQ_BASE_URL or None, max_retries=0)
         self.model = "llama-3.2-11b-vision-preview"
+        self.fallback = None
+        if fallback:
+            self.fallback = MockVisionService(latency_ms=0, latency_jitter_ms=0, cpu_ms=0, error_rate=0, rate_limit_rate=0)
+        self.parser = ResponseParser()
+        self.prompt_usage = PromptUsage()
+        self.field_retry_max_fields = settings.RESPONSE_FIELD_RETRY_MAX_FIELDS
+        self.throttle = throttle or ProviderThrottle(
+            TokenBucket(settings.GROQ_REQUESTS_PER_MINUTE / 60.0, settings.GROQ_BURST),
+            AdaptiveConcurrencyLimiter(
+                initial=settings.GROQ_INITIAL_CONCURRENCY,
+                min_limit=settings.GROQ_MIN_CONCURRENCY,
+                max_limit=settings.GROQ_MAX_CONCURRENCY,
+                latency_target=settings.GROQ_LATENCY_TARGET_SECONDS,
+            ),
+            queue_timeout=settings.PROVIDER_QUEUE_TIMEOUT_SECONDS,
+        )
 
-    async def analyze_images(self, image_urls: List[str]) -> ProductAnalysisResponse:
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.close()
+
+    async def analyze_images(self, image_urls: List[ImageSource]) -> ProductAnalysisResponse:
         # Check if client exists (key was present)
         if not self.client:
-            print("Groq API Key missing. Falling back to Smart Mock.")
-            return await MockVisionService().analyze_images(image_urls)
+            logger.warning("Groq API key missing, falling back to Smart Mock")
+            return await self._fallback_to_mock(image_urls, "missing_key")
 
-        system_prompt = PromptManager.construct_system_prompt()
-        user_content = PromptManager.construct_user_message(image_urls)
-        
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_content}
-        ]
+        with stage("prompt_build"):
+            request = get_template("single", self.model).request(image_urls)
+            body = request.body(max_tokens=1024)
 
         try:
-            print("Attempting analysis via Groq...")
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=0.1,
-                max_tokens=1024,
-                response_format={"type": "json_object"}
-            )
-            
-            content = response.choices[0].message.content
-            return ProductAnalysisResponse.model_validate_json(content)
+            logger.debug("Attempting analysis via Groq", extra={"images": len(image_urls), "estimated_tokens": request.estimated_tokens})
+            content = await self.throttle.run(lambda: self._complete(request, body))
+        except ProviderOverloadedError:
+            # Backpressure is a real answer; mock data would be worse than a retry later
+            raise
         except Exception as e:
-            print(f"Groq API Failed: {e}")
-            print("Falling back to Smart Mock Service...")
+            if self.fallback is None:
+                raise
+            logger.warning("Groq API failed, falling back to Smart Mock", extra={"error": str(e)})
             # FALLBACK LOGIC
-            return await MockVisionService().analyze_images(image_urls)
+            return await self._fallback_to_mock(image_urls, "provider_error")
+
+        with stage("json_validation"):
+            parsed = self.parser.parse(content)
+
+        retried = False
+        if not parsed.ok and parsed.data is not None and len(parsed.invalid_fields) <= self.field_retry_max_fields:
+            # Ask for just the broken fields; the rest of the answer is kept
+            retried = True
+            with stage("prompt_build"):
+                follow_up = request.follow_up(content, PromptManager.construct_field_retry_message(parsed.invalid_fields))
+                follow_up_body = follow_up.body(max_tokens=256)
+            try:
+                patch = await self.throttle.run(lambda: self._complete(follow_up, follow_up_body))
+                with stage("json_validation"):
+                    parsed = self.parser.merge(parsed, patch)
+            except ProviderOverloadedError:
+                raise
+            except Exception as e:
+                logger.warning("Groq field retry failed", extra={"error": str(e)})
+
+        self.parser.record(parsed, retried)
+        if parsed.ok:
+            return parsed.response
+        if self.fallback is None:
+            raise ValueError(f"Groq returned an invalid analysis (fields: {', '.join(parsed.invalid_fields)})")
+        logger.warning(
+            "Groq returned an invalid analysis, falling back to Smart Mock",
+            extra={"invalid_fields": parsed.invalid_fields, "field_retry": retried},
+        )
+        return await self._fallback_to_mock(image_urls, "invalid_response")
+
+    async def analyze_batch(self, image_sets: List[List[ImageSource]]) -> List[Optional[ProductAnalysisResponse]]:
+        """
+        Sends several products in one request, so the system prompt is paid once.
+        Unparseable or missing entries come back as None; provider errors propagate.
+        """
+        if not self.client:
+            return [await self._fallback_to_mock(images, "missing_key") for images in image_sets]
+
+        products = {f"p{i}": images for i, images in enumerate(image_sets)}
+        with stage("prompt_build"):
+            request = batch_request(self.model, products)
+            body = request.body(max_tokens=1024 * len(image_sets))
+        logger.debug("Attempting batched analysis via Groq", extra={"products": len(image_sets), "estimated_tokens": request.estimated_tokens})
+        content = await self.throttle.run(lambda: self._complete(request, body))
+        try:
+            with stage("json_validation"):
+                parsed = PromptManager.parse_batch_response(content, list(products))
+        except ValueError as e:
+            logger.warning("Groq batch response could not be parsed", extra={"error": str(e)})
+            parsed = {}
+        return [parsed.get(key) for key in products]
+
+    async def _complete(self, request: PromptRequest, body: bytes) -> str:
+        """
+        Sends `body`, the serialized `request` (built under the callers' prompt_build stage).
+        """
+        import groq # loaded by __init__ already
+        import httpx # comes with groq
+
+        try:
+            with stage("provider_call"):
+                # The body is already serialized, so it bypasses the SDK's request models
+                resp = await self.client.post(
+                    "/openai/v1/chat/completions",
+                    cast_to=httpx.Response,
+                    content=body,
+                    options={"headers": {"Content-Type": "application/json"}},
+                )
+        except asyncio.CancelledError:
+            # The request was abandoned: the connection is dropped instead of read to the end
+            PROVIDER_CANCELLATIONS.labels("groq").inc()
+            raise
+        except groq.APIStatusError as e:
+            if e.status_code in (429, 503):
+                headers = e.response.headers
+                raise ProviderRateLimited(parse_duration(headers.get("retry-after")), headers)
+            raise
+        self.throttle.observe_headers(resp.headers)
+        data = resp.json()
+        self.prompt_usage.record(request, (data.get("usage") or {}).get("prompt_tokens"))
+        return data["choices"][0]["message"]["content"]
+
+    async def _fallback_to_mock(self, image_urls: List[ImageSource], reason: str) -> ProductAnalysisResponse:
+        PROVIDER_FALLBACKS.labels("groq", reason).inc()
+        with stage("fallback"):
+            result = await self.fallback.analyze_images(image_urls)
+        result._is_fallback = True
+        return result
 
 class OpenAIVisionService(IVisionService):
     """
@@ -115,22 +291,22 @@ class OpenAIVisionService(IVisionService):
         self.api_key = settings.OPENAI_API_KEY
         # client = AsyncOpenAI(api_key=api_key) 
 
-    async def analyze_images(self, image_urls: List[str]) -> ProductAnalysisResponse:
+    async def analyze_images(self, image_urls: List[ImageSource]) -> ProductAnalysisResponse:
         # This would call the real LLM.
         # Structure:
-        # messages = [
-        #     {"role": "system", "content": PromptManager.construct_system_prompt()},
-        #     {"role": "user", "content": PromptManager.construct_user_message(image_urls)}
-        # ]
-        # response = await client.chat.completions.create(...)
-        # return ProductAnalysisResponse.model_validate_json(response.choices[0].message.content)
+        # body = get_template("single", model).request(image_urls).body(max_tokens=1024)
+        # response = await client.post("/v1/chat/completions", cast_to=httpx.Response, content=body, ...)
+        # return ProductAnalysisResponse.model_validate_json(response.json()["choices"][0]["message"]["content"])
         raise NotImplementedError("OpenAI Service requires a valid API key and dependency.")
 
-def get_vision_service() -> IVisionService:
-    provider = settings.LLM_PROVIDER.lower()
-    
+def get_vision_service(provider: Optional[str] = None, fallback: bool = True) -> IVisionService:
+    """
+    `fallback=False` makes provider failures errors instead of mock results.
+    """
+    provider = (provider or settings.LLM_PROVIDER).strip().lower()
+
     if provider == "groq":
-        return GroqVisionService()
+        return GroqVisionService(fallback=fallback)
     elif provider == "openai":
         return OpenAIVisionService()
     else:
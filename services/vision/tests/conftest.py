@@ -0,0 +1,16 @@
+import pytest
+
+from services.vision.config import settings
+
+@pytest.fixture(autouse=True, scope="session")
+def isolated_state(tmp_path_factory):
+    """
+    Keeps the state the app persists by default (results store segments, the job
+    queue) out of the working tree, so runs neither leave files behind nor read
+    back what an earlier run wrote.
+    """
+    state = tmp_path_factory.mktemp("vision_state")
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(settings, "RESULTS_STORE_DIR", str(state / "results"))
+        patch.setattr(settings, "JOB_QUEUE_PATH", str(state / "jobs.sqlite3"))
+        yield
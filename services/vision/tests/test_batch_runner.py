@@ -0,0 +1,177 @@
+import asyncio
+import json
+import os
+
+from fastapi.testclient import TestClient
+from services.vision import batch_cli
+from services.vision.config import settings
+from services.vision.main import app
+from services.vision.models.image_payload import ImagePayload
+from services.vision.services.batch_runner import (
+    BatchRunner,
+    CatalogProduct,
+    Checkpoint,
+    Fingerprinter,
+    JsonlSink,
+    Manifest,
+    iter_catalog,
+)
+from services.vision.services.vision_engine import MockVisionService
+
+client = TestClient(app)
+
+CATALOG_CSV = os.path.join(os.path.dirname(__file__), "..", "..", "..", "A1.0_data_product_images.csv")
+
+def test_iter_catalog_reads_sample_csv():
+    products = list(iter_catalog(CATALOG_CSV))
+    assert products[0].product_id == "231031"
+    assert len(products[0].image_urls) == 5
+    assert all(url.startswith("https://") for url in products[0].image_urls)
+
+def test_batch_runner_resumes_from_checkpoint(tmp_path):
+    out = tmp_path / "results.jsonl"
+    ckpt = tmp_path / "results.ckpt"
+    products = list(iter_catalog(CATALOG_CSV))[:10]
+
+    first = asyncio.run(BatchRunner(MockVisionService(), JsonlSink(str(out)), Checkpoint(str(ckpt)), concurrency=4).run(products[:6]))
+    assert first.succeeded == 6
+
+    # Second run over the full list only analyzes the 4 products not yet checkpointed
+    second = asyncio.run(BatchRunner(MockVisionService(), JsonlSink(str(out)), Checkpoint(str(ckpt)), concurrency=4).run(products))
+    assert second.skipped == 6
+    assert second.succeeded == 4
+
+    written = [json.loads(line)["product_id"] for line in out.read_text().splitlines()]
+    assert sorted(written) == sorted(p.product_id for p in products)
+
+def test_no_resume_starts_the_output_over(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "RESULTS_STORE_ENABLED", False)
+    csv_path = tmp_path / "catalog.csv"
+    csv_path.write_text("Product Id,Image Count,Image1\np1,1,http://cdn/1.jpg\np2,1,http://cdn/2.jpg\n")
+    out = tmp_path / "results.jsonl"
+
+    for _ in range(2):
+        assert batch_cli.main([str(csv_path), "--out", str(out), "--no-resume"]) == 0
+    written = [json.loads(line)["product_id"] for line in out.read_text().splitlines()]
+    assert sorted(written) == ["p1", "p2"]
+
+class CountingService(MockVisionService):
+    def __init__(self):
+        super().__init__(latency_ms=0, latency_jitter_ms=0)
+        self.analyzed = []
+
+    async def analyze_images(self, image_urls):
+        self.analyzed.append(image_urls[0])
+        return await super().analyze_images(image_urls)
+
+class FakeFetcher:
+    """
+    Serves image bytes from a dict, standing in for ImageFetcher. `versions` maps URLs
+    to the version of their (fresh) cache entry.
+    """
+    def __init__(self, images, versions=None):
+        self.images = images
+        self.versions = versions or {}
+        self.fetched = []
+
+    async def fetch_all(self, urls):
+        self.fetched.extend(urls)
+        return [ImagePayload(data=self.images[url], mime_type="image/jpeg") for url in urls]
+
+    async def fresh_versions(self, urls):
+        return [self.versions.get(url) for url in urls]
+
+def run_incremental(tmp_path, name, products, images, prompt_hash="p1", fetcher=None):
+    service = CountingService()
+    runner = BatchRunner(
+        service,
+        JsonlSink(str(tmp_path / f"{name}.jsonl")),
+        concurrency=4,
+        manifest=Manifest(str(tmp_path / "catalog.manifest")),
+        fingerprinter=Fingerprinter(prompt_hash, "mock", fetcher or FakeFetcher(images)),
+    )
+    summary = asyncio.run(runner.run(products))
+    runner.manifest.close()
+    written = {json.loads(line)["product_id"]: json.loads(line) for line in (tmp_path / f"{name}.jsonl").read_text().splitlines()}
+    return summary, service.analyzed, written
+
+def test_incremental_run_only_analyzes_changed_products(tmp_path):
+    products = [CatalogProduct(product_id=f"p{i}", image_urls=[f"http://cdn/{i}.jpg"]) for i in range(10)]
+    images = {f"http://cdn/{i}.jpg": f"image {i}".encode() for i in range(12)}
+
+    first, analyzed, written = run_incremental(tmp_path, "night1", products, images)
+    assert first.succeeded == 10 and first.unchanged == 0 and len(analyzed) == 10
+
+    products[0] = CatalogProduct(product_id="p0", image_urls=["http://cdn/10.jpg"]) # new URL
+    images["http://cdn/1.jpg"] = b"reshot image 1" # same URL, new bytes
+    products[9:] = [CatalogProduct(product_id="p11", image_urls=["http://cdn/11.jpg"])] # p9 dropped, p11 added
+    second, analyzed, carried = run_incremental(tmp_path, "night2", products, images)
+    assert sorted(analyzed) == ["http://cdn/1.jpg", "http://cdn/10.jpg", "http://cdn/11.jpg"]
+    assert (second.succeeded, second.unchanged, second.removed) == (3, 7, 1)
+    assert sorted(carried) == sorted(p.product_id for p in products)
+    assert carried["p5"] == written["p5"]
+
+    # A new prompt invalidates every stored result
+    third, analyzed, _ = run_incremental(tmp_path, "night3", products, images, prompt_hash="p2")
+    assert third.unchanged == 0 and len(analyzed) == 10
+
+def test_incremental_run_reuses_digests_of_fresh_cache_entries(tmp_path):
+    products = [CatalogProduct(product_id=f"p{i}", image_urls=[f"http://cdn/{i}.jpg"]) for i in range(4)]
+    images = {f"http://cdn/{i}.jpg": f"image {i}".encode() for i in range(4)}
+    versions = {url: "v1" for url in images}
+    run_incremental(tmp_path, "night1", products, images, fetcher=FakeFetcher(images, versions))
+
+    versions["http://cdn/2.jpg"] = "v2" # re-downloaded since: must be hashed again
+    del versions["http://cdn/3.jpg"] # no longer fresh
+    images["http://cdn/2.jpg"] = b"reshot image 2"
+    fetcher = FakeFetcher(images, versions)
+    summary, analyzed, _ = run_incremental(tmp_path, "night2", products, images, fetcher=fetcher)
+    assert sorted(fetcher.fetched) == ["http://cdn/2.jpg", "http://cdn/3.jpg"]
+    assert analyzed == ["http://cdn/2.jpg"] and summary.unchanged == 3
+
+def test_incremental_run_analyzes_while_the_catalog_is_diffed(tmp_path):
+    products = [CatalogProduct(product_id=f"p{i}", image_urls=[f"http://cdn/{i}.jpg"]) for i in range(40)]
+    images = {f"http://cdn/{i}.jpg": f"image {i}".encode() for i in range(40)}
+    events = []
+
+    class RecordingFetcher(FakeFetcher):
+        async def fetch_all(self, urls):
+            events.append("fingerprint")
+            await asyncio.sleep(0.001)
+            return await super().fetch_all(urls)
+
+    class RecordingService(CountingService):
+        async def analyze_images(self, image_urls):
+            events.append("analyze")
+            return await super().analyze_images(image_urls)
+
+    runner = BatchRunner(
+        RecordingService(),
+        JsonlSink(str(tmp_path / "out.jsonl")),
+        concurrency=1,
+        manifest=Manifest(str(tmp_path / "catalog.manifest")),
+        fingerprinter=Fingerprinter("p1", "mock", RecordingFetcher(images)),
+    )
+    summary = asyncio.run(runner.run(products))
+    runner.manifest.close()
+    assert summary.succeeded == 40
+    assert events.index("analyze") < len(events) - 1 - events[::-1].index("fingerprint")
+
+def test_process_batch_endpoint_keeps_input_order():
+    payload = {
+        "items": [
+            {"image_urls": ["http://example.com/a.jpg"], "product_id": "a"},
+            {"image_urls": ["http://example.com/b.jpg"]},
+            # A real id that the old positional keys would have collided with
+            {"image_urls": ["http://example.com/c.jpg"], "product_id": "1"},
+            {"image_urls": ["http://example.com/d.jpg"]},
+        ]
+    }
+    response = client.post("/process-batch", json=payload)
+    assert response.status_code == 200
+    data = response.json()
+    assert [item["product_id"] for item in data["results"]] == ["a", None, "1", None]
+    assert data["succeeded"] == 4
+    assert [item["result"]["product_id"] for item in data["results"]] == ["a", None, "1", None]
+    single = client.post("/process", json={"image_urls": ["http://example.com/c.jpg"]}).json()
+    assert data["results"][2]["result"]["continuous_dimensions"] == single["continuous_dimensions"]
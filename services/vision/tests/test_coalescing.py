@@ -0,0 +1,47 @@
+import asyncio
+
+from services.vision.services.coalescing import CoalescingVisionService, SingleFlight
+from services.vision.services.vision_engine import IVisionService, MockVisionService
+
+class SlowCountingService(IVisionService):
+    model = "slow-mock"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def analyze_images(self, image_urls):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return await MockVisionService().analyze_images(image_urls)
+
+def test_identical_concurrent_requests_share_one_call():
+    inner = SlowCountingService()
+    group = SingleFlight()
+    service = CoalescingVisionService(inner, group)
+    urls = ["http://example.com/a.jpg"]
+
+    async def run():
+        return await asyncio.gather(*(service.analyze_images(urls) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert inner.calls == 1
+    assert group.coalesced == 4
+
+    # Each caller owns its copy, like the handlers' product_id overwrite needs
+    results[0].product_id = "caller-0"
+    assert all(result.product_id is None for result in results[1:])
+
+def test_cancelled_caller_does_not_cancel_shared_call():
+    inner = SlowCountingService()
+    service = CoalescingVisionService(inner, SingleFlight())
+    urls = ["http://example.com/b.jpg"]
+
+    async def run():
+        first = asyncio.ensure_future(service.analyze_images(urls))
+        second = asyncio.ensure_future(service.analyze_images(urls))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()).continuous_dimensions is not None
+    assert inner.calls == 1
@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from services.common.deadlines import DEADLINE_EXCEEDED_HEADER, DEADLINE_HEADER, DeadlineMiddleware, _deadline, remaining
+from services.gateway.upstream_pool import UpstreamPool
+from services.gateway.vision_client import DeadlineExceeded, VisionClient
+from services.vision.main import app, deadline_stats, get_pipeline
+from services.vision.services.coalescing import SingleFlight
+from services.vision.services.pipeline import AnalysisPipeline
+from services.vision.services.vision_engine import MockVisionService
+
+@pytest.fixture
+def slow_client():
+    service = MockVisionService(latency_ms=2000, latency_jitter_ms=0)
+    pipeline = AnalysisPipeline(service, service, SingleFlight())
+    app.dependency_overrides[get_pipeline] = lambda: pipeline
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
+
+def test_provider_call_is_cancelled_when_the_budget_runs_out(slow_client):
+    expired = deadline_stats.counts["expired"]
+    started = time.monotonic()
+    response = slow_client.post("/process", json={"image_urls": ["http://example.com/a.jpg"]}, headers={DEADLINE_HEADER: "0.2"})
+    assert response.status_code == 504
+    assert response.headers[DEADLINE_EXCEEDED_HEADER] == "true"
+    assert time.monotonic() - started < 1.5
+    assert deadline_stats.counts["expired"] == expired + 1
+
+    # A budget spent before arrival is refused without running the handler
+    response = slow_client.post("/process", json={"image_urls": ["http://example.com/a.jpg"]}, headers={DEADLINE_HEADER: "-1"})
+    assert response.status_code == 504
+
+def test_handler_is_cancelled_when_the_client_disconnects():
+    cancelled = asyncio.Event()
+    seen = {}
+
+    async def handler(scope, receive, send):
+        seen["remaining"] = remaining()
+        assert (await receive())["type"] == "http.request"
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def scenario():
+        messages = [{"type": "http.request", "body": b"{}", "more_body": False}]
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await asyncio.sleep(0.05) # the client goes away mid-request
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        middleware = DeadlineMiddleware(handler, service="test")
+        scope = {"type": "http", "path": "/process", "headers": [(b"content-length", b"2"), (DEADLINE_HEADER.encode(), b"5")]}
+        await asyncio.wait_for(middleware(scope, receive, send), timeout=2)
+        return middleware, sent
+
+    middleware, sent = asyncio.run(scenario())
+    assert cancelled.is_set()
+    assert 4 < seen["remaining"] <= 5
+    assert middleware.stats.counts == {"requests": 1, "with_deadline": 1, "expired": 0, "disconnected": 1}
+    assert sent[0]["status"] == 499
+
+def test_gateway_passes_on_the_time_left_and_does_not_retry_expired_requests():
+    budgets = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        budgets.append(float(request.headers[DEADLINE_HEADER]))
+        return httpx.Response(504, json={"detail": "Request deadline exceeded."}, headers={DEADLINE_EXCEEDED_HEADER: "true"})
+
+    async def scenario():
+        vision = VisionClient()
+        vision.pool = UpstreamPool(["http://w1", "http://w2"])
+        vision.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            # No budget from the client: the route timeout is passed on
+            with pytest.raises(httpx.HTTPStatusError):
+                await vision.post("analyze", "/process", timeout=60.0, json={})
+            _deadline.set(time.monotonic() + 2.0)
+            with pytest.raises(httpx.HTTPStatusError):
+                await vision.post("analyze", "/process", timeout=60.0, json={})
+            _deadline.set(time.monotonic() - 0.1)
+            with pytest.raises(DeadlineExceeded):
+                await vision.post("analyze", "/process", timeout=60.0, json={})
+        finally:
+            await vision.client.aclose()
+        return vision
+
+    vision = asyncio.run(scenario())
+    assert budgets[0] == 60.0 and 1.5 < budgets[1] <= 2.0
+    assert len(budgets) == 2 # neither 504 was retried
+    assert vision.stats()["analyze"]["deadline_exceeded"] == 3
@@ -0,0 +1,121 @@
+import asyncio
+import io
+import sqlite3
+
+from PIL import Image, ImageDraw
+
+from services.vision.models.image_payload import ImagePayload
+from services.vision.services import prompt_templates
+from services.vision.services.image_dedup import DedupVisionService, PerceptualIndex, dhash, phash
+from services.vision.services.vision_engine import IVisionService, MockVisionService
+
+def make_frame(size, variant: int = 0, fmt: str = "JPEG") -> ImagePayload:
+    """
+    A synthetic product shot: a frame outline drawn at `size`; `variant` changes the shape.
+    """
+    width, height = size
+    # A lit background gradient, like a studio shot, rather than flat white
+    img = Image.linear_gradient("L").resize(size).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    if variant == 0:
+        draw.ellipse([width * 0.1, height * 0.3, width * 0.45, height * 0.7], outline="black", width=max(2, width // 40))
+        draw.ellipse([width * 0.55, height * 0.3, width * 0.9, height * 0.7], outline="black", width=max(2, width // 40))
+    else:
+        draw.rectangle([0, 0, width * 0.5, height], fill="navy")
+        draw.polygon([(width, 0), (width * 0.6, height), (width, height)], fill="orange")
+    out = io.BytesIO()
+    img.save(out, format=fmt, quality=80)
+    return ImagePayload(data=out.getvalue(), mime_type=f"image/{fmt.lower()}")
+
+class CountingVisionService(IVisionService):
+    model = "counting"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def analyze_images(self, image_urls):
+        self.calls += 1
+        return await MockVisionService(latency_ms=0, latency_jitter_ms=0).analyze_images(image_urls)
+
+def test_hashes_are_stable_across_resizes_but_not_designs():
+    for hash_image in (phash, dhash):
+        large = hash_image(make_frame((800, 400)).data)
+        small = hash_image(make_frame((400, 200), fmt="PNG").data)
+        other = hash_image(make_frame((800, 400), variant=1).data)
+        assert bin(large ^ small).count("1") <= 6
+        assert bin(large ^ other).count("1") > 12
+
+def test_near_duplicate_image_set_reuses_analysis():
+    inner = CountingVisionService()
+    service = DedupVisionService(inner, PerceptualIndex(), max_distance=6)
+
+    first = asyncio.run(service.analyze_images([make_frame((800, 400)), make_frame((800, 400), variant=1)]))
+    # Same shots at another size and in a different order
+    second = asyncio.run(service.analyze_images([make_frame((600, 300), variant=1), make_frame((600, 300))]))
+    asyncio.run(service.analyze_images([make_frame((600, 300), variant=1)]))
+
+    assert inner.calls == 2 # the single-image set is a different product
+    assert second.continuous_dimensions == first.continuous_dimensions
+    assert service.stats["llm_calls_saved"] == 1
+
+def test_url_images_are_passed_through():
+    inner = CountingVisionService()
+    service = DedupVisionService(inner, PerceptualIndex(), max_distance=6)
+    asyncio.run(service.analyze_images(["http://example.com/a.jpg"]))
+    asyncio.run(service.analyze_images(["http://example.com/a.jpg"]))
+    assert inner.calls == 2 and service.stats["unhashable"] == 2
+
+def test_prompt_change_misses_the_index(monkeypatch):
+    inner = CountingVisionService()
+    service = DedupVisionService(inner, PerceptualIndex(), max_distance=6)
+    asyncio.run(service.analyze_images([make_frame((800, 400))]))
+
+    monkeypatch.setattr(prompt_templates, "USER_PROMPT", "Describe these product images.")
+    prompt_templates.get_template.cache_clear()
+    try:
+        asyncio.run(service.analyze_images([make_frame((600, 300))]))
+    finally:
+        monkeypatch.undo()
+        prompt_templates.get_template.cache_clear()
+    assert inner.calls == 2 and service.stats["llm_calls_saved"] == 0
+
+    # Back under the original prompt the first analysis is reused again
+    asyncio.run(service.analyze_images([make_frame((600, 300))]))
+    assert inner.calls == 2 and service.stats["llm_calls_saved"] == 1
+
+def test_index_persists_and_is_bounded(tmp_path):
+    path = str(tmp_path / "dedup.sqlite3")
+    index = PerceptualIndex(path, max_entries=2)
+    index.add("m", "v1", [0x0F], "a")
+    index.add("m", "v1", [0xF0F0], "b")
+    index.add("m", "v1", [0xFFFF0000], "c")
+    assert len(index) == 2
+
+    reopened = PerceptualIndex(path, max_entries=2)
+    assert reopened.find("m", "v1", [0x0F], max_distance=0) is None
+    assert reopened.find("m", "v1", [0xF0F1], max_distance=1) == "b"
+    assert reopened.find("m", "v2", [0xF0F1], max_distance=1) is None
+    assert reopened.find("other", "v1", [0xF0F1], max_distance=1) is None
+
+def test_workers_sharing_a_file_see_each_others_additions(tmp_path):
+    path = str(tmp_path / "dedup.sqlite3")
+    first, second = PerceptualIndex(path), PerceptualIndex(path)
+    first.add("m", "v1", [0x0F], "a")
+    second.add("m", "v1", [0xF0F0], "b")
+
+    assert second.find("m", "v1", [0x0F], max_distance=0) == "a"
+    assert first.find("m", "v1", [0xF0F0], max_distance=0) == "b"
+    assert len(first) == len(second) == 2
+
+def test_unkeyed_index_files_are_discarded(tmp_path):
+    path = str(tmp_path / "dedup.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE image_sets (id INTEGER PRIMARY KEY, hashes TEXT NOT NULL, result TEXT NOT NULL)")
+    conn.execute("INSERT INTO image_sets (hashes, result) VALUES ('000000000000000f', 'stale')")
+    conn.commit()
+    conn.close()
+
+    index = PerceptualIndex(path)
+    assert len(index) == 0
+    index.add("m", "v1", [0x0F], "a")
+    assert PerceptualIndex(path).find("m", "v1", [0x0F], max_distance=0) == "a"
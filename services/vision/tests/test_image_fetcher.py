@@ -0,0 +1,126 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from services.vision.services.image_fetcher import CachedBlob, DiskBlobCache, ImageFetcher, ImageFetchRefused
+
+IMAGE_BYTES = b"\x89PNG fake image bytes"
+
+class StandInCDN(BaseHTTPRequestHandler):
+    """
+    Local stand-in for the image CDN: serves one image with an ETag and honours If-None-Match.
+    """
+    requests = []
+
+    def do_GET(self):
+        StandInCDN.requests.append(self.headers.get("If-None-Match"))
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(IMAGE_BYTES)))
+        self.end_headers()
+        self.wfile.write(IMAGE_BYTES)
+
+    def log_message(self, *args):
+        pass
+
+def test_fetcher_revalidates_cached_images(tmp_path):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInCDN)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/frame.png"
+    StandInCDN.requests = []
+
+    async def run():
+        fetcher = ImageFetcher(
+            per_host_limit=2, cache=DiskBlobCache(str(tmp_path), max_bytes=1024 * 1024), allow_private_hosts=True
+        )
+        try:
+            first = await fetcher.fetch(url)
+            second = await fetcher.fetch(url)
+            return first, second, fetcher.stats
+        finally:
+            await fetcher.aclose()
+
+    try:
+        first, second, stats = asyncio.run(run())
+    finally:
+        server.shutdown()
+
+    assert first.data == second.data == IMAGE_BYTES
+    assert second.mime_type == "image/png"
+    assert StandInCDN.requests == [None, '"v1"']
+    assert stats["downloaded"] == 1 and stats["not_modified"] == 1
+
+def test_disk_cache_evicts_past_max_bytes(tmp_path):
+    cache = DiskBlobCache(str(tmp_path), max_bytes=100)
+    for i in range(5):
+        cache.put(f"http://cdn/{i}.jpg", CachedBlob(b"x" * 30, "image/jpeg", f'"{i}"', None))
+    assert cache.total_bytes <= 100
+    assert cache.evictions > 0
+
+def test_fresh_versions_change_when_an_entry_is_rewritten(tmp_path):
+    cache = DiskBlobCache(str(tmp_path), max_bytes=1024)
+    fetcher = ImageFetcher(cache=cache)
+    fresh, stale = "http://cdn/fresh.jpg", "http://cdn/stale.jpg"
+    cache.put(fresh, CachedBlob(b"a", "image/jpeg", '"1"', None, expires_at=time.time() + 60))
+    cache.put(stale, CachedBlob(b"b", "image/jpeg", '"1"', None, expires_at=0.0))
+
+    [first, none, missing] = asyncio.run(fetcher.fresh_versions([fresh, stale, "http://cdn/missing.jpg"]))
+    assert first is not None and none is None and missing is None
+
+    cache.put(fresh, CachedBlob(b"c", "image/jpeg", '"2"', None, expires_at=time.time() + 60))
+    assert asyncio.run(fetcher.fresh_versions([fresh])) != [first]
+
+CDN = "http://93.184.216.34" # public address literals, so no lookup is made
+
+def fetch_through(handler, url, **options):
+    async def run():
+        fetcher = ImageFetcher(client=httpx.AsyncClient(transport=httpx.MockTransport(handler)), **options)
+        try:
+            return await fetcher.fetch(url), fetcher.stats
+        finally:
+            await fetcher.aclose()
+    return asyncio.run(run())
+
+def test_redirects_are_followed_and_checked():
+    def handler(request):
+        if request.url.path == "/old.png":
+            return httpx.Response(301, headers={"Location": "/new.png"})
+        if request.url.path == "/new.png":
+            return httpx.Response(200, content=IMAGE_BYTES, headers={"Content-Type": "image/png"})
+        if request.url.path == "/loop.png":
+            return httpx.Response(302, headers={"Location": "/loop.png"})
+        return httpx.Response(302, headers={"Location": "http://169.254.169.254/latest/meta-data/"})
+
+    payload, _ = fetch_through(handler, f"{CDN}/old.png")
+    assert payload.data == IMAGE_BYTES and payload.mime_type == "image/png"
+    with pytest.raises(ImageFetchRefused, match="non-public"):
+        fetch_through(handler, f"{CDN}/internal.png")
+    with pytest.raises(ImageFetchRefused, match="redirects"):
+        fetch_through(handler, f"{CDN}/loop.png", max_redirects=2)
+    with pytest.raises(ImageFetchRefused, match="non-public"):
+        fetch_through(handler, "http://127.0.0.1/frame.png")
+
+def test_bodies_over_max_bytes_are_refused():
+    async def chunks():
+        for _ in range(10):
+            yield b"x" * 100
+
+    def handler(request):
+        if request.url.path == "/declared.png":
+            return httpx.Response(200, content=b"x" * 1000)
+        return httpx.Response(200, content=chunks()) # no Content-Length
+
+    for path in ("/declared.png", "/streamed.png"):
+        with pytest.raises(ImageFetchRefused, match="byte limit"):
+            fetch_through(handler, f"{CDN}{path}", max_bytes=500)
+    payload, stats = fetch_through(handler, f"{CDN}/streamed.png", max_bytes=1000)
+    assert len(payload.data) == 1000 and stats["bytes_downloaded"] == 1000
@@ -0,0 +1,82 @@
+import asyncio
+import io
+
+from PIL import Image, PngImagePlugin
+from prometheus_client import REGISTRY
+
+from services.vision.models.image_payload import ImagePayload
+from services.vision.services.image_preprocessor import ImagePreprocessor, reencode_image, strip_metadata
+
+def _png(width: int, height: int) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 120, 40)).save(out, format="PNG")
+    return out.getvalue()
+
+def test_reencode_downscales_to_max_edge():
+    data, mime_type = reencode_image(_png(2400, 1200), max_edge=600, output_format="JPEG", quality=80)
+    assert mime_type == "image/jpeg"
+    with Image.open(io.BytesIO(data)) as img:
+        assert img.size == (600, 300)
+        assert "exif" not in img.info
+
+def _jpeg_with_exif(orientation: int = 1) -> bytes:
+    exif = Image.Exif()
+    exif[0x010E] = "studio shot, " * 50 # ImageDescription
+    exif[0x0112] = orientation
+    out = io.BytesIO()
+    Image.effect_noise((256, 256), 64).convert("RGB").save(out, format="JPEG", quality=30, exif=exif.tobytes())
+    return out.getvalue()
+
+def test_metadata_is_stripped_when_reencoding_would_grow_the_image():
+    original = _jpeg_with_exif()
+    data, mime_type = reencode_image(original, max_edge=1024, output_format="JPEG", quality=95)
+    assert mime_type == "image/jpeg" and len(data) < len(original)
+    with Image.open(io.BytesIO(data)) as img, Image.open(io.BytesIO(original)) as before:
+        assert "exif" not in img.info
+        assert img.tobytes() == before.tobytes() # the pixels were not re-encoded
+
+    info = PngImagePlugin.PngInfo()
+    info.add_text("Comment", "x" * 500)
+    out = io.BytesIO()
+    Image.new("RGB", (64, 64), (200, 120, 40)).save(out, format="PNG", pnginfo=info)
+    stripped = strip_metadata(out.getvalue(), "PNG")
+    with Image.open(io.BytesIO(stripped)) as img:
+        assert "Comment" not in img.info and img.getpixel((0, 0)) == (200, 120, 40)
+    assert strip_metadata(b"not an image", "JPEG") is None
+
+def test_rotated_images_are_reencoded_upright():
+    data, mime_type = reencode_image(_jpeg_with_exif(orientation=6), max_edge=1024, output_format="JPEG", quality=95)
+    with Image.open(io.BytesIO(data)) as img:
+        assert mime_type == "image/jpeg" and "exif" not in img.info
+
+def test_preprocessor_reports_bytes_saved():
+    preprocessor = ImagePreprocessor(max_edge=256, max_workers=1)
+    original = _png(1600, 1600)
+
+    async def run():
+        try:
+            return await preprocessor.prepare([ImagePayload(data=original, mime_type="image/png")])
+        finally:
+            await preprocessor.aclose()
+
+    images, bytes_in, bytes_out = asyncio.run(run())
+    assert isinstance(images[0], ImagePayload)
+    assert bytes_in == len(original)
+    assert bytes_out == len(images[0].data) < bytes_in
+    assert preprocessor.stats.bytes_saved == bytes_in - bytes_out
+
+def test_savings_are_exported_as_metrics():
+    def total(direction):
+        return REGISTRY.get_sample_value("image_preprocess_bytes_total", {"direction": direction}) or 0
+
+    preprocessor = ImagePreprocessor(max_edge=256, max_workers=1)
+    before = total("in"), total("out")
+
+    async def run():
+        try:
+            return await preprocessor.prepare([ImagePayload(data=_png(800, 800), mime_type="image/png")])
+        finally:
+            await preprocessor.aclose()
+
+    _, bytes_in, bytes_out = asyncio.run(run())
+    assert (total("in") - before[0], total("out") - before[1]) == (bytes_in, bytes_out)
@@ -0,0 +1,218 @@
+import asyncio
+import hashlib
+import hmac
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from services.vision.config import settings
+from services.vision.main import app
+from services.vision.run_workers import Supervisor, worker_env, worker_owner
+from services.common.schemas import JobStatus
+from services.vision.services.job_queue import JobStore, JobWorkerPool, QueueFull
+from services.vision.services.vision_engine import IVisionService, MockVisionService
+
+URLS = ["http://example.com/a.jpg"]
+
+class FlakyVisionService(IVisionService):
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = 0
+
+    async def analyze_images(self, image_urls):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise RuntimeError("provider exploded")
+        return await MockVisionService().analyze_images(image_urls)
+
+async def wait_for_status(store: JobStore, job_id: str, statuses, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = store.get(job_id)
+        if status.status in statuses:
+            return status
+        await asyncio.sleep(0.02)
+    raise AssertionError(f"job {job_id} stuck in {store.get(job_id).status}")
+
+def test_job_api_submit_and_poll(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_QUEUE_PATH", str(tmp_path / "jobs.sqlite3"))
+    with TestClient(app) as client:
+        submitted = client.post("/jobs", json={"image_urls": URLS, "product_id": "job-1"})
+        assert submitted.status_code == 202
+        status_url = submitted.json()["status_url"]
+
+        deadline = time.monotonic() + 5
+        while (status := client.get(status_url).json())["status"] != JobStatus.SUCCEEDED:
+            assert time.monotonic() < deadline
+            time.sleep(0.02)
+        assert status["result"]["product_id"] == "job-1"
+        assert client.get("/jobs/does-not-exist").status_code == 404
+
+class FakeProcess:
+    def __init__(self, returncode=None):
+        self.returncode = returncode
+
+    def poll(self):
+        return self.returncode
+
+def test_supervisor_requeues_a_dead_workers_jobs_and_backs_off(tmp_path, monkeypatch):
+    path = str(tmp_path / "jobs.sqlite3")
+    monkeypatch.setattr(settings, "JOB_QUEUE_PATH", path)
+    assert worker_env(1)["JOB_OWNER"] == worker_owner(1)
+
+    store = JobStore(path, owner=worker_owner(1))
+    job_id = store.submit(URLS, None, None, max_pending=10)
+    assert store.claim()["id"] == job_id
+    store.close() # the worker dies mid-job
+
+    supervisor = Supervisor(2, "127.0.0.1", 8001)
+    spawned = []
+
+    def spawn(index):
+        spawned.append(index)
+        supervisor.processes[index] = FakeProcess(returncode=1)
+        supervisor.started_at[index] = time.monotonic()
+
+    monkeypatch.setattr(supervisor, "spawn", spawn)
+    supervisor.spawn(1)
+    supervisor.processes[0] = FakeProcess()
+
+    supervisor.check()
+    assert JobStore(path).claim()["id"] == job_id # requeued before the restart
+    delays = []
+    for _ in range(3):
+        delays.append(supervisor.restart_at[1] - time.monotonic())
+        supervisor.restart_at[1] = 0.0 # the delay has passed
+        supervisor.check() # restarts the worker...
+        supervisor.check() # ...which dies again at once
+    assert spawned == [1, 1, 1, 1]
+    # A worker that keeps failing at startup is restarted less and less often
+    assert [round(delay) for delay in delays] == [1, 2, 4]
+
+def test_running_jobs_are_requeued_after_a_crash(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    store = JobStore(path)
+    job_id = store.submit(URLS, None, None, max_pending=10)
+    assert store.claim()["id"] == job_id
+    store.close()
+
+    reopened = JobStore(path)
+    assert reopened.requeue_running() == 1
+    assert reopened.get(job_id).status == JobStatus.QUEUED
+
+def test_submit_rejects_when_queue_is_full(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    store.submit(URLS, None, None, max_pending=1)
+    with pytest.raises(QueueFull):
+        store.submit(URLS, None, None, max_pending=1)
+
+def test_failed_job_is_retried_and_signed_callback_delivered(tmp_path):
+    received = []
+
+    def callback(request: httpx.Request) -> httpx.Response:
+        received.append(request)
+        return httpx.Response(200)
+
+    async def scenario():
+        store = JobStore(str(tmp_path / "jobs.sqlite3"))
+        service = FlakyVisionService(failures=1)
+        pool = JobWorkerPool(store, service, concurrency=2, retry_backoff=0.0, callback_secret="s3cret")
+        pool.POLL_INTERVAL = 0.02
+        pool.start()
+        pool.client = httpx.AsyncClient(transport=httpx.MockTransport(callback))
+        job_id = await pool.submit(URLS, "p-1", "http://client.example/hook", max_pending=10)
+
+        status = await wait_for_status(store, job_id, {JobStatus.SUCCEEDED, JobStatus.FAILED})
+        deadline = time.monotonic() + 2
+        while not received and time.monotonic() < deadline:
+            await asyncio.sleep(0.02)
+        await pool.aclose()
+        return status, service.calls
+
+    status, calls = asyncio.run(scenario())
+    assert status.status == JobStatus.SUCCEEDED
+    assert calls == 2 and status.attempts == 2
+
+    assert len(received) == 1
+    body = received[0].content
+    expected = hmac.new(b"s3cret", body, hashlib.sha256).hexdigest()
+    assert received[0].headers["x-signature"] == f"sha256={expected}"
+
+def test_worker_survives_errors_after_a_job_completes(tmp_path):
+    received = []
+
+    def callback(request: httpx.Request) -> httpx.Response:
+        if request.url.host == "broken.example":
+            raise RuntimeError("not an httpx error")
+        received.append(request.url.host)
+        return httpx.Response(200)
+
+    async def on_result(results):
+        raise RuntimeError("results store is full")
+
+    async def scenario():
+        store = JobStore(str(tmp_path / "jobs.sqlite3"))
+        pool = JobWorkerPool(store, MockVisionService(), concurrency=1, on_result=on_result)
+        pool.POLL_INTERVAL = 0.02
+        pool.start()
+        pool.client = httpx.AsyncClient(transport=httpx.MockTransport(callback))
+        jobs = [
+            await pool.submit(URLS, "p-1", "http://client.example/hook", max_pending=10),
+            await pool.submit(URLS, "p-2", "http://broken.example/hook", max_pending=10),
+            await pool.submit(URLS, "p-3", "http://client.example/hook", max_pending=10),
+        ]
+        statuses = [await wait_for_status(store, job_id, {JobStatus.SUCCEEDED, JobStatus.FAILED}) for job_id in jobs]
+        deadline = time.monotonic() + 2
+        while len(received) < 2 and time.monotonic() < deadline:
+            await asyncio.sleep(0.02)
+        alive = not pool.tasks[0].done()
+        await pool.aclose()
+        return statuses, alive
+
+    statuses, alive = asyncio.run(scenario())
+    assert [status.status for status in statuses] == [JobStatus.SUCCEEDED] * 3
+    assert alive and received == ["client.example", "client.example"] # on_result failing skips no callback
+
+class SlowVisionService(IVisionService):
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    async def analyze_images(self, image_urls):
+        await asyncio.sleep(self.seconds)
+        return await MockVisionService(latency_ms=0, latency_jitter_ms=0).analyze_images(image_urls)
+
+def test_workers_sharing_a_queue_drain_only_their_own_jobs(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+
+    async def scenario():
+        other = JobStore(path) # another worker process, mid-job
+        other_job = other.submit(URLS, None, None, max_pending=10)
+        assert other.claim()["id"] == other_job
+
+        store = JobStore(path)
+        pool = JobWorkerPool(store, SlowVisionService(0.3), concurrency=2, requeue_on_start=False)
+        pool.start()
+        finished = await pool.submit(URLS, "finishes", None, max_pending=10)
+        await wait_for_status(store, finished, {JobStatus.RUNNING})
+        await pool.aclose(drain_timeout=5.0)
+        return other.get(other_job), other.get(finished)
+
+    other_status, finished_status = asyncio.run(scenario())
+    assert other_status.status == JobStatus.RUNNING # neither requeued on start nor on close
+    assert finished_status.status == JobStatus.SUCCEEDED # allowed to finish while draining
+
+def test_drain_timeout_requeues_unfinished_jobs(tmp_path):
+    async def scenario():
+        store = JobStore(str(tmp_path / "jobs.sqlite3"))
+        pool = JobWorkerPool(store, SlowVisionService(10.0), concurrency=1)
+        pool.start()
+        job_id = await pool.submit(URLS, None, None, max_pending=10)
+        await wait_for_status(store, job_id, {JobStatus.RUNNING})
+        started = time.monotonic()
+        await pool.aclose(drain_timeout=0.2)
+        return JobStore(str(tmp_path / "jobs.sqlite3")).get(job_id), time.monotonic() - started
+
+    status, elapsed = asyncio.run(scenario())
+    assert status.status == JobStatus.QUEUED and elapsed < 2
@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+import pytest
+
+from services.vision.services.micro_batcher import MicroBatchingVisionService
+from services.vision.services.prompt_manager import PromptManager
+from services.vision.services.rate_limiter import ProviderOverloadedError
+from services.vision.services.vision_engine import IVisionService, MockVisionService
+
+class RecordingVisionService(IVisionService):
+    model = "recording"
+
+    def __init__(self, drop_keys=(), batch_error=None):
+        self.mock = MockVisionService(latency_ms=0, latency_jitter_ms=0)
+        self.drop_keys = set(drop_keys)
+        self.batch_error = batch_error
+        self.batches = []
+        self.singles = []
+
+    async def analyze_images(self, image_urls):
+        self.singles.append(image_urls)
+        return await self.mock.analyze_images(image_urls)
+
+    async def analyze_batch(self, image_sets):
+        self.batches.append(image_sets)
+        if self.batch_error is not None:
+            raise self.batch_error
+        results = [await self.mock.analyze_images(images) for images in image_sets]
+        return [None if i in self.drop_keys else result for i, result in enumerate(results)]
+
+def run_concurrently(service, image_sets):
+    async def scenario():
+        return await asyncio.gather(*(service.analyze_images(images) for images in image_sets), return_exceptions=True)
+    return asyncio.run(scenario())
+
+PRODUCTS = [[f"http://example.com/{i}.jpg"] for i in range(5)]
+
+def test_concurrent_requests_share_a_batch():
+    inner = RecordingVisionService()
+    service = MicroBatchingVisionService(inner, max_batch_size=3, max_wait=0.05, max_images=10)
+    results = run_concurrently(service, PRODUCTS)
+
+    # 5 products with a batch size of 3: one full batch, then the rest after max_wait
+    assert [len(batch) for batch in inner.batches] == [3, 2]
+    assert inner.singles == []
+    expected = run_concurrently(MockVisionService(latency_ms=0, latency_jitter_ms=0), PRODUCTS)
+    assert [r.continuous_dimensions for r in results] == [r.continuous_dimensions for r in expected]
+
+def test_image_limit_splits_batches():
+    inner = RecordingVisionService()
+    service = MicroBatchingVisionService(inner, max_batch_size=10, max_wait=0.05, max_images=2)
+    run_concurrently(service, PRODUCTS[:4])
+    assert [len(batch) for batch in inner.batches] == [2, 2]
+
+def test_unparsed_products_fall_back_to_single_calls():
+    inner = RecordingVisionService(drop_keys={1})
+    service = MicroBatchingVisionService(inner, max_batch_size=3, max_wait=0.05, max_images=10)
+    results = run_concurrently(service, PRODUCTS[:3])
+
+    assert all(not isinstance(result, Exception) for result in results)
+    assert inner.singles == [PRODUCTS[1]]
+    assert service.stats["fallbacks"] == 1
+
+def test_failed_batch_falls_back_but_overload_propagates():
+    inner = RecordingVisionService(batch_error=ValueError("bad batch"))
+    service = MicroBatchingVisionService(inner, max_batch_size=2, max_wait=0.05, max_images=10)
+    results = run_concurrently(service, PRODUCTS[:2])
+    assert len(inner.singles) == 2 and all(not isinstance(r, Exception) for r in results)
+
+    inner = RecordingVisionService(batch_error=ProviderOverloadedError("busy", retry_after=3))
+    service = MicroBatchingVisionService(inner, max_batch_size=2, max_wait=0.05, max_images=10)
+    results = run_concurrently(service, PRODUCTS[:2])
+    assert all(isinstance(r, ProviderOverloadedError) for r in results)
+    assert inner.singles == []
+
+def test_parse_batch_response_keeps_valid_entries_only():
+    analysis = asyncio.run(MockVisionService(latency_ms=0, latency_jitter_ms=0).analyze_images(PRODUCTS[0]))
+    valid = json.loads(analysis.model_dump_json(exclude={"product_id"}))
+    content = json.dumps({"results": [
+        {"key": "p0", **valid},
+        {"key": "p1", "continuous_dimensions": {}},
+        {"key": "p9", **valid},
+    ]})
+    parsed = PromptManager.parse_batch_response(content, ["p0", "p1", "p2"])
+    assert list(parsed) == ["p0"]
+    assert parsed["p0"].continuous_dimensions == analysis.continuous_dimensions
+
+    with pytest.raises(ValueError):
+        PromptManager.parse_batch_response("not json", ["p0"])
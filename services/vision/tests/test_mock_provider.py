@@ -0,0 +1,80 @@
+import asyncio
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from services.vision.models.image_payload import ImagePayload
+from services.vision.services.rate_limiter import ProviderOverloadedError
+from services.vision.services.synthetic import key_digest, synthetic_analysis, synthetic_results
+from services.vision.services.vision_engine import MockProviderError, MockVisionService
+
+REPO_ROOT = Path(__file__).resolve().parents[3]
+IMAGES = [["http://example.com/a.jpg"], ["http://example.com/a.jpg", "http://example.com/b.jpg"], [ImagePayload(b"raw")]]
+
+def analyze(service, images):
+    return asyncio.run(service.analyze_images(images))
+
+def test_answers_are_stable_across_processes():
+    mock = MockVisionService(latency_ms=0, latency_jitter_ms=0)
+    probe = (
+        "import asyncio\n"
+        "from services.vision.services.vision_engine import MockVisionService\n"
+        "print(asyncio.run(MockVisionService(latency_ms=0, latency_jitter_ms=0).analyze_images(['http://example.com/a.jpg'])).model_dump_json())"
+    )
+    # Each interpreter gets its own hash() randomization
+    outputs = {subprocess.check_output([sys.executable, "-c", probe], cwd=REPO_ROOT, text=True).strip() for _ in range(2)}
+    assert outputs == {analyze(mock, IMAGES[0]).model_dump_json()}
+
+def test_concurrent_calls_do_not_share_random_state():
+    mock = MockVisionService(latency_ms=5, latency_jitter_ms=5)
+
+    async def concurrently():
+        return await asyncio.gather(*(mock.analyze_images(images) for images in IMAGES * 5))
+
+    expected = [analyze(mock, images) for images in IMAGES] * 5
+    assert asyncio.run(concurrently()) == expected
+    assert analyze(mock, IMAGES[0]) != analyze(MockVisionService(latency_ms=0, seed=1), IMAGES[0])
+
+def test_bulk_generation_matches_single_answers():
+    product_ids = [f"sku-{i}" for i in range(500)]
+    for seed in (0, 7):
+        results = synthetic_results(product_ids, seed=seed)
+        for product_id, result in zip(product_ids, results):
+            single = synthetic_analysis(key_digest(product_id, seed))
+            single.product_id = product_id
+            assert result == single
+    assert 1 <= min(len(r.discrete_attributes.dominant_colors) for r in results)
+    assert max(len(r.discrete_attributes.dominant_colors) for r in results) == 3
+
+def test_errors_and_rate_limits_are_injected():
+    with pytest.raises(MockProviderError):
+        analyze(MockVisionService(latency_ms=0, error_rate=1.0), IMAGES[0])
+    with pytest.raises(ProviderOverloadedError) as excinfo:
+        analyze(MockVisionService(latency_ms=0, rate_limit_rate=1.0), IMAGES[0])
+    assert excinfo.value.retry_after is not None
+
+    mock = MockVisionService(latency_ms=0, error_rate=0.2, rate_limit_rate=0.1)
+
+    async def calls():
+        return await asyncio.gather(*(mock.analyze_images(IMAGES[0]) for _ in range(2000)), return_exceptions=True)
+
+    outcomes = asyncio.run(calls())
+    assert sum(isinstance(o, ProviderOverloadedError) for o in outcomes) == mock.stats["rate_limited"]
+    assert sum(isinstance(o, MockProviderError) for o in outcomes) == mock.stats["errors"]
+    assert 0.07 < mock.stats["rate_limited"] / 2000 < 0.13
+    assert 0.15 < mock.stats["errors"] / (2000 - mock.stats["rate_limited"]) < 0.25
+
+def test_latency_distributions():
+    uniform = MockVisionService(latency_ms=100, latency_jitter_ms=20)
+    assert all(0.08 <= uniform.latency() <= 0.12 for _ in range(100))
+
+    lognormal = MockVisionService(latency_ms=100, latency_distribution="lognormal", latency_sigma=0.5)
+    samples = [lognormal.latency() for _ in range(5000)]
+    assert statistics.median(samples) == pytest.approx(0.1, rel=0.1)
+    assert statistics.quantiles(samples, n=100)[98] > 0.25 # a long tail
+
+    exponential = MockVisionService(latency_ms=100, latency_distribution="exponential")
+    assert statistics.fmean(exponential.latency() for _ in range(5000)) == pytest.approx(0.1, rel=0.1)
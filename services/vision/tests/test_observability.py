@@ -0,0 +1,38 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from services.common.observability import TraceContext
+from services.vision.main import app
+from services.vision.services.vision_engine import GroqVisionService
+
+client = TestClient(app)
+
+PARENT = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+
+def test_trace_context_parsing():
+    parsed = TraceContext.from_header(PARENT)
+    assert parsed.trace_id == "4bf92f3577b34da6a3ce929d0e0e4736" and parsed.sampled
+    assert parsed.child().trace_id == parsed.trace_id
+    assert TraceContext.from_header("garbage") is None
+    assert TraceContext.from_header("00-" + "0" * 32 + "-00f067aa0ba902b7-01") is None
+
+def test_request_continues_caller_trace_and_reports_stages():
+    files = [("files", ("front.jpg", b"\xff\xd8fake-jpeg", "image/jpeg"))]
+    response = client.post("/process-upload", files=files, headers={"traceparent": PARENT})
+    assert response.status_code == 200
+
+    trace = TraceContext.from_header(response.headers["traceparent"])
+    assert trace.trace_id == "4bf92f3577b34da6a3ce929d0e0e4736"
+    assert trace.span_id != "00f067aa0ba902b7"
+    assert "upload_read;dur=" in response.headers["server-timing"]
+
+def test_metrics_expose_stage_histograms_and_fallbacks():
+    # Without an API key every call is a Groq -> mock fallback
+    asyncio.run(GroqVisionService(api_key="").analyze_images(["http://example.com/a.jpg"]))
+    client.post("/process", json={"image_urls": ["http://example.com/a.jpg"]})
+
+    body = client.get("/metrics").text
+    assert 'provider_fallbacks_total{provider="groq",reason="missing_key"}' in body
+    assert 'stage_duration_seconds_count{stage="fallback"}' in body
+    assert 'http_request_duration_seconds_count{method="POST",route="/process",status="200"}' in body
@@ -0,0 +1,76 @@
+import json
+
+from services.vision.models.image_payload import ImagePayload, image_url
+from services.vision.services.prompt_manager import BATCH_INSTRUCTIONS, SYSTEM_PROMPT, USER_PROMPT
+from services.vision.services.prompt_templates import (
+    PromptTemplate,
+    PromptUsage,
+    batch_request,
+    estimate_text_tokens,
+    get_template,
+)
+
+IMAGES = ["http://example.com/a.jpg?size=\"large\"", ImagePayload(b"\x89PNG\r\n\x1a\n\x00\xff", "image/png")]
+
+def expected_body(system_prompt, user_content, max_tokens, follow_up=()):
+    return {
+        "model": "test-model",
+        "temperature": 0.1,
+        "response_format": {"type": "json_object"},
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content},
+            *follow_up,
+        ],
+        "max_tokens": max_tokens,
+    }
+
+def image_content(images):
+    return [{"type": "image_url", "image_url": {"url": image_url(image)}} for image in images]
+
+def test_body_matches_the_equivalent_request():
+    request = get_template("single", "test-model").request(IMAGES)
+    content = [{"type": "text", "text": USER_PROMPT}] + image_content(IMAGES)
+    assert json.loads(request.body(1024)) == expected_body(SYSTEM_PROMPT, content, 1024)
+
+    retry = request.follow_up('{"a": 1}', "Fix `metadata.confidence_score`")
+    turns = [{"role": "assistant", "content": '{"a": 1}'}, {"role": "user", "content": "Fix `metadata.confidence_score`"}]
+    assert json.loads(retry.body(256)) == expected_body(SYSTEM_PROMPT, content, 256, turns)
+    # The original request is unchanged by its follow-up
+    assert json.loads(request.body(1024))["messages"][-1]["role"] == "user"
+
+def test_batch_body_introduces_each_product():
+    request = batch_request("test-model", {"p0": IMAGES[:1], "p1": IMAGES[1:]})
+    content = [
+        {"type": "text", "text": "Analyze each of these products (p0, p1) and extract the visual measurements."},
+        {"type": "text", "text": "Product p0:"},
+        *image_content(IMAGES[:1]),
+        {"type": "text", "text": "Product p1:"},
+        *image_content(IMAGES[1:]),
+    ]
+    assert json.loads(request.body(2048)) == expected_body(SYSTEM_PROMPT + BATCH_INSTRUCTIONS, content, 2048)
+
+def test_versions_follow_the_static_content():
+    template = PromptTemplate("single", "test-model", SYSTEM_PROMPT, USER_PROMPT)
+    assert template.version == PromptTemplate("single", "test-model", SYSTEM_PROMPT, USER_PROMPT).version
+    assert template.version != PromptTemplate("single", "test-model", SYSTEM_PROMPT + " ", USER_PROMPT).version
+    assert template.version != PromptTemplate("single", "other-model", SYSTEM_PROMPT, USER_PROMPT).version
+    assert template.version != PromptTemplate("single", "test-model", SYSTEM_PROMPT, "Describe.").version
+    assert get_template("single", "test-model") is get_template("single", "test-model")
+
+def test_token_estimates_and_usage():
+    template = PromptTemplate("single", "test-model", "x" * 400, "y" * 40, tokens_per_image=1000)
+    request = template.request(IMAGES)
+    assert template.static_tokens == 100 + 10 + 8
+    assert request.estimated_tokens == template.static_tokens + 2000
+    retry = request.follow_up("z" * 8, "w" * 4)
+    assert retry.estimated_tokens == request.estimated_tokens + 2 + 1 + 8
+    assert estimate_text_tokens("abcde") == 2
+
+    usage = PromptUsage()
+    usage.record(request, int(request.estimated_tokens * 1.5))
+    usage.record(request, None)
+    entry = usage.snapshot()[f"single:{template.version}"]
+    assert entry["requests"] == 2 and entry["reported_requests"] == 1
+    assert entry["estimated_tokens"] == 2 * request.estimated_tokens
+    assert entry["reported_to_estimated"] == 1.5
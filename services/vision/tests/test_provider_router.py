@@ -0,0 +1,123 @@
+import asyncio
+import random
+import time
+
+import pytest
+
+from services.vision.config import settings
+from services.vision.services.pipeline import build_provider
+from services.vision.services.provider_router import CircuitBreaker, ProviderRouter
+from services.vision.services.rate_limiter import ProviderOverloadedError
+from services.vision.services.vision_engine import IVisionService, MockVisionService
+
+class FakeProvider(IVisionService):
+    """
+    Local stand-in for a provider with configurable latency and failure rate.
+    """
+    def __init__(self, name: str, latency: float, failure_rate: float = 0.0, slow_every: int = 0, slow_latency: float = 0.0):
+        self.model = name
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.slow_every = slow_every # every n-th call takes slow_latency instead
+        self.slow_latency = slow_latency
+        self.rng = random.Random(name)
+        self.mock = MockVisionService(latency_ms=0, latency_jitter_ms=0)
+        self.calls = 0
+        self.cancelled = 0
+
+    async def analyze_images(self, image_urls):
+        self.calls += 1
+        slow = self.slow_every and self.calls % self.slow_every == 0
+        try:
+            await asyncio.sleep(self.slow_latency if slow else self.latency)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.rng.random() < self.failure_rate:
+            raise RuntimeError(f"{self.model} failed")
+        result = await self.mock.analyze_images(image_urls)
+        result.product_id = self.model # lets the tests see who answered
+        return result
+
+IMAGES = ["http://example.com/a.jpg"]
+
+def run_calls(router, count):
+    async def scenario():
+        return [await router.analyze_images(IMAGES) for _ in range(count)]
+    return asyncio.run(scenario())
+
+def test_routes_to_the_fastest_healthy_provider():
+    slow, fast = FakeProvider("slow", 0.03), FakeProvider("fast", 0.005)
+    router = ProviderRouter({"slow": slow, "fast": fast}, min_samples=2)
+
+    results = run_calls(router, 20)
+    # Both are measured first, then the fast one takes the traffic
+    assert slow.calls == 2
+    assert all(result.product_id == "fast" for result in results[4:])
+    assert router.snapshot()["providers"]["fast"]["p50_ms"] < router.snapshot()["providers"]["slow"]["p50_ms"]
+
+def test_failing_calls_fail_over_and_lower_the_provider_rank():
+    flaky, steady = FakeProvider("flaky", 0.001, failure_rate=1.0), FakeProvider("steady", 0.01)
+    router = ProviderRouter({"flaky": flaky, "steady": steady}, min_samples=1, failure_threshold=100)
+
+    results = run_calls(router, 6)
+    assert all(result.product_id == "steady" for result in results)
+    assert flaky.calls == 1 and router.counters["failovers"] == 1
+
+def test_hedged_request_wins_when_the_primary_is_slow():
+    primary = FakeProvider("primary", 0.005, slow_every=5, slow_latency=1.0)
+    backup = FakeProvider("backup", 0.02)
+    router = ProviderRouter({"primary": primary, "backup": backup}, min_samples=0, hedge=True, hedge_min_delay=0.01)
+    for _ in range(4): # prime the primary's latency window
+        router.providers[0].stats.record(0.005, True)
+
+    started = time.perf_counter()
+    results = run_calls(router, 5)
+    elapsed = time.perf_counter() - started
+
+    assert results[-1].product_id == "backup"
+    assert elapsed < 0.5 # the 1s straggler was not waited for
+    assert primary.cancelled == 1
+    assert router.counters == {"hedges": 1, "hedges_won": 1, "failovers": 0}
+
+def test_circuit_breaker_opens_and_recovers_through_a_trial():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.available()
+
+    time.sleep(0.06)
+    assert breaker.state == "half_open" and breaker.available()
+    breaker.on_call()
+    assert not breaker.available() # only one trial at a time
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    breaker.on_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+def test_open_circuits_are_skipped_and_all_open_means_overloaded():
+    down = FakeProvider("down", 0.001, failure_rate=1.0)
+    router = ProviderRouter({"down": down}, failure_threshold=2, reset_timeout=60)
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            run_calls(router, 1)
+    with pytest.raises(ProviderOverloadedError) as excinfo:
+        run_calls(router, 1)
+    assert down.calls == 2 and excinfo.value.retry_after > 0
+
+def test_provider_list_builds_a_router(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_PROVIDER", "groq, mock")
+    monkeypatch.setattr(settings, "GROQ_API_KEY", "")
+    router = build_provider()
+    assert isinstance(router, ProviderRouter)
+    assert [provider.name for provider in router.providers] == ["groq", "mock"]
+
+    # Groq without a key only produces mock fallbacks, which count as failures
+    results = run_calls(router, 3)
+    assert not any(result.is_fallback for result in results)
+    assert router.snapshot()["providers"]["groq"]["error_rate"] == 1.0
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from services.vision.services.rate_limiter import (
+    AdaptiveConcurrencyLimiter,
+    ProviderOverloadedError,
+    ProviderThrottle,
+    TokenBucket,
+    parse_duration,
+)
+from services.vision.services.vision_engine import GroqVisionService
+
+ANALYSIS = {
+    "continuous_dimensions": {
+        "gender_expression": 0.0, "visual_weight": 1.0, "embellishment": -2.0, "unconventionality": 0.5, "formality": 1.5
+    },
+    "discrete_attributes": {
+        "has_wirecore": False, "is_transparent": False, "dominant_colors": ["Black"],
+        "frame_shape": "Round", "texture_pattern": None, "looks_like_kids_product": False
+    },
+    "metadata": {"image_quality_notes": "Clear", "is_occluded_or_ambiguous": False, "confidence_score": 0.9},
+}
+
+class FakeGroq(BaseHTTPRequestHandler):
+    """
+    Local stand-in for the Groq chat completions API that answers 429 for the first
+    `rejections` calls (or forever when negative).
+    """
+    rejections = 0
+    calls = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        FakeGroq.calls += 1
+        if FakeGroq.rejections < 0 or FakeGroq.calls <= FakeGroq.rejections:
+            body = json.dumps({"error": {"message": "Rate limit reached", "type": "rate_limit"}}).encode()
+            self.send_response(429)
+            self.send_header("retry-after", "0.05")
+            self.send_header("x-ratelimit-remaining-requests", "0")
+            self.send_header("x-ratelimit-reset-requests", "50ms")
+        else:
+            body = json.dumps({
+                "id": "fake", "object": "chat.completion", "created": 0, "model": "fake",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": json.dumps(ANALYSIS)}}],
+                "usage": {"prompt_tokens": 1700, "completion_tokens": 120, "total_tokens": 1820},
+            }).encode()
+            self.send_response(200)
+            self.send_header("x-ratelimit-remaining-requests", "99")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def fake_groq():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGroq)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    FakeGroq.calls = 0
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+def make_service(base_url: str, queue_timeout: float) -> GroqVisionService:
+    throttle = ProviderThrottle(
+        TokenBucket(rate_per_second=100.0, burst=10),
+        AdaptiveConcurrencyLimiter(initial=4, min_limit=1, max_limit=8, latency_target=5.0),
+        queue_timeout=queue_timeout,
+    )
+    return GroqVisionService(api_key="test-key", base_url=base_url, throttle=throttle)
+
+def test_parse_duration():
+    assert parse_duration("2m59.56s") == pytest.approx(179.56)
+    assert parse_duration("120ms") == pytest.approx(0.12)
+    assert parse_duration("7") == 7.0
+
+def test_429s_are_retried_and_shrink_concurrency(fake_groq):
+    FakeGroq.rejections = 2
+    service = make_service(fake_groq, queue_timeout=5.0)
+
+    result = asyncio.run(service.analyze_images(["http://example.com/a.jpg"]))
+    assert not result.is_fallback
+    assert result.discrete_attributes.frame_shape == "Round"
+    assert FakeGroq.calls == 3
+    assert service.throttle.limiter.limit < 4
+    [usage] = service.prompt_usage.snapshot().values()
+    assert usage["requests"] == 1 and usage["reported_tokens"] == 1700
+
+def test_sustained_429s_raise_backpressure_not_mock_data(fake_groq):
+    FakeGroq.rejections = -1
+    service = make_service(fake_groq, queue_timeout=0.3)
+
+    with pytest.raises(ProviderOverloadedError):
+        asyncio.run(service.analyze_images(["http://example.com/a.jpg"]))
+    assert service.throttle.stats["rejected"] == 1
@@ -0,0 +1,119 @@
+import asyncio
+import json
+
+from prometheus_client import REGISTRY
+
+from services.vision.services.prompt_manager import PromptManager
+from services.vision.services.response_parser import ResponseParser, extract_json
+from services.vision.services.vision_engine import GroqVisionService
+
+VALID = {
+    "continuous_dimensions": {
+        "gender_expression": 1.5, "visual_weight": -2.0, "embellishment": 0.0,
+        "unconventionality": 3.0, "formality": -1.0,
+    },
+    "discrete_attributes": {
+        "has_wirecore": False, "is_transparent": True, "dominant_colors": ["Black"],
+        "frame_shape": "Round", "texture_pattern": None, "looks_like_kids_product": False,
+    },
+    "metadata": {"image_quality_notes": "Clear", "is_occluded_or_ambiguous": False, "confidence_score": 0.8},
+}
+
+def test_clean_json_takes_the_fast_path():
+    result = ResponseParser().parse(json.dumps(VALID))
+    assert result.ok and result.repairs == []
+
+def test_common_faults_are_repaired():
+    messy = (
+        "Here is the analysis:\n```json\n"
+        + json.dumps(VALID, indent=2)
+        .replace('"Black"', "'Black',")
+        .replace("false", "False")
+        .replace('"Clear"', '"Clear,\nsharp"')
+        + "\n```\nLet me know if you need more."
+    )
+    text, repairs = extract_json(messy)
+    assert json.loads(text)["discrete_attributes"]["dominant_colors"] == ["Black"]
+    assert {"leading_text", "trailing_text", "single_quotes", "trailing_comma", "python_literals", "newline_in_string"} <= set(repairs)
+    assert ResponseParser().parse(messy).ok
+
+def test_truncated_output_is_closed():
+    cut = json.dumps(VALID)[:-40]
+    text, repairs = extract_json(cut)
+    assert "truncated" in repairs
+    assert json.loads(text)["metadata"]["image_quality_notes"] == "Clear"
+
+def test_schema_guided_coercion_clamps_and_relocates():
+    data = json.loads(json.dumps(VALID))
+    data["continuous_dimensions"]["formality"] = 7.5
+    data["continuous_dimensions"]["gender_expression"] = "-6"
+    data["Discrete Attributes"] = data.pop("discrete_attributes")
+    data["Discrete Attributes"]["has_wirecore"] = "yes"
+    # Metadata fields flattened to the top level
+    data.update(data.pop("metadata"))
+    data["confidence_score"] = 1.3
+
+    result = ResponseParser().parse(json.dumps(data))
+    assert result.ok
+    assert result.response.continuous_dimensions.formality == 5.0
+    assert result.response.continuous_dimensions.gender_expression == -5.0
+    assert result.response.discrete_attributes.has_wirecore is True
+    assert result.response.metadata.confidence_score == 1.0
+    assert {"clamped", "flattened_sections", "boolean_strings", "numeric_strings"} <= set(result.repairs)
+
+def test_invalid_fields_are_reported_and_merged():
+    data = json.loads(json.dumps(VALID))
+    del data["discrete_attributes"]["frame_shape"]
+    data["metadata"]["is_occluded_or_ambiguous"] = "unclear"
+
+    parser = ResponseParser()
+    result = parser.parse(json.dumps(data))
+    assert not result.ok
+    assert result.invalid_fields == ["discrete_attributes.frame_shape", "metadata.is_occluded_or_ambiguous"]
+
+    patch = '{"discrete_attributes": {"frame_shape": "Square"}, "metadata": {"is_occluded_or_ambiguous": false}}'
+    merged = parser.merge(result, patch)
+    assert merged.ok and merged.response.discrete_attributes.frame_shape == "Square"
+    assert not parser.parse("Sorry, I cannot help with that.").ok
+
+def test_batch_answers_are_repaired():
+    entry = {**VALID, "key": "p0"}
+    content = "```json\n" + json.dumps({"results": [entry]}) + "\n```"
+    assert set(PromptManager.parse_batch_response(content, ["p0"])) == {"p0"}
+
+class ScriptedGroq(GroqVisionService):
+    def __init__(self, answers):
+        super().__init__(api_key="test-key")
+        self.answers = list(answers)
+        self.requests = []
+
+    async def _complete(self, request, body):
+        self.requests.append(json.loads(body)["messages"])
+        return self.answers.pop(0)
+
+def test_groq_retries_only_the_invalid_fields():
+    data = json.loads(json.dumps(VALID))
+    del data["discrete_attributes"]["frame_shape"]
+    service = ScriptedGroq([json.dumps(data), '{"discrete_attributes": {"frame_shape": "Aviator"}}'])
+
+    result = asyncio.run(service.analyze_images(["http://example.com/a.jpg"]))
+    assert not result.is_fallback and result.discrete_attributes.frame_shape == "Aviator"
+    assert "discrete_attributes.frame_shape" in service.requests[1][-1]["content"]
+    assert service.parser.stats["field_retry"] == 1
+
+def test_prompt_build_is_timed_once_per_provider_call():
+    def prompt_builds():
+        return REGISTRY.get_sample_value("stage_duration_seconds_count", {"stage": "prompt_build"}) or 0
+
+    data = json.loads(json.dumps(VALID))
+    del data["discrete_attributes"]["frame_shape"]
+    service = ScriptedGroq([json.dumps(data), '{"discrete_attributes": {"frame_shape": "Aviator"}}'])
+    before = prompt_builds()
+    asyncio.run(service.analyze_images(["http://example.com/a.jpg"]))
+    assert prompt_builds() - before == 2 # the request and its field retry
+
+def test_groq_falls_back_when_answer_is_unusable():
+    service = ScriptedGroq(["not json at all"])
+    result = asyncio.run(service.analyze_images(["http://example.com/a.jpg"]))
+    assert result.is_fallback and len(service.requests) == 1
+    assert service.parser.snapshot()["success_rate"] == 0.0
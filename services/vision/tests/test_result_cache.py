@@ -0,0 +1,108 @@
+import asyncio
+import threading
+
+from services.vision.services import prompt_templates
+from services.vision.services.micro_batcher import MicroBatchingVisionService
+from services.vision.services.result_cache import CachedVisionService, MemoryResultCache, SqliteResultCache, cache_key
+from services.vision.services.vision_engine import IVisionService, MockVisionService
+
+URLS = ["http://example.com/a.jpg", "http://example.com/b.jpg"]
+
+def test_cached_service_serves_repeats_from_cache():
+    backend = MemoryResultCache(max_entries=10, ttl_seconds=60)
+    service = CachedVisionService(MockVisionService(), backend)
+
+    first = asyncio.run(service.analyze_images(URLS))
+    first.product_id = "overwritten-by-handler"
+    second = asyncio.run(service.analyze_images(URLS))
+
+    assert backend.hits == 1 and backend.misses == 1
+    assert second.product_id is None
+    assert second.continuous_dimensions == first.continuous_dimensions
+
+def test_memory_cache_evicts_least_recently_used():
+    backend = MemoryResultCache(max_entries=2, ttl_seconds=60)
+    backend.set("a", "1")
+    backend.set("b", "2")
+    backend.get("a")
+    backend.set("c", "3")
+    assert backend.get("b") is None
+    assert backend.get("a") == "1"
+    assert backend.evictions == 1
+
+def test_sqlite_cache_persists_and_bounds_size(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    backend = SqliteResultCache(path, max_entries=2, ttl_seconds=60)
+    for key in ["a", "b", "c"]:
+        backend.set(key, key.upper())
+    assert len(backend) == 2
+
+    reopened = SqliteResultCache(path, max_entries=2, ttl_seconds=60)
+    assert reopened.get("c") == "C"
+
+def test_key_changes_with_model_and_prompt(monkeypatch):
+    key = cache_key(URLS, "model-a")
+    assert cache_key(URLS, "model-b") != key
+    # The user prompt is not part of the system prompt, but still shapes the answer
+    monkeypatch.setattr(prompt_templates, "USER_PROMPT", "Describe these product images.")
+    prompt_templates.get_template.cache_clear()
+    try:
+        assert cache_key(URLS, "model-a") != key
+    finally:
+        monkeypatch.undo()
+        prompt_templates.get_template.cache_clear()
+    assert cache_key(URLS, "model-a") == key
+
+class BatchingVisionService(IVisionService):
+    model = "batching"
+
+    def __init__(self):
+        self.mock = MockVisionService(latency_ms=0, latency_jitter_ms=0)
+        self.calls = 0
+
+    async def analyze_images(self, image_urls):
+        self.calls += 1
+        return await self.mock.analyze_images(image_urls)
+
+    async def analyze_batch(self, image_sets):
+        self.calls += 1
+        return [await self.mock.analyze_images(images) for images in image_sets]
+
+def test_batched_results_are_keyed_on_the_batch_prompt(monkeypatch):
+    inner = BatchingVisionService()
+    backend = MemoryResultCache(max_entries=10, ttl_seconds=60)
+    service = CachedVisionService(MicroBatchingVisionService(inner, max_batch_size=2, max_wait=0.05, max_images=10), backend)
+    products = [[URLS[0]], [URLS[1]]]
+
+    async def analyze_together():
+        return await asyncio.gather(*(service.analyze_images(images) for images in products))
+
+    asyncio.run(analyze_together())
+    assert inner.calls == 1 and backend.get(cache_key(products[0], "batching", "batch")) is not None
+    asyncio.run(service.analyze_images(products[0]))
+    assert inner.calls == 1
+
+    # Editing the batch prompt retires what it produced
+    monkeypatch.setattr(prompt_templates.PromptManager, "construct_batch_system_prompt", staticmethod(lambda: "Rate each product."))
+    prompt_templates.get_template.cache_clear()
+    try:
+        asyncio.run(service.analyze_images(products[0]))
+    finally:
+        monkeypatch.undo()
+        prompt_templates.get_template.cache_clear()
+    assert inner.calls == 2
+
+def test_sqlite_backend_is_called_off_the_event_loop(tmp_path):
+    threads = []
+
+    class RecordingSqliteCache(SqliteResultCache):
+        def _get(self, key):
+            threads.append(threading.get_ident())
+            return super()._get(key)
+
+    backend = RecordingSqliteCache(str(tmp_path / "cache.sqlite3"), max_entries=10, ttl_seconds=60)
+    service = CachedVisionService(MockVisionService(latency_ms=0, latency_jitter_ms=0), backend)
+    asyncio.run(service.analyze_images(URLS))
+    asyncio.run(service.analyze_images(URLS))
+    assert backend.hits == 1 and backend.misses == 1
+    assert threads and threading.get_ident() not in threads
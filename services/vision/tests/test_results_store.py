@@ -0,0 +1,176 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from services.vision.main import app, get_pipeline
+from services.common.schemas import ResultQuery
+from services.vision.services.pipeline import build_pipeline
+from services.vision.services.results_store import ResultsStore
+from services.vision.services.vision_engine import MockVisionService
+
+def make_results(count: int, prefix: str = "p"):
+    mock = MockVisionService(latency_ms=0, latency_jitter_ms=0)
+    results = []
+    for i in range(count):
+        result = asyncio.run(mock.analyze_images([f"http://example.com/{prefix}{i}.jpg"]))
+        result.product_id = f"{prefix}{i}"
+        results.append(result)
+    return results
+
+def expected(results, predicate):
+    return [r.product_id for r in results if predicate(r)]
+
+def test_filters_match_a_plain_python_scan():
+    results = make_results(300)
+    store = ResultsStore(initial_capacity=16) # forces the columns to grow
+    store.append(results[:100])
+    store.append(results[100:])
+
+    total, page = store.query(ResultQuery(formality_min=3, is_transparent=True, limit=10000))
+    assert total == len(page)
+    assert [r.product_id for r in page] == expected(
+        results, lambda r: r.continuous_dimensions.formality >= 3 and r.discrete_attributes.is_transparent
+    )
+
+    query = ResultQuery(frame_shape=["Round", "Oval"], color=["Black", "Gold"], visual_weight_max=0, limit=10000)
+    assert [r.product_id for r in store.query(query)[1]] == expected(
+        results,
+        lambda r: r.discrete_attributes.frame_shape in ("Round", "Oval")
+        and {"Black", "Gold"} <= set(r.discrete_attributes.dominant_colors)
+        and r.continuous_dimensions.visual_weight <= 0,
+    )
+    assert store.query(ResultQuery(color=["Chartreuse"]))[0] == 0
+
+def test_round_trip_and_superseded_rows():
+    first, second = make_results(1), make_results(1, prefix="q")
+    store = ResultsStore()
+    store.append(first)
+    assert store.get("p0") == first[0]
+
+    second[0].product_id = "p0" # re-analyzed
+    store.append(second)
+    assert len(store) == 1
+    assert store.get("p0") == second[0]
+    assert store.query(ResultQuery())[0] == 1
+
+def test_segments_persist_and_reload(tmp_path):
+    results = make_results(50)
+    store = ResultsStore(str(tmp_path))
+    store.append(results[:30])
+    assert store.flush() == 30
+    store.append(results[30:])
+    store.append(make_results(1, prefix="x"))
+    assert store.flush() == 21
+    assert store.flush() == 0
+
+    reopened = ResultsStore(str(tmp_path))
+    assert len(reopened) == 51 and reopened.pending_rows == 0
+    assert reopened.get("p42") == results[42]
+    query = ResultQuery(embellishment_min=-1, embellishment_max=1, limit=10000)
+    assert reopened.query(query)[0] == store.query(query)[0]
+
+    # Codes keep matching after the dictionaries were rebuilt from the segments
+    reopened.append(make_results(1, prefix="y"))
+    reopened.flush()
+    assert ResultsStore(str(tmp_path)).get("y0") == reopened.get("y0")
+
+def test_results_api_serves_recorded_analyses():
+    pipeline = build_pipeline()
+    pipeline.results_store = ResultsStore()
+    app.dependency_overrides[get_pipeline] = lambda: pipeline
+    try:
+        client = TestClient(app)
+        client.post("/process", json={"image_urls": ["http://example.com/a.jpg"], "product_id": "frame/1"})
+        client.post("/process", json={"image_urls": ["http://example.com/b.jpg"]}) # no id, not stored
+        # Neither are batch items without one, whatever their position
+        items = [{"image_urls": ["http://example.com/c.jpg"]}, {"image_urls": ["http://example.com/d.jpg"]}]
+        assert client.post("/process-batch", json={"items": items}).status_code == 200
+        with client.stream("POST", "/process-stream", json={"items": items}) as response:
+            response.read()
+
+        page = client.get("/results", params={"limit": 5}).json()
+        assert page["total"] == 1 and page["results"][0]["product_id"] == "frame/1"
+        assert client.get("/results/frame/1").status_code == 200
+        assert client.get("/results/missing").status_code == 404
+        assert client.get("/results/0").status_code == 404
+        assert client.get("/results", params={"limit": 0}).status_code == 422
+    finally:
+        app.dependency_overrides.clear()
+
+def test_writers_sharing_a_directory(tmp_path):
+    results = make_results(40)
+    first = ResultsStore(str(tmp_path), writer="worker-0")
+    second = ResultsStore(str(tmp_path), writer="worker-1")
+    first.append(results[:20], recorded_at=1.0)
+    others = make_results(3, prefix="x")
+    second.append(others, recorded_at=1.0) # so its dictionary codes differ from first's
+    second.append(results[20:], recorded_at=1.0)
+    first.flush(), second.flush()
+
+    assert first.refresh(min_interval=0) == 1 and second.refresh(min_interval=0) == 1
+    assert len(first) == len(second) == 43
+    assert first.get("p30") == second.get("p30") == results[30]
+    query = ResultQuery(frame_shape=["Oval", "Round"], color=["Clear"], limit=10000)
+    assert [r.product_id for r in first.query(query)[1]] == expected(
+        results[:20] + others + results[20:], lambda r: r.discrete_attributes.frame_shape in ("Oval", "Round") and "Clear" in r.discrete_attributes.dominant_colors
+    )
+
+    # The newest analysis of a product wins, whichever writer recorded it
+    reanalyzed = make_results(1, prefix="z")
+    reanalyzed[0].product_id = "p3"
+    second.append(reanalyzed, recorded_at=2.0)
+    assert second.flush() == 1 # only its own row, not the ones loaded from first
+    first.refresh(min_interval=0)
+    assert first.get("p3") == reanalyzed[0]
+
+    reopened = ResultsStore(str(tmp_path), writer="worker-0")
+    assert len(reopened) == 43 and reopened.pending_rows == 0
+    assert reopened.get("p3") == reanalyzed[0] and reopened.get("x1") == others[1]
+    assert reopened.snapshot()["writers"] == 3 # worker-0, worker-1 and the (empty) top level
+
+def reanalyzed(product_ids, prefix):
+    results = make_results(len(product_ids), prefix=prefix)
+    for result, product_id in zip(results, product_ids):
+        result.product_id = product_id
+    return results
+
+def test_compaction_drops_superseded_rows_in_memory_and_on_disk(tmp_path):
+    store = ResultsStore(str(tmp_path))
+    store.append(make_results(30))
+    store.flush()
+    newer = reanalyzed([f"p{i}" for i in range(20)], prefix="q")
+    store.append(newer)
+    store.flush()
+    query = ResultQuery(formality_min=-2, limit=10000)
+    before = store.query(query)
+    assert store.superseded == 20 and store.n == 50
+
+    assert store.compact() == 20
+    assert store.n == len(store) == 30 and store.superseded == 0 and store.generation == 1
+    assert store.query(query) == before
+    assert store.get("p3") == newer[3]
+    assert [path.name for path in tmp_path.iterdir()] == ["segment-00000003-base.npz"]
+
+    store.append(make_results(1, prefix="y"))
+    store.flush()
+    reopened = ResultsStore(str(tmp_path))
+    assert reopened.n == 31 and reopened.query(query)[0] == store.query(query)[0]
+    assert reopened.get("p3") == newer[3] and reopened.get("y0") == store.get("y0")
+
+def test_readers_follow_a_compacted_writer(tmp_path):
+    first = ResultsStore(str(tmp_path), writer="worker-0")
+    second = ResultsStore(str(tmp_path), writer="worker-1")
+    first.append(make_results(10), recorded_at=1.0)
+    first.flush()
+    second.refresh(min_interval=0)
+
+    newer = reanalyzed(["p1", "p2"], prefix="q")
+    first.append(newer, recorded_at=2.0)
+    first.compact()
+    first.append(make_results(1, prefix="x"), recorded_at=3.0)
+    first.flush()
+
+    assert second.refresh(min_interval=0) == 2 # the base and the segment after it
+    assert len(second) == 11 and second.get("p1") == newer[0] and second.get("x0") == first.get("x0")
+    assert second.compact() == 10 # the rows of first's old segment
+    assert second.query(ResultQuery(limit=10000)) == first.query(ResultQuery(limit=10000))
@@ -0,0 +1,115 @@
+import numpy as np
+from fastapi.testclient import TestClient
+
+from services.vision.main import app, get_pipeline
+from services.common.schemas import ResultQuery
+from services.vision.services.pipeline import build_pipeline
+from services.vision.services.results_store import DIMENSIONS, ResultsStore
+from services.vision.services.similarity import GridIndex, SimilarityIndex
+from services.vision.tests.test_results_store import make_results
+
+def brute_force(store, target, k, query=ResultQuery(), exclude=None):
+    mask = store.filter_mask(query)
+    if exclude is not None:
+        mask[store.rows[exclude]] = False
+    rows = np.flatnonzero(mask)
+    distances = np.sqrt(((store.dims[rows] - np.asarray(target, dtype=np.float32)) ** 2).sum(axis=1))
+    order = np.argsort(distances, kind="stable")[:k]
+    return [(int(rows[i]), float(distances[i])) for i in order]
+
+def assert_same_matches(found, expected, rtol=1e-6):
+    # float32 sums in a different order can differ in the last bit, so equal distances
+    # may come back in either order, and a tie at the k-th place may keep either row.
+    # Rows are compared as a set, leaving out those tied with the last match.
+    np.testing.assert_allclose([d for _, d in found], [d for _, d in expected], rtol=rtol)
+    if expected:
+        cutoff = expected[-1][1] * (1 - 2 * rtol)
+        assert {row for row, d in found if d < cutoff} == {row for row, d in expected if d < cutoff}
+
+def test_grid_search_matches_exact_scan():
+    rng = np.random.default_rng(7)
+    dims = rng.uniform(-5, 5, size=(5000, len(DIMENSIONS))).astype(np.float32)
+    dims[:1000] = np.clip(rng.normal(2, 0.3, size=(1000, len(DIMENSIONS))), -5, 5) # a dense cluster
+    grid = GridIndex(dims, cell_width=1.0)
+    mask = rng.random(len(dims)) < 0.5
+
+    for target in (dims[3], np.full(len(DIMENSIONS), -4.9, dtype=np.float32), np.zeros(len(DIMENSIONS), dtype=np.float32)):
+        rows, distances = grid.search(dims, target, 15, mask)
+        candidates = np.flatnonzero(mask)
+        exact = np.sort(np.sqrt(((dims[candidates] - target) ** 2).sum(axis=1)))[:15]
+        np.testing.assert_allclose(distances, exact, rtol=1e-6)
+        assert mask[rows].all()
+
+def test_index_uses_the_grid_past_the_threshold_and_stays_exact():
+    results = make_results(400)
+    store = ResultsStore()
+    store.append(results[:300])
+    index = SimilarityIndex(store, cell_width=2.5, exact_threshold=50)
+
+    query = ResultQuery(is_transparent=False)
+    target = index.target_of("p7")
+    found = index.search(target, 10, query, exclude_product_id="p7")
+    assert index.stats["grid"] == 1 and index.stats["builds"] == 1
+    assert 7 not in [row for row, _ in found]
+    assert_same_matches(found, brute_force(store, target, 10, query, "p7"))
+
+    # New rows are found before the grid is rebuilt
+    store.append(results[300:320])
+    index.rebuild_fraction = 1.0
+    found = index.search(index.target_of("p305"), 1, ResultQuery())
+    assert found == [(305, 0.0)] and index.stats["builds"] == 1
+
+def test_grid_is_rebuilt_after_compaction():
+    results = make_results(300)
+    store = ResultsStore()
+    store.append(results)
+    index = SimilarityIndex(store, cell_width=2.5, exact_threshold=50)
+    target = index.target_of("p7")
+    index.search(target, 10, ResultQuery())
+
+    newer = make_results(100, prefix="q")
+    for result, original in zip(newer, results):
+        result.product_id = original.product_id
+    store.append(newer)
+    store.compact()
+    found = index.search(target, 10, ResultQuery())
+    assert index.stats["builds"] == 2
+    assert_same_matches(found, brute_force(store, target, 10))
+    similar = index.similar(target, 3, ResultQuery())
+    np.testing.assert_allclose([distance for _, distance in similar], [distance for _, distance in found[:3]], rtol=1e-6)
+
+def test_selective_filters_scan_exactly():
+    store = ResultsStore()
+    store.append(make_results(200))
+    index = SimilarityIndex(store, exact_threshold=50)
+    query = ResultQuery(frame_shape=["Round"], color=["Black"])
+    target = [0.0] * len(DIMENSIONS)
+
+    found = index.search(target, 5, query)
+    assert index.stats == {"exact": 1, "grid": 0, "builds": 0}
+    assert_same_matches(found, brute_force(store, target, 5, query))
+    for result in store.materialize([row for row, _ in found]):
+        assert result.discrete_attributes.frame_shape == "Round"
+        assert "Black" in result.discrete_attributes.dominant_colors
+
+def test_similar_api():
+    pipeline = build_pipeline()
+    pipeline.results_store = ResultsStore()
+    pipeline.results_store.append(make_results(50))
+    app.dependency_overrides[get_pipeline] = lambda: pipeline
+    try:
+        client = TestClient(app)
+        body = client.get("/results/similar", params={"product_id": "p3", "limit": 5}).json()
+        assert len(body["results"]) == 5
+        assert "p3" not in [item["product_id"] for item in body["results"]]
+        distances = [item["distance"] for item in body["results"]]
+        assert distances == sorted(distances)
+
+        target = {name: 0 for name in DIMENSIONS}
+        assert client.get("/results/similar", params={**target, "limit": 1}).status_code == 200
+        assert client.get("/results/similar", params={"formality": 1}).status_code == 400
+        assert client.get("/results/similar", params={"product_id": "missing"}).status_code == 404
+        assert client.get("/results/similar", params={**target, "formality": 9}).status_code == 422
+        assert pipeline.stats()["similarity"]["exact"] == 2
+    finally:
+        app.dependency_overrides.clear()
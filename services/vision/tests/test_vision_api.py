@@ -0,0 +1,68 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import uvicorn
+from fastapi.testclient import TestClient
+from services.vision.main import app
+from services.vision.config import settings
+from services.vision.run_workers import DrainingServer
+
+client = TestClient(app)
+
+def test_process_upload_accepts_binary_images():
+    files = [("files", ("front.jpg", b"\xff\xd8fake-jpeg", "image/jpeg"))]
+    response = client.post("/process-upload", files=files, data={"product_id": "upload-1"})
+    assert response.status_code == 200
+    assert response.json()["product_id"] == "upload-1"
+
+def test_process_upload_rejects_oversized_file(monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_MAX_FILE_BYTES", 1024)
+    files = [("files", ("big.jpg", b"x" * 2048, "image/jpeg"))]
+    response = client.post("/process-upload", files=files)
+    assert response.status_code == 413
+
+def test_process_stream_ndjson_yields_one_line_per_item():
+    items = [{"image_urls": [f"http://example.com/{i}.jpg"], "product_id": f"p{i}"} for i in range(3)]
+    with client.stream("POST", "/process-stream", json={"items": items}) as response:
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = [json.loads(line) for line in response.iter_lines() if line]
+    assert sorted(line["product_id"] for line in lines) == ["p0", "p1", "p2"]
+    assert all(line["error"] is None for line in lines)
+
+def test_process_stream_sse_ends_with_done_event():
+    items = [{"image_urls": ["http://example.com/a.jpg"]}]
+    response = client.post("/process-stream", json={"items": items}, headers={"Accept": "text/event-stream"})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block for block in response.text.split("\n\n") if block]
+    assert events[0].startswith("event: result\ndata: ")
+    assert events[-1] == 'event: done\ndata: {"succeeded": 1, "failed": 0}'
+
+def test_draining_worker_fails_health_checks_but_keeps_serving():
+    server = DrainingServer(uvicorn.Config(app), drain_seconds=0.1)
+    try:
+        server.handle_exit(signal.SIGTERM, None)
+        assert client.get("/health").status_code == 503
+        assert client.post("/process", json={"image_urls": ["http://example.com/a.jpg"]}).status_code == 200
+        assert not server.should_exit
+
+        deadline = time.monotonic() + 2
+        while not server.should_exit:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        assert not server.force_exit
+        server.handle_exit(signal.SIGTERM, None) # a second signal stops at once
+        assert server.force_exit
+    finally:
+        app.state.draining = False
+    assert client.get("/health").status_code == 200
+
+def test_mock_provider_does_not_import_provider_sdks():
+    # A fresh interpreter: this one may have loaded the SDK for other tests
+    code = "import sys, services.vision.main; print('groq' in sys.modules)"
+    env = {**os.environ, "LLM_PROVIDER": "mock"}
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    assert subprocess.check_output([sys.executable, "-c", code], cwd=root, env=env, text=True).strip() == "False"